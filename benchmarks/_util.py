@@ -0,0 +1,23 @@
+"""
+Helpers shared by the benchmark scripts
+"""
+
+import timeit
+from typing import Callable, Dict
+
+
+def bench(func: Callable[[], object], *, number: int, repeat: int = 5) -> float:
+    """Returns the best per-call time of `func`, in microseconds"""
+    timer = timeit.Timer(func)
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number * 1e6
+
+
+def report(title: str, results: Dict[str, float], unit: str = "us") -> None:
+    """Prints a before/after style table of benchmark results"""
+    print(title)
+    width = max(len(name) for name in results)
+    baseline = next(iter(results.values()))
+    for name, value in results.items():
+        speedup = baseline / value if value else float("inf")
+        print(f"  {name:<{width}}  {value:12.3f} {unit}  ({speedup:.2f}x)")
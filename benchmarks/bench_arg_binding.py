@@ -0,0 +1,39 @@
+"""
+Compares calling a hook function with call_with_args(), which inspects the
+signature on every call, against a precomputed ArgBinder
+
+Run with `python -m benchmarks.bench_arg_binding`
+"""
+
+from benchmarks._util import bench, report
+from cloudbot.event import Event
+from cloudbot.util.func_utils import ArgBinder, call_with_args
+
+
+def _hook(conn, nick, chan, content, irc_paramlist):
+    return nick
+
+
+def main():
+    event = Event(
+        conn=object(),
+        nick="nick",
+        channel="#chan",
+        content="hello",
+        irc_paramlist=["#chan", "hello"],
+    )
+    binder = ArgBinder(_hook)
+    assert binder(event) == call_with_args(_hook, event)
+    report(
+        "Calling a 5 argument hook",
+        {
+            "call_with_args": bench(
+                lambda: call_with_args(_hook, event), number=100000
+            ),
+            "ArgBinder": bench(lambda: binder(event), number=100000),
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
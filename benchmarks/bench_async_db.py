@@ -0,0 +1,113 @@
+"""
+Compares statement latency for coroutine hooks under concurrent load, using
+the thread-bound `db` session through Event.async_call against the asyncio
+`adb` session
+
+Needs aiosqlite installed. Run with `python -m benchmarks.bench_async_db`
+"""
+
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from sqlalchemy import Column, Integer, String, Table, create_engine, select
+
+from benchmarks._util import report
+from cloudbot.util import database
+from cloudbot.util.session_pool import SessionPool
+
+_CONCURRENCY = (1, 10, 50)
+_STATEMENTS = 20
+_ROWS = 100
+
+table = Table(
+    "bench_adb",
+    database.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String),
+)
+
+
+def _query(i):
+    return select(table.c.name).where(table.c.id == i % _ROWS)
+
+
+async def _sync_hook(pool):
+    # What Event.prepare(), the hook's async_call()s and Event.close() do
+    loop = asyncio.get_running_loop()
+    executor = pool.acquire()
+    try:
+        db = await loop.run_in_executor(
+            executor, database.Session.session_factory
+        )
+        for i in range(_STATEMENTS):
+            await loop.run_in_executor(executor, db.execute, _query(i))
+
+        await loop.run_in_executor(executor, db.close)
+    finally:
+        pool.release(executor)
+
+
+async def _async_hook(_pool):
+    async with database.AsyncSession() as adb:
+        for i in range(_STATEMENTS):
+            await adb.execute(_query(i))
+
+
+async def _timed(hook, pool, latencies):
+    start = time.perf_counter()
+    await hook(pool)
+    latencies.append((time.perf_counter() - start) / _STATEMENTS * 1e6)
+
+
+async def _run(hook, pool, tasks):
+    """Returns the mean and worst per-statement latency seen by each hook"""
+    latencies: List[float] = []
+    await asyncio.gather(*(_timed(hook, pool, latencies) for _ in range(tasks)))
+    return statistics.mean(latencies), max(latencies)
+
+
+async def _main(url):
+    engine = create_engine(url)
+    table.create(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            table.insert(), [{"id": i, "name": str(i)} for i in range(_ROWS)]
+        )
+
+    database.configure(engine)
+    async_engine = database.create_async_db_engine(url)
+    database.configure_async(async_engine)
+    pool = SessionPool()
+    try:
+        for tasks in _CONCURRENCY:
+            sync_mean, sync_max = await _run(_sync_hook, pool, tasks)
+            adb_mean, adb_max = await _run(_async_hook, pool, tasks)
+            report(
+                f"{tasks} concurrent hooks running {_STATEMENTS} statements "
+                "each, latency per statement",
+                {
+                    "db (async_call) mean": sync_mean,
+                    "adb mean": adb_mean,
+                    "db (async_call) worst": sync_max,
+                    "adb worst": adb_max,
+                },
+            )
+    finally:
+        pool.shutdown()
+        await async_engine.dispose()
+        database.configure()
+        database.configure_async()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        url = "sqlite:///" + str(Path(tmp) / "bench.db")
+        asyncio.run(_main(url))
+
+
+if __name__ == "__main__":
+    main()
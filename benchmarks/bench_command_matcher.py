@@ -0,0 +1,50 @@
+"""
+Compares the per-message cost of command matching with a regex rebuilt for
+every message against the cached per-connection CommandMatcher
+
+Run with `python -m benchmarks.bench_command_matcher`
+"""
+
+from functools import partial
+
+from benchmarks._util import bench, report
+from cloudbot.bot import _compile_cmd_regex, get_cmd_matcher
+
+
+class _Conn:
+    def __init__(self):
+        self.nick = "CloudBot"
+        self.config = {"command_prefix": "."}
+
+
+def _rebuild_per_message(conn, line):
+    prefix = conn.config.get("command_prefix", ".")
+    return _compile_cmd_regex(prefix, conn.nick, False).match(line)
+
+
+def _cached_matcher(conn, line):
+    return get_cmd_matcher(conn).get_regex(False).match(line)
+
+
+def main():
+    conn = _Conn()
+    lines = {
+        "command": ".weather some place",
+        "chatter": "just some ordinary chatter in a channel",
+    }
+    for kind, line in lines.items():
+        report(
+            f"Command matching ({kind} line)",
+            {
+                "rebuild per message": bench(
+                    partial(_rebuild_per_message, conn, line), number=20000
+                ),
+                "cached matcher": bench(
+                    partial(_cached_matcher, conn, line), number=20000
+                ),
+            },
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compares decoding a mix of ASCII, UTF-8 and legacy encoded lines with the
+old try-each-codec loop against LineDecoder
+
+Run with `python -m benchmarks.bench_decode`
+"""
+
+from benchmarks._util import bench, report
+from cloudbot.util.lines import LineDecoder
+
+_PREFIX = ":nick{}!user@host.example PRIVMSG #channel :"
+
+
+def _old_decode(bytestring, fallback=("shift_jis", "cp1252")):
+    for codec in ("utf-8",) + fallback:
+        try:
+            return bytestring.decode(codec)
+        except UnicodeDecodeError:
+            continue
+
+    return bytestring.decode("utf-8", errors="ignore")
+
+
+def _make_lines():
+    lines = []
+    for i in range(1000):
+        prefix = _PREFIX.format(i % 50)
+        if i % 20 == 0:
+            # A few senders with legacy clients
+            lines.append((prefix + "café naïve").encode("cp1252"))
+        elif i % 20 == 1:
+            lines.append((prefix + "café あ").encode())
+        else:
+            lines.append((prefix + "just some plain text here").encode())
+
+    return lines
+
+
+def main():
+    lines = _make_lines()
+    plain = LineDecoder()
+    remember = LineDecoder(remember_senders=True)
+    assert [_old_decode(line) for line in lines] == [
+        plain.decode(line) for line in lines
+    ]
+
+    results = {
+        "try each codec": bench(
+            lambda: [_old_decode(line) for line in lines], number=100
+        ),
+        "LineDecoder": bench(
+            lambda: [plain.decode(line) for line in lines], number=100
+        ),
+        "LineDecoder (remember)": bench(
+            lambda: [remember.decode(line) for line in lines], number=100
+        ),
+    }
+    report(f"Decoding {len(lines)} lines", results)
+
+    # With a longer fallback list, remembering each sender's codec skips
+    # the codecs which fail before it
+    fallback = ("shift_jis", "euc_jp", "koi8_u", "cp1252")
+    legacy = [line for line in lines if not line.isascii()][::2]
+    many = LineDecoder(fallback)
+    many_remember = LineDecoder(fallback, remember_senders=True)
+    assert [many.decode(line) for line in legacy] == [
+        many_remember.decode(line) for line in legacy
+    ]
+    report(
+        f"Decoding {len(legacy)} cp1252 lines with {len(fallback)} "
+        "fallback codecs",
+        {
+            "try each codec": bench(
+                lambda: [_old_decode(line, fallback) for line in legacy],
+                number=1000,
+            ),
+            "LineDecoder": bench(
+                lambda: [many.decode(line) for line in legacy], number=1000
+            ),
+            "LineDecoder (remember)": bench(
+                lambda: [many_remember.decode(line) for line in legacy],
+                number=1000,
+            ),
+        },
+    )
+    print(f"  codec counts: {dict(remember.counts)}")
+
+
+if __name__ == "__main__":
+    main()
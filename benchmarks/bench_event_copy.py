@@ -0,0 +1,125 @@
+"""
+Compares the memory and time taken to make per-hook copies of an event with
+the old dict based copy against Event's shared EventData
+
+Run with `python -m benchmarks.bench_event_copy`
+"""
+
+import tracemalloc
+from operator import attrgetter
+
+from benchmarks._util import bench, report
+from cloudbot.event import Event, EventType
+
+_HOOKS = 10
+_LINES = 1000
+
+_FIELDS = (
+    "type",
+    "content",
+    "content_raw",
+    "target",
+    "chan",
+    "nick",
+    "user",
+    "host",
+    "mask",
+    "irc_raw",
+    "irc_tags",
+    "irc_prefix",
+    "irc_command",
+    "irc_paramlist",
+    "irc_ctcp_text",
+)
+
+
+class _DictEvent:
+    """Copies every field into the instance dict, like Event used to"""
+
+    def __init__(self, *, hook=None, base_event=None, **kwargs):
+        self.db = None
+        self.db_executor = None
+        self.bot = None
+        self.conn = None
+        self.hook = hook
+        if base_event is not None:
+            self.bot = base_event.bot
+            self.conn = base_event.conn
+            for name in _FIELDS:
+                setattr(self, name, getattr(base_event, name))
+        else:
+            for name in _FIELDS:
+                setattr(self, name, kwargs.get(name))
+
+
+def _dispatch(cls, line_kwargs):
+    base = cls(**line_kwargs)
+    return base, [cls(hook=i, base_event=base) for i in range(_HOOKS)]
+
+
+def _memory(cls, line_kwargs):
+    tracemalloc.start()
+    events = [_dispatch(cls, line_kwargs) for _ in range(_LINES)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del events
+    return size / _LINES
+
+
+def main():
+    old_kwargs = {
+        "type": EventType.message,
+        "content": "hello",
+        "chan": "#chan",
+        "nick": "nick",
+        "user": "user",
+        "host": "host",
+        "irc_command": "PRIVMSG",
+    }
+    new_kwargs = {
+        "event_type": EventType.message,
+        "content": "hello",
+        "channel": "#chan",
+        "nick": "nick",
+        "user": "user",
+        "host": "host",
+        "irc_command": "PRIVMSG",
+    }
+    title = f"one line dispatched to {_HOOKS} hooks"
+    report(
+        f"Memory for {title}",
+        {
+            "dict copies": _memory(_DictEvent, old_kwargs),
+            "shared EventData": _memory(Event, new_kwargs),
+        },
+        unit="B",
+    )
+    report(
+        f"Time for {title}",
+        {
+            "dict copies": bench(
+                lambda: _dispatch(_DictEvent, old_kwargs), number=10000
+            ),
+            "shared EventData": bench(
+                lambda: _dispatch(Event, new_kwargs), number=10000
+            ),
+        },
+    )
+
+    old_event = _DictEvent(**old_kwargs)
+    new_event = Event(**new_kwargs)
+    # _DictEvent sets its fields dynamically, read them the same way on both
+    get_nick = attrgetter("nick")
+    report(
+        "Reading event.nick",
+        {
+            "dict copies": bench(lambda: get_nick(old_event), number=1000000),
+            "shared EventData": bench(
+                lambda: get_nick(new_event), number=1000000
+            ),
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compares dispatching a burst of events with one task per event against
+EventDispatcher's bounded worker pool
+
+Run with `python -m benchmarks.bench_event_dispatch`
+"""
+
+import asyncio
+import time
+
+from benchmarks._util import report
+from cloudbot.event import Event
+from cloudbot.util.dispatch import EventDispatcher
+
+_BURST = 50000
+
+
+class _Process:
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, event):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0)
+        self.running -= 1
+
+
+async def _wait_idle():
+    current = asyncio.current_task()
+    while True:
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        if not tasks:
+            return
+
+        await asyncio.gather(*tasks)
+
+
+async def _task_per_event(events):
+    process = _Process()
+    start = time.perf_counter()
+    for event in events:
+        asyncio.ensure_future(process(event))
+
+    await _wait_idle()
+    return (time.perf_counter() - start) * 1000, process.peak
+
+
+async def _dispatcher(events, ordered):
+    process = _Process()
+    dispatcher = EventDispatcher(
+        process, ordered_commands=["352"] if ordered else ()
+    )
+    start = time.perf_counter()
+    for event in events:
+        dispatcher.put(event)
+
+    await _wait_idle()
+    return (time.perf_counter() - start) * 1000, process.peak
+
+
+async def _main():
+    events = [Event(irc_command="352", content=str(i)) for i in range(_BURST)]
+    results = {}
+    peaks = {}
+    for name, coro in (
+        ("task per event", _task_per_event(events)),
+        ("EventDispatcher", _dispatcher(events, False)),
+        ("EventDispatcher (ordered)", _dispatcher(events, True)),
+    ):
+        results[name], peaks[name] = await coro
+
+    report(f"Dispatching {_BURST} events", results, unit="ms")
+    for name, peak in peaks.items():
+        print(f"  {name}: {peak} events in progress at peak")
+
+
+def main():
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    main()
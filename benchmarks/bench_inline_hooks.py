@@ -0,0 +1,53 @@
+"""
+Compares running a cheap sync hook in an executor thread against running it
+inline on the event loop
+
+Run with `python -m benchmarks.bench_inline_hooks`
+"""
+
+import asyncio
+import time
+
+from benchmarks._util import report
+
+_CALLS = 20000
+
+
+def _strip_newlines(line):
+    return line.replace("\r", "").replace("\n", "")
+
+
+async def _threaded(line):
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    for _ in range(_CALLS):
+        await loop.run_in_executor(None, _strip_newlines, line)
+
+    return (time.perf_counter() - start) / _CALLS * 1e6
+
+
+async def _inline(line):
+    start = time.perf_counter()
+    for _ in range(_CALLS):
+        _strip_newlines(line)
+
+    return (time.perf_counter() - start) / _CALLS * 1e6
+
+
+async def _main():
+    line = "PRIVMSG #channel :hello world"
+    report(
+        "Running a cheap sync hook",
+        {
+            "run_in_executor": await _threaded(line),
+            "inline": await _inline(line),
+        },
+    )
+
+
+def main():
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Compares splitting a 10 MB burst of IRC lines with the old bytes
+concatenate-and-split loop against LineBuffer
+
+Run with `python -m benchmarks.bench_line_framing`
+"""
+
+import time
+
+from benchmarks._util import report
+from cloudbot.util.lines import LineBuffer
+
+_LINE = b":irc.example.net 352 bot * ~user some.host.example irc.example.net Nick H :0 Real Name\r\n"
+_BURST_SIZE = 10 * 1024 * 1024
+# asyncio reads up to 256 KiB at a time, the old framing is quadratic in the
+# read size so larger reads quickly take minutes
+_READ_SIZES = (64 * 1024, 256 * 1024, 1024 * 1024)
+
+
+def _old_framing(chunks):
+    buffer = b""
+    count = 0
+    for data in chunks:
+        buffer += data
+        while b"\r\n" in buffer:
+            _, buffer = buffer.split(b"\r\n", 1)
+            count += 1
+
+    return count
+
+
+def _line_buffer(chunks):
+    buffer = LineBuffer()
+    count = 0
+    for data in chunks:
+        count += len(buffer.feed(data))
+
+    return count
+
+
+def _time(func, chunks):
+    start = time.perf_counter()
+    count = func(chunks)
+    return (time.perf_counter() - start) * 1000, count
+
+
+def main():
+    burst = _LINE * (_BURST_SIZE // len(_LINE))
+    for read_size in _READ_SIZES:
+        chunks = [
+            burst[i : i + read_size] for i in range(0, len(burst), read_size)
+        ]
+        old_time, old_count = _time(_old_framing, chunks)
+        new_time, new_count = _time(_line_buffer, chunks)
+        assert old_count == new_count
+        report(
+            f"Framing {len(burst) // 1024} KiB in {len(chunks)} read(s) "
+            f"({new_count} lines)",
+            {"bytes split": old_time, "LineBuffer": new_time},
+            unit="ms",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Compares the outgoing sieve chain parsing the line for each sieve which asks
+for it against parsing it once and sharing the parsed message
+
+Run with `python -m benchmarks.bench_out_pipeline`
+"""
+
+from irclib.parser import Message
+
+from benchmarks._util import bench, report
+
+_LINE = "PRIVMSG #channel :" + "a reply to a command " * 10
+
+
+def _strip_command_chars(parsed_line, line):
+    if (
+        parsed_line.command == "PRIVMSG"
+        and parsed_line.parameters[-1][0] in "!."
+    ):
+        parsed_line.parameters[-1] = "[!!] " + parsed_line.parameters[-1]
+        return parsed_line
+
+    return line
+
+
+def _check_send_key(parsed_line):
+    return parsed_line
+
+
+def _encode_line(line):
+    return line.encode()
+
+
+def _parse_each(line):
+    line = _strip_command_chars(Message.parse(line), line)
+    line = str(line)
+    line = str(_check_send_key(Message.parse(line)))
+    return _encode_line(line)
+
+
+def _parse_once(line):
+    parsed = Message.parse(line)
+    new_line = _strip_command_chars(parsed, line)
+    if new_line is not line and new_line is not parsed:
+        parsed = None
+
+    line = _check_send_key(parsed)
+    return _encode_line(str(line))
+
+
+def main():
+    assert _parse_each(_LINE) == _parse_once(_LINE)
+    report(
+        "Running the default outgoing sieves on a PRIVMSG",
+        {
+            "parse per sieve": bench(lambda: _parse_each(_LINE), number=20000),
+            "shared parse": bench(lambda: _parse_once(_LINE), number=20000),
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compares searching every regex hook pattern individually against ruling out
+patterns with the RegexPrefilter literal checks first
+
+Run with `python -m benchmarks.bench_regex_dispatch`
+"""
+
+import re
+
+from benchmarks._util import bench, report
+from cloudbot.util.regex import RegexPrefilter
+
+# A spread of the kinds of patterns link announcers and similar plugins use
+_PATTERNS = [
+    re.compile(r"youtube\.com/watch\?v=([-_a-zA-Z0-9]+)", re.I),
+    re.compile(r"youtu\.be/([-_a-zA-Z0-9]+)", re.I),
+    re.compile(r"twitter\.com/(\w+)/status/(\d+)", re.I),
+    re.compile(r"reddit\.com/r/\w+/comments/\w+", re.I),
+    re.compile(r"spotify:(track|album|artist):([a-zA-Z0-9]+)"),
+    re.compile(r"open\.spotify\.com/(track|album|artist)/(\w+)"),
+    re.compile(r"vimeo\.com/([0-9]+)", re.I),
+    re.compile(r"imdb\.com/title/(tt[0-9]+)", re.I),
+    re.compile(r"steamcommunity\.com/id/(\w+)", re.I),
+    re.compile(r"store\.steampowered\.com/app/(\d+)", re.I),
+    re.compile(r"github\.com/([\w-]+)/([\w.-]+)", re.I),
+    re.compile(r"amazon\.\w+/.*/dp/(\w+)", re.I),
+    re.compile(r"^(s|S)/.+/.*$"),
+    re.compile(r"^\?(\w+)"),
+    re.compile(r"https?://\S+\.(png|jpe?g|gif)\b", re.I),
+]
+
+_LINE = "just some ordinary chatter in a busy channel, nothing to see here"
+
+
+def _individual(entries, line):
+    return [hook for regex, hook in entries if regex.search(line)]
+
+
+def _prefiltered(prefilter, entries, line):
+    return [
+        hook
+        for regex, hook in prefilter.iter_candidates(entries, line)
+        if regex.search(line)
+    ]
+
+
+def main():
+    entries = [(regex, i) for i, regex in enumerate(_PATTERNS)]
+    prefilter = RegexPrefilter(regex for regex, _ in entries)
+    assert _individual(entries, _LINE) == _prefiltered(
+        prefilter, entries, _LINE
+    )
+    report(
+        f"Regex dispatch ({len(entries)} patterns, non-matching line)",
+        {
+            "individual searches": bench(
+                lambda: _individual(entries, _LINE), number=20000
+            ),
+            "literal prefilter": bench(
+                lambda: _prefiltered(prefilter, entries, _LINE),
+                number=20000,
+            ),
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Measures how many lines a bot with several busy connections handles per
+second when they all share one process, against splitting them over shard
+processes. Each connection gets a flood of PINGs from a local fake IRC server
+and the time is taken until every PONG is back.
+
+Run with `python -m benchmarks.bench_shards`
+"""
+
+import json
+import os
+import shutil
+import signal
+import subprocess  # nosec
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+from benchmarks._util import report
+from tests.util.fake_ircd import FakeIrcd
+
+_CONNECTIONS = 8
+_LINES = 20000
+_SHARDS = (1, 2, 4)
+
+_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _setup(path: Path, port: int, shards: int) -> None:
+    plugin_dir = path / "plugins" / "core"
+    plugin_dir.mkdir(parents=True)
+    (path / "plugins" / "__init__.py").touch()
+    for name in ("__init__.py", "core_connect.py", "core_misc.py"):
+        shutil.copy(_ROOT / "plugins" / "core" / name, plugin_dir)
+
+    config = {
+        "shards": shards,
+        "database": "sqlite:///cloudbot.db",
+        "logging": {"console_log_info": False, "file_log": False},
+        "connections": [
+            {
+                "name": f"conn{i}",
+                "type": "irc",
+                "nick": f"bot{i}",
+                "channels": [],
+                "connection": {"server": "127.0.0.1", "port": port},
+            }
+            for i in range(_CONNECTIONS)
+        ],
+    }
+    (path / "config.json").write_text(json.dumps(config))
+
+
+def _run(shards: int) -> float:
+    """Returns the lines handled per second with `shards` processes"""
+    ircd = FakeIrcd()
+    ircd.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            _setup(Path(tmp), ircd.port, shards)
+            proc = subprocess.Popen(  # nosec
+                [sys.executable, "-m", "cloudbot"],
+                cwd=tmp,
+                env=dict(os.environ, PYTHONPATH=str(_ROOT)),
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                ircd.wait_for(
+                    lambda s: len(s.clients) == _CONNECTIONS, timeout=60
+                )
+                total = _LINES * _CONNECTIONS
+                start = time.perf_counter()
+                ircd.ping_all(_LINES)
+                ircd.wait_for(lambda s: s.pongs == total, timeout=600)
+                elapsed = time.perf_counter() - start
+            finally:
+                proc.send_signal(signal.SIGTERM)
+                proc.wait()
+    finally:
+        ircd.stop()
+
+    return total / elapsed
+
+
+def main():
+    results: Dict[str, float] = {}
+    for shards in _SHARDS:
+        results[f"{shards} shard(s)"] = 1e6 / _run(shards)
+
+    report(
+        f"Handling {_LINES} PINGs on each of {_CONNECTIONS} connections, "
+        "per line",
+        results,
+    )
+    for name, per_line in results.items():
+        print(f"  {name}: {1e6 / per_line:.0f} lines/s")
+
+
+if __name__ == "__main__":
+    main()
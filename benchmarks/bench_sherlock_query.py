@@ -0,0 +1,155 @@
+"""
+Compares the old recursive sherlock query, which re-queried every result at
+each depth and scanned for lower(value), against the frontier traversal in
+plugins.sherlock.query using the indexed case-folded columns, on a synthetic
+tracking database
+
+Run with `python -m benchmarks.bench_sherlock_query [rows]`, the default
+builds 1M rows which takes a little while
+"""
+
+import datetime
+import random
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import Session
+
+from benchmarks._util import report
+from plugins import sherlock
+from plugins.user_tracking import (
+    address_table,
+    fold_value,
+    folded_column,
+    hosts_table,
+    masks_table,
+)
+
+_ROWS = 1_000_000
+_DEPTHS = (1, 2, 3)
+_SEEDS = 20
+
+_TABLES = (
+    (masks_table, "mask"),
+    (hosts_table, "host"),
+    (address_table, "addr"),
+)
+
+
+def _build(engine, rows):
+    """
+    Spread `rows` over the three tables, with each nick linked to a handful
+    of values and each value shared by around two nicks
+    """
+    rng = random.Random(1)
+    per_table = rows // len(_TABLES)
+    nicks = per_table // 5
+    now = datetime.datetime(2020, 1, 1)
+    with engine.begin() as conn:
+        for table, column_name in _TABLES:
+            table.create(conn)
+            data: Dict[Tuple[str, str], Dict[str, Any]] = {}
+            while len(data) < per_table:
+                nick = f"nick{rng.randrange(nicks)}"
+                value = f"{column_name}{rng.randrange(nicks * 5 // 2)}"
+                data[nick, value] = {
+                    "nick": nick,
+                    column_name: value,
+                    "created": now,
+                    "seen": now + datetime.timedelta(seconds=len(data)),
+                    "reg": False,
+                    "nick_case": nick,
+                    folded_column(column_name): fold_value(value),
+                }
+
+            conn.execute(table.insert(), list(data.values()))
+
+    return nicks
+
+
+def _recursive(db, nicks, masks, hosts, addrs, depth, first=True):
+    """The query algorithm before the frontier traversal"""
+    if depth < 0:
+        return nicks, masks, hosts, addrs
+
+    results: List[List[Any]] = [[], [], [], []]
+    if nicks:
+        names = [nick[0][0] for nick in nicks]
+        for i, (table, column_name) in enumerate(_TABLES, 1):
+            results[i].extend(
+                [row[column_name], row.seen]
+                for row in db.execute(
+                    table.select().where(table.c.nick.in_(names))
+                )
+            )
+
+    for values, (table, column_name) in zip((masks, hosts, addrs), _TABLES):
+        if values:
+            lowered = [value[0].lower() for value in values]
+            results[0].extend(
+                ((row.nick, row.nick_case), row.seen)
+                for row in db.execute(
+                    table.select().where(
+                        func.lower(table.c[column_name]).in_(lowered)
+                    )
+                )
+            )
+
+    if not first:
+        results = [a + b for a, b in zip(results, (nicks, masks, hosts, addrs))]
+
+    new_nicks, new_masks, new_hosts, new_addrs = results
+    return _recursive(
+        db, new_nicks, new_masks, new_hosts, new_addrs, depth - 1, False
+    )
+
+
+def _run(func, seeds):
+    start = time.perf_counter()
+    for nick in seeds:
+        func([((nick, nick), None)])
+
+    return (time.perf_counter() - start) / len(seeds) * 1e3
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else _ROWS
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine("sqlite:///" + str(Path(tmp) / "bench.db"))
+        nicks = _build(engine, rows)
+        seeds = [
+            f"nick{i}" for i in random.Random(2).sample(range(nicks), _SEEDS)
+        ]
+        with Session(engine) as db:
+            for depth in _DEPTHS:
+                report(
+                    f"Query from one nick over {rows} rows, depth {depth}",
+                    {
+                        "recursive": _run(
+                            partial(
+                                _recursive,
+                                db,
+                                masks=[],
+                                hosts=[],
+                                addrs=[],
+                                depth=depth,
+                            ),
+                            seeds,
+                        ),
+                        "frontier": _run(
+                            partial(sherlock.query, db, depth=depth), seeds
+                        ),
+                    },
+                    unit="ms",
+                )
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compares writing each outgoing line to the transport on its own against
+batching the lines sent in one loop iteration into a single writelines()
+
+Run with `python -m benchmarks.bench_write_batching`
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from benchmarks._util import report
+from cloudbot.clients.irc import _IrcProtocol
+
+_LINES = 500
+
+
+class _Transport:
+    def __init__(self):
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+
+    def writelines(self, lines):
+        self.writes += 1
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+
+async def _run(max_batch_bytes):
+    loop = asyncio.get_running_loop()
+    bot = SimpleNamespace(
+        process=None, plugin_manager=SimpleNamespace(out_sieves=[])
+    )
+    conn = SimpleNamespace(loop=loop, bot=bot, name="bench")
+    proto = _IrcProtocol(conn, max_batch_bytes=max_batch_bytes)
+    transport = _Transport()
+    proto.connection_made(transport)
+    start = time.perf_counter()
+    # Like autojoin, each line is sent from its own task
+    await asyncio.gather(
+        *(proto.send(f"JOIN #channel{i}", log=False) for i in range(_LINES))
+    )
+    await asyncio.sleep(0)
+    return (time.perf_counter() - start) * 1000, transport.writes
+
+
+async def _main():
+    results = {}
+    writes = {}
+    for name, max_bytes in (("write per line", 0), ("batched", 16384)):
+        results[name], writes[name] = await _run(max_bytes)
+
+    report(f"Sending {_LINES} JOIN lines", results, unit="ms")
+    for name, count in writes.items():
+        print(f"  {name}: {count} transport writes")
+
+
+def main():
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,23 @@ import signal
 import sys
 import time
 from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
 
 from cloudbot.bot import CloudBot
+from cloudbot.config import Config
+from cloudbot.shards import (
+    RESTART_EXIT_CODE,
+    Coordinator,
+    ShardLink,
+    setup_shard_logging,
+)
 from cloudbot.util import async_util
 
 
-async def async_main():
+async def async_main(
+    shard: Optional[Tuple[int, int]] = None,
+    shard_link: Optional[ShardLink] = None,
+):
     # store the original working directory, for use when restarting
     original_wd = Path().resolve()
 
@@ -23,7 +34,7 @@ async def async_main():
     logger.info("Starting CloudBot.")
 
     # create the bot
-    _bot = CloudBot()
+    _bot = CloudBot(shard=shard, shard_link=shard_link)
 
     # whether we are killed while restarting
     stopped_while_restarting = False
@@ -59,7 +70,10 @@ async def async_main():
     restart = await _bot.run()
 
     # the bot has stopped, do we want to restart?
-    if restart:
+    if restart and shard is not None:
+        # the coordinator process restarts shards
+        logger.info("Restarting shard %d", shard[0])
+    elif restart:
         # remove reference to cloudbot, so exit_gracefully won't try to stop it
         _bot = None
         # sleep one second for timeouts
@@ -83,10 +97,38 @@ async def async_main():
     # close logging, and exit the program.
     logger.debug("Stopping logging engine")
     logging.shutdown()
+    return restart
+
+
+def _run_shard(index: int, count: int, conn, log_queue) -> None:
+    setup_shard_logging(index, log_queue)
+    link = ShardLink(index, count, conn)
+    restart = asyncio.run(async_main((index, count), link))
+    sys.exit(RESTART_EXIT_CODE if restart else 0)
+
+
+def run_shards(
+    count: int,
+    target: Callable[..., None] = _run_shard,
+    config_path: Optional[Path] = None,
+) -> Dict[int, Optional[int]]:
+    """
+    Runs `count` shard processes, each handling its share of the configured
+    connections, and waits for them to stop. Shards which exit asking to be
+    restarted are started again.
+
+    :return: The exit code of each shard
+    """
+    return Coordinator(count, target, config_path=config_path).run()
 
 
 def main():
-    asyncio.run(async_main())
+    config = Config(None)
+    shards = config.get("shards", 1)
+    if shards > 1:
+        run_shards(shards, config_path=config.path)
+    else:
+        asyncio.run(async_main())
 
 
 if __name__ == "__main__":
@@ -9,7 +9,8 @@ import warnings
 from concurrent.futures.thread import ThreadPoolExecutor
 from functools import partial
 from pathlib import Path
-from typing import Any, Dict, Optional, Type
+from typing import Any, Dict, Mapping, Optional, Tuple, Type
+from weakref import WeakKeyDictionary
 
 from sqlalchemy import Table, create_engine
 from sqlalchemy import inspect as sa_inspect
@@ -23,9 +24,10 @@ from cloudbot.event import CommandEvent, Event, EventType, RegexEvent
 from cloudbot.hook import Action
 from cloudbot.plugin import PluginManager
 from cloudbot.reloader import ConfigReloader, PluginReloader
+from cloudbot.shards import ShardLink
 from cloudbot.util import async_util, database, formatting
-from cloudbot.util.executor_pool import ExecutorPool
 from cloudbot.util.mapping import KeyFoldDict
+from cloudbot.util.session_pool import DEFAULT_POOL_SIZE, SessionPool
 
 logger = logging.getLogger("cloudbot")
 
@@ -60,11 +62,9 @@ def clean_name(n):
     return re.sub("[^A-Za-z0-9_]+", "", n.replace(" ", "_"))
 
 
-def get_cmd_regex(event):
-    conn = event.conn
-    is_pm = event.chan.lower() == event.nick.lower()
-    command_prefix = re.escape(conn.config.get("command_prefix", "."))
-    conn_nick = re.escape(event.conn.nick)
+def _compile_cmd_regex(command_prefix: str, nick: str, is_pm: bool):
+    command_prefix = re.escape(command_prefix)
+    conn_nick = re.escape(nick)
     cmd_re = re.compile(
         r"""
         ^
@@ -89,13 +89,81 @@ def get_cmd_regex(event):
     return cmd_re
 
 
+class CommandMatcher:
+    """
+    Holds the compiled command regexes for a single connection
+
+    The regexes only depend on the connection's command prefix and nick, so
+    they are compiled once and reused until either of those changes.
+    """
+
+    def __init__(self, command_prefix: str, nick: str) -> None:
+        self.command_prefix = command_prefix
+        self.nick = nick
+        self.channel_regex = _compile_cmd_regex(command_prefix, nick, False)
+        self.pm_regex = _compile_cmd_regex(command_prefix, nick, True)
+
+    def is_current(self, command_prefix: str, nick: str) -> bool:
+        return self.command_prefix == command_prefix and self.nick == nick
+
+    def get_regex(self, is_pm: bool):
+        if is_pm:
+            return self.pm_regex
+
+        return self.channel_regex
+
+
+# Command matchers, keyed by connection
+_cmd_matchers: "WeakKeyDictionary[Any, CommandMatcher]" = WeakKeyDictionary()
+
+
+def get_cmd_matcher(conn) -> CommandMatcher:
+    """
+    Get the command matcher for a connection, rebuilding it if the
+    connection's nick or command prefix have changed since it was last built
+    """
+    command_prefix = conn.config.get("command_prefix", ".")
+    nick = conn.nick
+    matcher = _cmd_matchers.get(conn)
+    if matcher is None or not matcher.is_current(command_prefix, nick):
+        matcher = CommandMatcher(command_prefix, nick)
+        _cmd_matchers[conn] = matcher
+
+    return matcher
+
+
+def get_cmd_regex(event):
+    is_pm = event.chan.lower() == event.nick.lower()
+    return get_cmd_matcher(event.conn).get_regex(is_pm)
+
+
+def get_shard(conn_config: Mapping[str, Any], position: int, count: int) -> int:
+    """
+    Get the shard a connection runs in, either set with the connection's
+    "shard" option or assigned by its position in the connection list
+    """
+    shard = conn_config.get("shard")
+    if shard is None:
+        return position % count
+
+    return int(shard) % count
+
+
 class CloudBot:
     def __init__(
         self,
         *,
         loop: asyncio.AbstractEventLoop = None,
         base_dir: Optional[Path] = None,
+        shard: Optional[Tuple[int, int]] = None,
+        shard_link: Optional[ShardLink] = None,
     ) -> None:
+        """
+        :param shard: The (index, count) of the shard this bot runs, if it
+            only handles some of the configured connections
+        :param shard_link: The pipe to the coordinator when running as a
+            shard process
+        """
         loop = loop or asyncio.get_event_loop()
         if bot.get():
             raise ValueError("There seems to already be a bot running!")
@@ -107,6 +175,8 @@ class CloudBot:
         self.loop = loop
         self.start_time = time.time()
         self.running = True
+        self.shard = shard
+        self.shard_link = shard_link
         self.clients: Dict[str, Type[Client]] = {}
         # future which will be called when the bot stopsIf you
         self.stopped_future = async_util.create_future(self.loop)
@@ -143,8 +213,9 @@ class CloudBot:
         self.plugin_reloading_enabled = reloading_conf.get(
             "plugin_reloading", False
         )
-        self.config_reloading_enabled = reloading_conf.get(
-            "config_reloading", True
+        # The coordinator watches the config file for shards
+        self.config_reloading_enabled = shard_link is None and (
+            reloading_conf.get("config_reloading", True)
         )
 
         # this doesn't REALLY need to be here but it's nice
@@ -158,15 +229,39 @@ class CloudBot:
         # setup db
         db_path = self.config.get("database", "sqlite:///cloudbot.db")
         self.db_engine = create_engine(db_path)
+        if shard is not None and self.db_engine.dialect.name == "sqlite":
+            # Other shard processes write to the same file
+            database.share_sqlite(self.db_engine)
+
         database.configure(self.db_engine)
-        self.db_executor_pool = ExecutorPool(
-            50,
-            max_workers=1,
+        pool_conf = self.config.get("database_pool", {})
+        self.db_executor_pool = SessionPool(
+            pool_conf.get("size", DEFAULT_POOL_SIZE),
             thread_name_prefix="cloudbot-db",
-            loop=self.loop,
-            executor_type=ThreadPoolExecutor,
         )
 
+        # asyncio sessions for hooks which take `adb`, only set up when enabled
+        # as they need an asyncio driver such as aiosqlite to be installed
+        self.async_db_engine = None
+        async_db_config = self.config.get("async_database", {})
+        if async_db_config.get("enabled", False):
+            try:
+                self.async_db_engine = database.create_async_db_engine(
+                    async_db_config.get("url") or db_path
+                )
+            except (ImportError, ValueError):
+                logger.warning(
+                    "Unable to set up the async database, hooks using adb "
+                    "will fail",
+                    exc_info=True,
+                )
+            else:
+                sync_engine = self.async_db_engine.sync_engine
+                if shard is not None and sync_engine.dialect.name == "sqlite":
+                    database.share_sqlite(sync_engine)
+
+                database.configure_async(self.async_db_engine)
+
         logger.debug("Database system initialised.")
 
         # Bot initialisation complete
@@ -187,6 +282,11 @@ class CloudBot:
 
         self.plugin_manager = PluginManager(self)
 
+    @property
+    def is_primary_shard(self) -> bool:
+        """Whether this bot runs jobs which should only run in one shard"""
+        return self.shard is None or self.shard[0] == 0
+
     @property
     def data_dir(self) -> str:
         warnings.warn(
@@ -206,9 +306,15 @@ class CloudBot:
         # Wait till the bot stops. The stopped_future will be set to True to restart, False otherwise
         logger.debug("Init done")
         restart = await self.stopped_future
+        if self.shard_link is not None:
+            self.shard_link.detach()
+
         logger.debug("Waiting for plugin unload")
         await self.plugin_manager.unload_all()
         logger.debug("Unload complete")
+        if self.async_db_engine is not None:
+            await self.async_db_engine.dispose()
+
         return restart
 
     def get_client(self, name: str) -> Type[Client]:
@@ -219,7 +325,12 @@ class CloudBot:
 
     def create_connections(self):
         """Create a BotConnection for all the networks defined in the config"""
-        for config in self.config["connections"]:
+        for position, config in enumerate(self.config["connections"]):
+            if self.shard is not None:
+                index, count = self.shard
+                if get_shard(config, position, count) != index:
+                    continue
+
             # strip all spaces and capitalization from the connection name
             name = clean_name(config["name"])
             nick = config["nick"]
@@ -316,6 +427,9 @@ class CloudBot:
         )
         logger.debug("Connections created.")
 
+        if self.shard_link is not None:
+            self.shard_link.attach(self)
+
         # Run a manual garbage collection cycle, to clean up any unused objects created during initialization
         gc.collect()
 
@@ -400,10 +514,12 @@ class CloudBot:
 
         if event.type is EventType.message:
             # Commands
-            cmd_match = get_cmd_regex(event).match(event.content)
+            is_pm = event.chan.lower() == event.nick.lower()
+            cmd_matcher = get_cmd_matcher(event.conn)
+            cmd_match = cmd_matcher.get_regex(is_pm).match(event.content)
 
             if cmd_match:
-                command_prefix = event.conn.config.get("command_prefix", ".")
+                command_prefix = cmd_matcher.command_prefix
                 prefix = cmd_match.group("prefix") or command_prefix[0]
                 command = cmd_match.group("command").lower()
                 text = cmd_match.group("text").strip()
@@ -420,13 +536,9 @@ class CloudBot:
                     add_hook(command_hook, command_event)
                     matched_command = True
                 else:
-                    potential_matches = []
-                    for (
-                        potential_match,
-                        plugin,
-                    ) in self.plugin_manager.commands.items():
-                        if potential_match.startswith(command):
-                            potential_matches.append((potential_match, plugin))
+                    potential_matches = list(
+                        self.plugin_manager.commands.find_prefix(command)
+                    )
 
                     if potential_matches:
                         matched_command = True
@@ -435,16 +547,21 @@ class CloudBot:
                             command_event = cmd_event(hook=command_hook)
                             add_hook(command_hook, command_event)
                         else:
-                            commands = sorted(
+                            # find_prefix() yields commands in sorted order
+                            commands = [
                                 command for command, plugin in potential_matches
-                            )
+                            ]
                             txt_list = formatting.get_text_list(commands)
                             event.notice(f"Possible matches: {txt_list}")
 
         if event.type in (EventType.message, EventType.action):
             # Regex hooks
             regex_matched = False
-            for regex, regex_hook in self.plugin_manager.regex_hooks:
+            # Skip merged patterns entirely if the prefilter rules them out
+            regex_hooks = self.plugin_manager.regex_prefilter.iter_candidates(
+                self.plugin_manager.regex_hooks, event.content
+            )
+            for regex, regex_hook in regex_hooks:
                 if not regex_hook.run_on_cmd and matched_command:
                     continue
 
@@ -8,13 +8,32 @@ import traceback
 from functools import partial
 from itertools import chain
 from pathlib import Path
-from typing import Dict, Mapping, Optional, Tuple, Union, cast
+from typing import Dict, List, Mapping, Optional, Tuple, Union, cast
 
 from irclib.parser import Message
 
 from cloudbot.client import Client, ClientConnectError, client
 from cloudbot.event import Event, EventType, IrcOutEvent
 from cloudbot.util import async_util, colors
+from cloudbot.util.dispatch import (
+    DEFAULT_DETACH_TIMEOUT,
+    DEFAULT_HIGH_WATER,
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_ORDERED_COMMANDS,
+    EventDispatcher,
+)
+from cloudbot.util.lines import (
+    DEFAULT_FALLBACK_CODECS,
+    DEFAULT_MAX_LINE_LENGTH,
+    LineBuffer,
+    LineDecoder,
+)
+from cloudbot.util.sendqueue import (
+    DEFAULT_BURST,
+    DEFAULT_COALESCE_LENGTH,
+    DEFAULT_RATE,
+    SendQueue,
+)
 
 logger = logging.getLogger("cloudbot")
 
@@ -87,7 +106,7 @@ def decode(bytestring):
     >>> decode(bytes([0x80, 0xbf, 0x81]) + '\u200b'.encode())
     '\u200b'
     """
-    for codec in ("utf-8", "shift_jis", "cp1252"):
+    for codec in ("utf-8", *DEFAULT_FALLBACK_CODECS):
         try:
             return bytestring.decode(codec)
         except UnicodeDecodeError:
@@ -96,6 +115,14 @@ def decode(bytestring):
     return bytestring.decode("utf-8", errors="ignore")
 
 
+# Seconds to hold outgoing lines before writing them, 0 writes them at the
+# end of the current loop iteration
+DEFAULT_FLUSH_DELAY = 0.0
+
+# Buffered outgoing bytes which trigger an immediate write, one TLS record
+DEFAULT_MAX_BATCH_BYTES = 16384
+
+
 def _get_param(msg: Message, index_map: Mapping[str, int]) -> Optional[str]:
     if msg.command in index_map:
         idx = index_map[msg.command]
@@ -124,6 +151,46 @@ class IrcClient(Client):
         self._timeout = conn_config.get("timeout", 300)
         self.server = conn_config["server"]
         self.port = conn_config.get("port", 6667)
+        self._max_line_length = conn_config.get(
+            "max_incoming_line_length", DEFAULT_MAX_LINE_LENGTH
+        )
+        self.decoder = LineDecoder(
+            conn_config.get("fallback_codecs", DEFAULT_FALLBACK_CODECS),
+            remember_senders=conn_config.get("remember_sender_codecs", False),
+        )
+
+        dispatch_conf = self.config.get("dispatch", {})
+        self.dispatcher = EventDispatcher(
+            self.bot.process,
+            loop=self.loop,
+            max_workers=dispatch_conf.get("workers", DEFAULT_MAX_WORKERS),
+            ordered_commands=dispatch_conf.get(
+                "ordered_commands", DEFAULT_ORDERED_COMMANDS
+            ),
+            detach_timeout=dispatch_conf.get(
+                "detach_timeout", DEFAULT_DETACH_TIMEOUT
+            ),
+            high_water=dispatch_conf.get("high_water", DEFAULT_HIGH_WATER),
+        )
+
+        send_conf = self.config.get("send_queue", {})
+        self.send_queue: Optional[SendQueue] = None
+        if send_conf.get("enabled", False):
+            admin_targets = list(send_conf.get("admin_targets", []))
+            if self.config.get("log_channel"):
+                admin_targets.append(self.config["log_channel"])
+
+            self.send_queue = SendQueue(
+                self._write,
+                loop=self.loop,
+                burst=send_conf.get("burst", DEFAULT_BURST),
+                rate=send_conf.get("rate", DEFAULT_RATE),
+                admin_targets=admin_targets,
+                coalesce=send_conf.get("coalesce", False),
+                coalesce_length=send_conf.get(
+                    "coalesce_length", DEFAULT_COALESCE_LENGTH
+                ),
+            )
 
         local_bind = (
             conn_config.get("bind_addr"),
@@ -280,8 +347,19 @@ class IrcClient(Client):
         if self.local_bind:
             optional_params["local_addr"] = self.local_bind
 
+        write_conf = self.config.get("write_batch", {})
         coro = self.loop.create_connection(
-            partial(_IrcProtocol, self),
+            partial(
+                _IrcProtocol,
+                self,
+                max_line_length=self._max_line_length,
+                dispatcher=self.dispatcher,
+                decoder=self.decoder,
+                flush_delay=write_conf.get("flush_delay", DEFAULT_FLUSH_DELAY),
+                max_batch_bytes=write_conf.get(
+                    "max_bytes", DEFAULT_MAX_BATCH_BYTES
+                ),
+            ),
             host=self.server,
             port=self.port,
             ssl=self.ssl_context,
@@ -293,6 +371,10 @@ class IrcClient(Client):
 
         self._transport, self._protocol = await coro
 
+        if self.send_queue is not None:
+            # Anything still queued was meant for the old connection
+            self.send_queue.reset()
+
         tasks = [
             self.bot.plugin_manager.launch(
                 hook, Event(bot=self.bot, conn=self, hook=hook)
@@ -391,6 +473,15 @@ class IrcClient(Client):
         """
         Sends a raw IRC line unchecked. Doesn't do connected check, and is *not* threadsafe
         """
+        if self.send_queue is None:
+            self._write(line, log)
+        else:
+            self.send_queue.put(line, log)
+
+    def _write(self, line, log=True):
+        """
+        Passes a line to the protocol, bypassing the send queue
+        """
         async_util.wrap_future(
             self._protocol.send(line, log=log), loop=self.loop
         )
@@ -406,14 +497,37 @@ class IrcClient(Client):
 class _IrcProtocol(asyncio.Protocol):
     """ """
 
-    def __init__(self, conn):
-        """ """
+    def __init__(
+        self,
+        conn,
+        *,
+        max_line_length=DEFAULT_MAX_LINE_LENGTH,
+        dispatcher=None,
+        decoder=None,
+        flush_delay=DEFAULT_FLUSH_DELAY,
+        max_batch_bytes=DEFAULT_MAX_BATCH_BYTES,
+    ):
+        """
+        Outgoing lines are buffered and written together after `flush_delay`
+        seconds, or as soon as `max_batch_bytes` bytes are waiting. Setting
+        `max_batch_bytes` to 0 writes each line as it is sent.
+        """
         self.loop = conn.loop
         self.bot = conn.bot
         self.conn = conn
 
+        if dispatcher is None:
+            dispatcher = EventDispatcher(self.bot.process, loop=self.loop)
+
+        self._dispatcher = dispatcher
+
+        if decoder is None:
+            decoder = LineDecoder()
+
+        self._decoder = decoder
+
         # input buffer
-        self._input_buffer = b""
+        self._input_buffer = LineBuffer(max_line_length)
 
         # connected
         self._connected = False
@@ -422,6 +536,15 @@ class _IrcProtocol(asyncio.Protocol):
         # transport
         self._transport = None
 
+        # output buffer
+        self.flush_delay = flush_delay
+        self.max_batch_bytes = max_batch_bytes
+        self._write_buffer: List[bytes] = []
+        self._write_buffer_size = 0
+        self._flush_handle: Optional[asyncio.Handle] = None
+        self.lines_written = 0
+        self.flushes = 0
+
         # Future that waits until we are connected
         self._connected_future = async_util.create_future(self.loop)
 
@@ -430,11 +553,14 @@ class _IrcProtocol(asyncio.Protocol):
         self._connecting = False
         self._connected = True
         self._connected_future.set_result(None)
+        self._dispatcher.attach(transport)
         # we don't need the _connected_future, everything uses it will check _connected first.
         del self._connected_future
 
     def connection_lost(self, exc):
         self._connected = False
+        self._clear_write_buffer()
+        self._dispatcher.detach()
         if exc:
             logger.error("[%s] Connection lost: %s", self.conn.name, exc)
 
@@ -444,6 +570,7 @@ class _IrcProtocol(asyncio.Protocol):
         self._connecting = False
         self._connected = False
         if self._transport:
+            self.flush()
             self._transport.close()
 
         try:
@@ -467,9 +594,18 @@ class _IrcProtocol(asyncio.Protocol):
         old_line = line
         filtered = bool(self.bot.plugin_manager.out_sieves)
 
+        # The line is parsed at most once, the first time a sieve asks for
+        # it, and the parsed message is shared with every later sieve until
+        # one of them replaces the line. Sieves which modify parsed_line
+        # must return it.
+        parsed = None
         for out_sieve in self.bot.plugin_manager.out_sieves:
             event = IrcOutEvent(
-                bot=self.bot, hook=out_sieve, conn=self.conn, irc_raw=line
+                bot=self.bot,
+                hook=out_sieve,
+                conn=self.conn,
+                irc_raw=line,
+                parsed_line=parsed,
             )
 
             ok, new_line = await self.bot.plugin_manager.internal_launch(
@@ -483,10 +619,15 @@ class _IrcProtocol(asyncio.Protocol):
                 filtered = False
                 break
 
-            line = new_line
-            if line is not None and not isinstance(line, bytes):
-                line = str(line)
+            parsed = event.parsed_line
+            if new_line is not line and new_line is not parsed:
+                parsed = None
+                if new_line is not None and not isinstance(
+                    new_line, (bytes, str, Message)
+                ):
+                    new_line = str(new_line)
 
+            line = new_line
             if not line:
                 return
 
@@ -497,19 +638,61 @@ class _IrcProtocol(asyncio.Protocol):
 
         if not isinstance(line, bytes):
             # the line must be encoded before we send it, one of the sieves didn't encode it, fall back to the default
-            line = line.encode("utf-8", "replace")
+            line = str(line).encode("utf-8", "replace")
 
         if log:
             logger.debug("[%s|out] >> %r", self.conn.name, line)
 
-        self._transport.write(line)
+        self._write_buffer.append(line)
+        self._write_buffer_size += len(line)
+        if self._write_buffer_size >= self.max_batch_bytes:
+            self.flush()
+        elif self._flush_handle is None:
+            if self.flush_delay:
+                self._flush_handle = self.loop.call_later(
+                    self.flush_delay, self.flush
+                )
+            else:
+                self._flush_handle = self.loop.call_soon(self.flush)
+
+    def _clear_write_buffer(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        lines = self._write_buffer
+        self._write_buffer = []
+        self._write_buffer_size = 0
+        return lines
+
+    def flush(self):
+        """
+        Writes all buffered outgoing lines to the transport at once
+        """
+        lines = self._clear_write_buffer()
+        if not lines:
+            return
+
+        self.flushes += 1
+        self.lines_written += len(lines)
+        if len(lines) == 1:
+            self._transport.write(lines[0])
+        else:
+            self._transport.writelines(lines)
 
     def data_received(self, data):
-        self._input_buffer += data
+        discarded = self._input_buffer.discarded
+        lines = self._input_buffer.feed(data)
+        if self._input_buffer.discarded != discarded:
+            logger.warning(
+                "[%s] Discarded IRC line longer than %d bytes from %s",
+                self.conn.name,
+                self._input_buffer.max_line_length,
+                self.conn.describe_server(),
+            )
 
-        while b"\r\n" in self._input_buffer:
-            line_data, self._input_buffer = self._input_buffer.split(b"\r\n", 1)
-            line = decode(line_data)
+        for line_data in lines:
+            line = self._decoder.decode(line_data)
 
             try:
                 event = self.parse_line(line)
@@ -521,8 +704,7 @@ class _IrcProtocol(asyncio.Protocol):
                     self.conn.describe_server(),
                 )
             else:
-                # handle the message, async
-                async_util.wrap_future(self.bot.process(event), loop=self.loop)
+                self._dispatcher.put(event)
 
     def parse_line(self, line: str) -> Event:
         message = Message.parse(line)
@@ -1,11 +1,12 @@
 import enum
 import logging
 from functools import partial
-from typing import Any, Iterator, Mapping
+from operator import attrgetter
+from typing import Any, Iterator, Mapping, Tuple
 
 from irclib.parser import Message
 
-from cloudbot.util.database import Session
+from cloudbot.util.database import AsyncSession, Session
 
 logger = logging.getLogger("cloudbot")
 
@@ -22,7 +23,136 @@ class EventType(enum.Enum):
     other = 6
 
 
+# Fields parsed from the incoming line, shared by every hook's copy of an event
+_DATA_FIELDS = (
+    "type",
+    "content",
+    "content_raw",
+    "target",
+    "chan",
+    "nick",
+    "user",
+    "host",
+    "mask",
+    "irc_raw",
+    "irc_tags",
+    "irc_prefix",
+    "irc_command",
+    "irc_paramlist",
+    "irc_ctcp_text",
+)
+
+
+class EventData:
+    """
+    The fields of an event which come from the line itself, parsed once and
+    shared between the events passed to each hook
+    """
+
+    __slots__ = _DATA_FIELDS
+
+    def __init__(
+        self,
+        *,
+        event_type=EventType.other,
+        content=None,
+        content_raw=None,
+        target=None,
+        channel=None,
+        nick=None,
+        user=None,
+        host=None,
+        mask=None,
+        irc_raw=None,
+        irc_prefix=None,
+        irc_command=None,
+        irc_paramlist=None,
+        irc_ctcp_text=None,
+        irc_tags=None,
+    ):
+        self.type = event_type
+        self.content = content
+        self.content_raw = content_raw
+        self.target = target
+        self.chan = channel
+        self.nick = nick
+        self.user = user
+        self.host = host
+        self.mask = mask
+        # clients-specific parameters
+        self.irc_raw = irc_raw
+        self.irc_tags = irc_tags
+        self.irc_prefix = irc_prefix
+        self.irc_command = irc_command
+        self.irc_paramlist = irc_paramlist
+        self.irc_ctcp_text = irc_ctcp_text
+
+    @classmethod
+    def from_event(cls, event) -> "EventData":
+        data = cls.__new__(cls)
+        for name in _DATA_FIELDS:
+            setattr(data, name, getattr(event, name))
+
+        return data
+
+    def copy(self) -> "EventData":
+        return self.from_event(self)
+
+
+def _data_field(name: str) -> property:
+    def _set(self, value):
+        if not self._owns_data:
+            # Copy on write, so changes don't leak to other hooks' events
+            self._data = self._data.copy()
+            self._owns_data = True
+
+        setattr(self._data, name, value)
+
+    return property(attrgetter("_data." + name), _set)
+
+
 class Event(Mapping[str, Any]):
+    """
+    The data passed to a hook
+
+    The fields parsed from the line are kept in an EventData record, which
+    copies of an event share until one of them changes a field.
+    """
+
+    __slots__ = (
+        "db",
+        "db_executor",
+        "adb",
+        "bot",
+        "conn",
+        "hook",
+        "_data",
+        "_owns_data",
+        "__dict__",
+        "__weakref__",
+    )
+
+    # The keys exposed through the mapping interface, subclasses add their own
+    # slots to this automatically
+    _fields: Tuple[str, ...] = (
+        "db",
+        "db_executor",
+        "adb",
+        "bot",
+        "conn",
+        "hook",
+    ) + _DATA_FIELDS
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        slots = cls.__dict__.get("__slots__", ())
+        if isinstance(slots, str):
+            slots = (slots,)
+
+        cls._fields = cls._fields + tuple(
+            name for name in slots if not name.startswith("__")
+        )
+
     def __init__(
         self,
         *,
@@ -74,6 +204,7 @@ class Event(Mapping[str, Any]):
         """
         self.db = None
         self.db_executor = None
+        self.adb = None
         self.bot = bot
         self.conn = conn
         self.hook = hook
@@ -86,47 +217,60 @@ class Event(Mapping[str, Any]):
             if self.hook is None and base_event.hook is not None:
                 self.hook = base_event.hook
 
-            # If base_event is provided, don't check these parameters, just inherit
-            self.type = base_event.type
-            self.content = base_event.content
-            self.content_raw = base_event.content_raw
-            self.target = base_event.target
-            self.chan = base_event.chan
-            self.nick = base_event.nick
-            self.user = base_event.user
-            self.host = base_event.host
-            self.mask = base_event.mask
-            # clients-specific parameters
-            self.irc_raw = base_event.irc_raw
-            self.irc_tags = base_event.irc_tags
-            self.irc_prefix = base_event.irc_prefix
-            self.irc_command = base_event.irc_command
-            self.irc_paramlist = base_event.irc_paramlist
-            self.irc_ctcp_text = base_event.irc_ctcp_text
+            # If base_event is provided, don't check these parameters, just
+            # share its data until either event changes it
+            try:
+                self._data = base_event._data
+            except AttributeError:
+                self._data = EventData.from_event(base_event)
+                self._owns_data = True
+            else:
+                self._owns_data = False
+                base_event._owns_data = False
         else:
             # Since base_event wasn't provided, we can take these parameters
-            self.type = event_type
-            self.content = content
-            self.content_raw = content_raw
-            self.target = target
-            self.chan = channel
-            self.nick = nick
-            self.user = user
-            self.host = host
-            self.mask = mask
-            # clients-specific parameters
-            self.irc_raw = irc_raw
-            self.irc_tags = irc_tags
-            self.irc_prefix = irc_prefix
-            self.irc_command = irc_command
-            self.irc_paramlist = irc_paramlist
-            self.irc_ctcp_text = irc_ctcp_text
+            self._data = EventData(
+                event_type=event_type,
+                content=content,
+                content_raw=content_raw,
+                target=target,
+                channel=channel,
+                nick=nick,
+                user=user,
+                host=host,
+                mask=mask,
+                irc_raw=irc_raw,
+                irc_tags=irc_tags,
+                irc_prefix=irc_prefix,
+                irc_command=irc_command,
+                irc_paramlist=irc_paramlist,
+                irc_ctcp_text=irc_ctcp_text,
+            )
+            self._owns_data = True
+
+    type = _data_field("type")
+    content = _data_field("content")
+    content_raw = _data_field("content_raw")
+    target = _data_field("target")
+    chan = _data_field("chan")
+    nick = _data_field("nick")
+    user = _data_field("user")
+    host = _data_field("host")
+    mask = _data_field("mask")
+    irc_raw = _data_field("irc_raw")
+    irc_tags = _data_field("irc_tags")
+    irc_prefix = _data_field("irc_prefix")
+    irc_command = _data_field("irc_command")
+    irc_paramlist = _data_field("irc_paramlist")
+    irc_ctcp_text = _data_field("irc_ctcp_text")
 
     def __len__(self) -> int:
-        return len(self.__dict__)
+        extra = self.__dict__
+        return len(self._fields) + len(extra)
 
     def __iter__(self) -> Iterator[str]:
-        return iter(self.__dict__)
+        yield from self._fields
+        yield from self.__dict__
 
     def __getitem__(self, item: str) -> Any:
         try:
@@ -139,6 +283,7 @@ class Event(Mapping[str, Any]):
         Initializes this event to be run through it's hook
 
         Mainly, initializes a database object on this event, if the hook requires it.
+        Hooks taking `adb` get an asyncio session, which needs the async_database option.
 
         This method is for when the hook is *not* threaded (event.hook.threaded is False).
         If you need to add a db to a threaded hook, use prepare_threaded.
@@ -147,13 +292,29 @@ class Event(Mapping[str, Any]):
         if self.hook is None:
             raise ValueError("event.hook is required to prepare an event")
 
+        use_adb = "adb" in self.hook.required_args
+        if use_adb and self.bot.async_db_engine is None:
+            raise ValueError(
+                "Hooks taking adb need async_database enabled in the config"
+            )
+
         if "db" in self.hook.required_args:
             # logger.debug("Opening database session for {}:threaded=False".format(self.hook.description))
 
-            # we're running a coroutine hook with a db, so initialise an executor pool
-            self.db_executor = self.bot.db_executor_pool.get()
-            # be sure to initialize the db in the database executor, so it will be accessible in that thread.
-            self.db = await self.async_call(Session)
+            # we're running a coroutine hook with a db, so check out a database worker,
+            # which may be shared with other hooks if the pool is saturated
+            self.db_executor = self.bot.db_executor_pool.acquire()
+            try:
+                # be sure to initialize the db in the database executor, so it will be accessible in that thread.
+                # The session isn't taken from the thread's scoped registry, as another hook may share the worker.
+                self.db = await self.async_call(Session.session_factory)
+            except BaseException:
+                self.release_db_executor()
+                raise
+
+        if use_adb:
+            # asyncio sessions run their statements on the event loop, so they don't need a database worker
+            self.adb = AsyncSession()
 
     def prepare_threaded(self):
         """
@@ -185,11 +346,27 @@ class Event(Mapping[str, Any]):
         if self.hook is None:
             raise ValueError("event.hook is required to close an event")
 
-        if self.db is not None:
-            # logger.debug("Closing database session for {}:threaded=False".format(self.hook.description))
-            # be sure the close the database in the database executor, as it is only accessable in that one thread
-            await self.async_call(self.db.close)
-            self.db = None
+        adb, self.adb = self.adb, None
+        try:
+            if adb is not None:
+                await adb.close()
+        finally:
+            # close the db session even if closing adb failed
+            try:
+                if self.db is not None:
+                    # logger.debug("Closing database session for {}:threaded=False".format(self.hook.description))
+                    # be sure the close the database in the database executor, as it is only accessable in that one thread
+                    await self.async_call(self.db.close)
+                    self.db = None
+            finally:
+                # release the worker explicitly so the next hook can use it
+                self.release_db_executor()
+
+    def release_db_executor(self):
+        """Return this event's database worker to the pool, if it has one"""
+        if self.db_executor is not None:
+            self.bot.db_executor_pool.release(self.db_executor)
+            self.db_executor = None
 
     def close_threaded(self):
         """
@@ -244,6 +421,9 @@ class Event(Mapping[str, Any]):
             if conn and conn.connected:
                 conn.admin_log(message, console=not broadcast)
 
+        if broadcast and self.bot.shard_link is not None:
+            self.bot.shard_link.send("admin_log", message)
+
     def reply(self, *messages, target=None):
         """sends a message to the current channel/user with a prefix"""
         reply_ping = self.conn.config.get("reply_ping", True)
@@ -344,13 +524,8 @@ class Event(Mapping[str, Any]):
         return False
 
     async def async_call(self, func, *args, **kwargs):
-        if self.db_executor is not None:
-            executor = self.db_executor.executor
-        else:
-            executor = None
-
         part = partial(func, *args, **kwargs)
-        result = await self.loop.run_in_executor(executor, part)
+        result = await self.loop.run_in_executor(self.db_executor, part)
         return result
 
     def is_nick_valid(self, nick):
@@ -363,6 +538,8 @@ class Event(Mapping[str, Any]):
 
 
 class CommandEvent(Event):
+    __slots__ = ("text", "doc", "triggered_command", "triggered_prefix")
+
     def __init__(
         self,
         *,
@@ -436,6 +613,8 @@ class CommandEvent(Event):
 
 
 class RegexEvent(Event):
+    __slots__ = ("match",)
+
     def __init__(
         self,
         *,
@@ -484,6 +663,8 @@ class RegexEvent(Event):
 
 
 class CapEvent(Event):
+    __slots__ = ("cap", "cap_param")
+
     def __init__(self, *args, cap, cap_param=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.cap = cap
@@ -491,12 +672,22 @@ class CapEvent(Event):
 
 
 class IrcOutEvent(Event):
-    def __init__(self, *args, **kwargs):
+    __slots__ = ("parsed_line",)
+
+    def __init__(self, *args, parsed_line=None, **kwargs):
+        """
+        :param parsed_line: The already parsed form of `irc_raw`, if there is
+            one, so it isn't parsed again for hooks which request it
+        """
         super().__init__(*args, **kwargs)
-        self.parsed_line = None
+        if parsed_line is None and isinstance(self.irc_raw, Message):
+            parsed_line = self.irc_raw
 
-    async def prepare(self):
-        await super().prepare()
+        self.parsed_line = parsed_line
+
+    def _parse_line(self):
+        if self.parsed_line is not None:
+            return
 
         if "parsed_line" in self.hook.required_args:
             try:
@@ -507,24 +698,48 @@ class IrcOutEvent(Event):
                 )
                 self.parsed_line = None
 
+    async def prepare(self):
+        await super().prepare()
+        self._parse_line()
+
     def prepare_threaded(self):
         super().prepare_threaded()
-
-        if "parsed_line" in self.hook.required_args:
-            try:
-                self.parsed_line = Message.parse(self.line)
-            except Exception:
-                logger.exception(
-                    "Unable to parse line requested by hook %s", self.hook
-                )
-                self.parsed_line = None
+        self._parse_line()
 
     @property
     def line(self):
         return str(self.irc_raw)
 
 
+class HookCompletion:
+    """A record of a hook or sieve which finished running"""
+
+    __slots__ = ("hook", "event", "duration", "result", "error")
+
+    def __init__(self, hook, event, duration, result=None, error=None):
+        self.hook = hook
+        self.event = event
+        # Seconds the hook took to run
+        self.duration = duration
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class HookCompletionEvent(Event):
+    __slots__ = ("records",)
+
+    def __init__(self, *args, records, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.records = records
+
+
 class PostHookEvent(Event):
+    __slots__ = ("launched_hook", "launched_event", "result", "error")
+
     def __init__(
         self,
         *args,
@@ -274,7 +274,12 @@ def regex(regex_param, **kwargs):
 
 
 def sieve(param=None, **kwargs):
-    """External sieve decorator. Can be used directly as a decorator, or with args to return a decorator"""
+    """External sieve decorator. Can be used directly as a decorator, or with args to return a decorator
+
+    A sieve runs before every hook unless limited with the `hook_types`,
+    `skip_hook_types`, `plugins` or `skip_plugins` keyword arguments, the
+    plugin arguments being fnmatch patterns for plugin titles.
+    """
 
     def _sieve_hook(func):
         assert (
@@ -467,6 +472,29 @@ def post_hook(param=None, **kwargs):
     return _decorate
 
 
+def hook_complete(param=None, **kwargs):
+    """
+    This hook receives batches of HookCompletion records for finished hooks
+    and sieves as `records`, some time after they finish. Unlike post_hook,
+    it can't stop other hooks from seeing the result.
+    """
+
+    def _decorate(func):
+        hook = _get_hook(func, "hook_complete")
+        if hook is None:
+            hook = _Hook(func, "hook_complete")
+            _add_hook(func, hook)
+
+        hook._add_hook(kwargs)
+        return func
+
+    if callable(param):
+        _hook_warn()
+        return _decorate(param)
+
+    return _decorate
+
+
 def permission(*perms, **kwargs):
     def _perm_hook(func):
         hook = _get_hook(func, "perm_check")
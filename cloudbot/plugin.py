@@ -2,16 +2,19 @@ import asyncio
 import importlib
 import logging
 import sys
+import time
 import typing
 from collections import defaultdict
 from functools import partial
 from operator import attrgetter
 from pathlib import Path
 from typing import (
+    Any,
     Dict,
     List,
     MutableMapping,
     Optional,
+    Set,
     Tuple,
     Type,
     TypedDict,
@@ -22,12 +25,20 @@ from weakref import WeakValueDictionary
 import sqlalchemy
 from sqlalchemy import Table
 
-from cloudbot.event import Event, EventType, PostHookEvent
+from cloudbot.event import (
+    Event,
+    EventType,
+    HookCompletion,
+    HookCompletionEvent,
+    PostHookEvent,
+)
 from cloudbot.plugin_hooks import (
     CapHook,
     CommandHook,
     ConfigHook,
     EventHook,
+    Hook,
+    HookCompleteHook,
     IrcOutHook,
     OnCapAckHook,
     OnCapAvaliableHook,
@@ -43,10 +54,18 @@ from cloudbot.plugin_hooks import (
     hook_name_to_plugin,
 )
 from cloudbot.util import HOOK_ATTR, LOADED_ATTR, async_util, database
-from cloudbot.util.func_utils import call_with_args
+from cloudbot.util.batching import Batcher
+from cloudbot.util.inline_hooks import InlineHookTimer
+from cloudbot.util.mapping import PrefixIndexDict
+from cloudbot.util.regex import RegexPrefilter
 
 logger = logging.getLogger("cloudbot")
 
+DEFAULT_COMPLETION_BATCH_SIZE = 100
+
+# Seconds to buffer hook completion records before delivering them
+DEFAULT_COMPLETION_FLUSH_DELAY = 0.5
+
 
 class HookDict(TypedDict):
     command: List[CommandHook]
@@ -63,6 +82,7 @@ class HookDict(TypedDict):
     irc_out: List[IrcOutHook]
     post_hook: List[PostHookHook]
     config: List[ConfigHook]
+    hook_complete: List[HookCompleteHook]
     perm_check: List[PermHook]
 
 
@@ -129,14 +149,16 @@ class PluginManager:
         self._plugin_name_map: MutableMapping[str, Plugin] = (
             WeakValueDictionary()
         )
-        self.commands: Dict[str, CommandHook] = {}
+        self.commands: PrefixIndexDict[CommandHook] = PrefixIndexDict()
         self.raw_triggers: Dict[str, List[RawHook]] = defaultdict(list)
         self.catch_all_triggers: List[RawHook] = []
         self.event_type_hooks: Dict[EventType, List[EventHook]] = defaultdict(
             list
         )
         self.regex_hooks: List[Tuple[typing.Pattern, RegexHook]] = []
-        self.sieves = []
+        self._regex_prefilter: Optional[RegexPrefilter] = None
+        self.sieves: List[SieveHook] = []
+        self._sieve_chains: Dict[Hook, SieveChain] = {}
         self.cap_hooks: Dict[str, Dict[str, List[CapHook]]] = {
             "on_available": defaultdict(list),
             "on_ack": defaultdict(list),
@@ -146,6 +168,23 @@ class PluginManager:
         self.hook_hooks = defaultdict(list)
         self.perm_hooks = defaultdict(list)
         self.config_hooks: List[ConfigHook] = []
+        self.completion_hooks: List[HookCompleteHook] = []
+
+        completion_conf = self.bot.config.get("hook_completion", {})
+        self._completions: Batcher[HookCompletion] = Batcher(
+            self.bot.loop,
+            self._deliver_completions,
+            batch_size=completion_conf.get(
+                "batch_size", DEFAULT_COMPLETION_BATCH_SIZE
+            ),
+            flush_delay=completion_conf.get(
+                "flush_delay", DEFAULT_COMPLETION_FLUSH_DELAY
+            ),
+        )
+
+        self.inline_timer = InlineHookTimer.from_config(
+            self.bot.loop, self.bot.config.get("inline_hooks", {})
+        )
 
     def _add_plugin(self, plugin: "Plugin"):
         self.plugins[plugin.file_path] = plugin
@@ -286,6 +325,9 @@ class PluginManager:
 
         # run on_start hooks
         for on_start_hook in plugin.hooks["on_start"]:
+            if on_start_hook.single_shard and not self.bot.is_primary_shard:
+                continue
+
             success = await self.launch(
                 on_start_hook, Event(bot=self.bot, hook=on_start_hook)
             )
@@ -314,8 +356,12 @@ class PluginManager:
             self._log_hook(on_cap_ack_hook)
 
         for periodic_hook in plugin.hooks["periodic"]:
+            if periodic_hook.single_shard and not self.bot.is_primary_shard:
+                logger.debug("Leaving %s to the first shard", periodic_hook)
+                continue
+
             task = async_util.wrap_future(self._start_periodic(periodic_hook))
-            plugin.tasks.append(task)
+            plugin.track_task(task)
             self._log_hook(periodic_hook)
 
         # register commands
@@ -358,11 +404,13 @@ class PluginManager:
         for regex_hook in plugin.hooks["regex"]:
             for regex_match in regex_hook.regexes:
                 self.regex_hooks.append((regex_match, regex_hook))
+            self._regex_prefilter = None
             self._log_hook(regex_hook)
 
         # register sieves
         for sieve_hook in plugin.hooks["sieve"]:
             self.sieves.append(sieve_hook)
+            self._clear_sieve_chains()
             self._log_hook(sieve_hook)
 
         # register connect hooks
@@ -382,6 +430,10 @@ class PluginManager:
             self.config_hooks.append(config_hook)
             self._log_hook(config_hook)
 
+        for complete_hook in plugin.hooks["hook_complete"]:
+            self.completion_hooks.append(complete_hook)
+            self._log_hook(complete_hook)
+
         for perm_hook in plugin.hooks["perm_check"]:
             for perm in perm_hook.perms:
                 self.perm_hooks[perm].append(perm_hook)
@@ -415,6 +467,7 @@ class PluginManager:
         _sort_dict(self.hook_hooks)
         _sort_dict(self.perm_hooks)
         _sort_list(self.config_hooks)
+        _sort_list(self.completion_hooks)
 
     async def unload_plugin(self, path):
         """
@@ -483,10 +536,16 @@ class PluginManager:
         for regex_hook in plugin.hooks["regex"]:
             for regex_match in regex_hook.regexes:
                 self.regex_hooks.remove((regex_match, regex_hook))
+            self._regex_prefilter = None
 
         # unregister sieves
         for sieve_hook in plugin.hooks["sieve"]:
             self.sieves.remove(sieve_hook)
+            self._clear_sieve_chains()
+
+        for chain_hook in list(self._sieve_chains):
+            if chain_hook.plugin is plugin:
+                self._drop_sieve_chain(chain_hook)
 
         # unregister connect hooks
         for connect_hook in plugin.hooks["on_connect"]:
@@ -501,6 +560,12 @@ class PluginManager:
         for config_hook in plugin.hooks["config"]:
             self.config_hooks.remove(config_hook)
 
+        for complete_hook in plugin.hooks["hook_complete"]:
+            self.completion_hooks.remove(complete_hook)
+
+        if not self.completion_hooks:
+            self._completions.clear()
+
         for perm_hook in plugin.hooks["perm_check"]:
             for perm in perm_hook.perms:
                 self.perm_hooks[perm].remove(perm_hook)
@@ -516,7 +581,7 @@ class PluginManager:
         task_count = len(plugin.tasks)
         if task_count > 0:
             logger.debug("Cancelling running tasks in %s", plugin.title)
-            for task in plugin.tasks:
+            for task in list(plugin.tasks):
                 task.cancel()
 
             logger.info("Cancelled %d tasks from %s", task_count, plugin.title)
@@ -529,6 +594,78 @@ class PluginManager:
 
         return True
 
+    @property
+    def regex_prefilter(self) -> RegexPrefilter:
+        """
+        The combined prefilter for all registered regex hooks, rebuilt on
+        first use after regex hooks are loaded or unloaded
+        """
+        if self._regex_prefilter is None:
+            self._regex_prefilter = RegexPrefilter(
+                regex for regex, _ in self.regex_hooks
+            )
+
+        return self._regex_prefilter
+
+    def _drop_sieve_chain(self, hook: Hook) -> None:
+        chain = self._sieve_chains.pop(hook, None)
+        if chain is not None:
+            # Keep the skip counts from the discarded chain
+            for sieve in chain.skipped:
+                sieve.skip_count += chain.launches
+
+    def _clear_sieve_chains(self) -> None:
+        for hook in list(self._sieve_chains):
+            self._drop_sieve_chain(hook)
+
+    def get_sieve_chain(self, hook: Hook) -> "SieveChain":
+        """
+        Get the sieves which apply to `hook`, in order. The chain is built on
+        the first launch of each hook and rebuilt whenever sieves are loaded
+        or unloaded.
+        """
+        try:
+            return self._sieve_chains[hook]
+        except KeyError:
+            pass
+
+        if hook.do_sieve and hook.type not in (
+            "on_start",
+            "on_stop",
+            "periodic",
+        ):
+            sieves = self.sieves
+        else:
+            sieves = []
+
+        chain = SieveChain(
+            [sieve for sieve in sieves if sieve.applies_to(hook)],
+            [sieve for sieve in sieves if not sieve.applies_to(hook)],
+        )
+        self._sieve_chains[hook] = chain
+        return chain
+
+    def sieve_stats(self) -> List[Tuple[SieveHook, int, int, float]]:
+        """
+        Get (sieve, launches, skips, estimated seconds saved) for each
+        loaded sieve
+        """
+        skips: Dict[SieveHook, int] = defaultdict(int)
+        for chain in self._sieve_chains.values():
+            for sieve in chain.skipped:
+                skips[sieve] += chain.launches
+
+        stats = []
+        for sieve in self.sieves:
+            skip_count = sieve.skip_count + skips[sieve]
+            saved = 0.0
+            if sieve.launch_count:
+                saved = skip_count * sieve.run_time / sieve.launch_count
+
+            stats.append((sieve, sieve.launch_count, skip_count, saved))
+
+        return stats
+
     def _log_hook(self, hook):
         """
         Logs registering a given hook
@@ -542,7 +679,7 @@ class PluginManager:
         event.prepare_threaded()
 
         try:
-            return call_with_args(hook.function, event)
+            return hook.binder(event)
         finally:
             event.close_threaded()
 
@@ -551,10 +688,22 @@ class PluginManager:
         await event.prepare()
 
         try:
-            return await call_with_args(hook.function, event)
+            return await hook.binder(event)
         finally:
             await event.close()
 
+    def _run_threaded(self, hook, func, *args):
+        """
+        Runs a sync hook function in an executor thread, timing the run if
+        the hook hasn't been placed yet
+        """
+        if hook.inline is None:
+            return self.bot.loop.run_in_executor(
+                None, self.inline_timer.run_timed, hook, func, *args
+            )
+
+        return self.bot.loop.run_in_executor(None, func, *args)
+
     async def internal_launch(self, hook, event):
         """
         Launches a hook with the data from [event]
@@ -563,25 +712,29 @@ class PluginManager:
         :return: a tuple of (ok, result) where ok is a boolean that determines if the hook ran without error and result
             is the result from the hook
         """
-        if hook.threaded:
-            coro = self.bot.loop.run_in_executor(
-                None, self._execute_hook_threaded, hook, event
-            )
-        else:
-            coro = self._execute_hook_sync(hook, event)
-
-        task = async_util.wrap_future(coro)
-        hook.plugin.tasks.append(task)
         try:
-            out = await task
+            if hook.inline:
+                out = self.inline_timer.run_inline(
+                    hook, self._execute_hook_threaded, hook, event
+                )
+            else:
+                if not hook.threaded:
+                    coro = self._execute_hook_sync(hook, event)
+                else:
+                    coro = self._run_threaded(
+                        hook, self._execute_hook_threaded, hook, event
+                    )
+
+                task = async_util.wrap_future(coro)
+                hook.plugin.track_task(task)
+                out = await task
+
             ok = True
         except Exception:
             logger.exception("Error in hook %s", hook.description)
             ok = False
             out = sys.exc_info()
 
-        hook.plugin.tasks.remove(task)
-
         return ok, out
 
     async def _execute_hook(self, hook, event):
@@ -590,6 +743,7 @@ class PluginManager:
 
         Returns False if the hook errored, True otherwise.
         """
+        start = time.perf_counter()
         ok, out = await self.internal_launch(hook, event)
         result, error = None, None
         if ok is True:
@@ -597,6 +751,14 @@ class PluginManager:
         else:
             error = out
 
+        self._record_completion(
+            hook, event, time.perf_counter() - start, result, error
+        )
+
+        await self._run_post_hooks(hook, event, result, error)
+        return ok
+
+    async def _run_post_hooks(self, hook, event, result, error):
         post_event = partial(
             PostHookEvent,
             launched_hook=hook,
@@ -613,22 +775,47 @@ class PluginManager:
             if success and res is False:
                 break
 
-        return ok
+    def _record_completion(self, hook, event, duration, result, error):
+        if self.completion_hooks:
+            self._completions.add(
+                HookCompletion(hook, event, duration, result, error)
+            )
 
-    async def _sieve(self, sieve, event, hook):
-        """ """
-        if sieve.threaded:
-            coro = self.bot.loop.run_in_executor(
-                None, sieve.function, self.bot, event, hook
+    def flush_completions(self) -> None:
+        """Deliver the buffered hook completion records now"""
+        self._completions.flush()
+
+    def _deliver_completions(self, records: List[HookCompletion]) -> None:
+        """Pass a batch of completion records to each hook_complete hook"""
+        for complete_hook in self.completion_hooks:
+            event = HookCompletionEvent(
+                bot=self.bot, hook=complete_hook, records=records
             )
-        else:
-            coro = sieve.function(self.bot, event, hook)
+            task = async_util.wrap_future(
+                self.internal_launch(complete_hook, event)
+            )
+            complete_hook.plugin.track_task(task)
 
+    async def _sieve(self, sieve, event, hook):
+        """ """
         result, error = None, None
-        task = async_util.wrap_future(coro)
-        sieve.plugin.tasks.append(task)
+        start = time.perf_counter()
         try:
-            result = await task
+            if sieve.inline:
+                result = self.inline_timer.run_inline(
+                    sieve, sieve.function, self.bot, event, hook
+                )
+            else:
+                if not sieve.threaded:
+                    coro = sieve.function(self.bot, event, hook)
+                else:
+                    coro = self._run_threaded(
+                        sieve, sieve.function, self.bot, event, hook
+                    )
+
+                task = async_util.wrap_future(coro)
+                sieve.plugin.track_task(task)
+                result = await task
         except Exception:
             logger.exception(
                 "Error running sieve %s on %s:",
@@ -637,24 +824,12 @@ class PluginManager:
             )
             error = sys.exc_info()
 
-        sieve.plugin.tasks.remove(task)
-
-        post_event = partial(
-            PostHookEvent,
-            launched_hook=sieve,
-            launched_event=event,
-            bot=event.bot,
-            conn=event.conn,
-            result=result,
-            error=error,
-        )
-        for post_hook in self.hook_hooks["post"]:
-            success, res = await self.internal_launch(
-                post_hook, post_event(hook=post_hook)
-            )
-            if success and res is False:
-                break
+        duration = time.perf_counter() - start
+        sieve.launch_count += 1
+        sieve.run_time += duration
+        self._record_completion(sieve, event, duration, result, error)
 
+        await self._run_post_hooks(sieve, event, result, error)
         return result
 
     async def _start_periodic(self, hook):
@@ -668,16 +843,14 @@ class PluginManager:
             await asyncio.sleep(interval)
 
     async def _launch(self, hook, event):
-        # we don't need sieves on on_start hooks.
-        if hook.do_sieve and hook.type not in (
-            "on_start",
-            "on_stop",
-            "periodic",
-        ):
-            for sieve in self.bot.plugin_manager.sieves:
-                event = await self._sieve(sieve, event, hook)
-                if event is None:
-                    return False
+        # on_start, on_stop, periodic and do_sieve=False hooks get an empty
+        # chain
+        chain = self.get_sieve_chain(hook)
+        chain.launches += 1
+        for sieve in chain.sieves:
+            event = await self._sieve(sieve, event, hook)
+            if event is None:
+                return False
 
         return await self._execute_hook(hook, event)
 
@@ -695,6 +868,20 @@ class PluginManager:
         return await self._launch(hook, event)
 
 
+class SieveChain:
+    """The sieves which apply to a hook, and the ones which were skipped"""
+
+    __slots__ = ("sieves", "skipped", "launches")
+
+    def __init__(
+        self, sieves: List[SieveHook], skipped: List[SieveHook]
+    ) -> None:
+        self.sieves = sieves
+        self.skipped = skipped
+        # Launches of the hook since this chain was built
+        self.launches = 0
+
+
 def _create_table(table: Table, bot):
     table.create(bot.db_engine, checkfirst=True)
 
@@ -706,7 +893,9 @@ class Plugin:
 
     def __init__(self, filepath, filename, title, code):
         """ """
-        self.tasks = []
+        # Running tasks, each removes itself when done
+        self.tasks: Set["asyncio.Future[Any]"] = set()
+        self.peak_tasks = 0
         self.file_path = filepath
         self.file_name = filename
         self.title = title
@@ -717,6 +906,18 @@ class Plugin:
         # Keep a reference to this in case another plugin needs to access it
         self.code = code
 
+    @property
+    def in_flight(self) -> int:
+        """The number of tasks currently running for this plugin"""
+        return len(self.tasks)
+
+    def track_task(self, task: "asyncio.Future[Any]") -> None:
+        """Track `task` until it finishes, so it can be cancelled on unload"""
+        tasks = self.tasks
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        self.peak_tasks = max(self.peak_tasks, len(tasks))
+
     async def create_tables(self, bot):
         """
         Creates all sqlalchemy Tables that are registered in this plugin
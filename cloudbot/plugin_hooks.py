@@ -1,9 +1,11 @@
 import asyncio
+import fnmatch
 import inspect
 import logging
-from typing import Union
+from typing import Optional, Tuple, Union
 
 from cloudbot.hook import Action, Priority
+from cloudbot.util.func_utils import ArgBinder
 
 logger = logging.getLogger("cloudbot")
 
@@ -28,6 +30,9 @@ class Hook:
             arg for arg in sig.parameters.keys() if not arg.startswith("_")
         ]
 
+        # Reads the function's arguments from an event
+        self.binder = ArgBinder(self.function)
+
         if asyncio.iscoroutine(self.function) or asyncio.iscoroutinefunction(
             self.function
         ):
@@ -35,6 +40,22 @@ class Hook:
         else:
             self.threaded = True
 
+        if self.threaded and "adb" in self.required_args:
+            logger.warning(
+                "Hook %s takes adb but isn't a coroutine, adb will be None",
+                self.description,
+            )
+
+        # Whether this sync hook runs directly on the event loop instead of
+        # in a thread, None leaves it to the plugin manager to decide by
+        # timing the hook's first few runs
+        inline = func_hook.kwargs.pop("inline", None)
+        if not self.threaded or (inline is None and "db" in self.required_args):
+            inline = False
+
+        self.inline: Optional[bool] = inline
+        self.inline_samples = 0
+
         self.permissions = func_hook.kwargs.pop("permissions", [])
         self.single_thread = func_hook.kwargs.pop("singlethread", False)
         self.action = func_hook.kwargs.pop("action", Action.CONTINUE)
@@ -138,10 +159,15 @@ class PeriodicHook(Hook):
             "initial_interval", interval
         )
 
+        # Whether only the first shard runs this hook, for jobs working on
+        # data shared by every shard
+        single_shard = periodic_hook.kwargs.pop("single_shard", False)
+
         super().__init__("periodic", plugin, periodic_hook)
 
         self.interval = interval
         self.initial_interval = initial_interval
+        self.single_shard = single_shard
 
     def __repr__(self):
         return "Periodic[interval: [{}], {}]".format(
@@ -174,11 +200,57 @@ class RawHook(Hook):
         )
 
 
+def _as_tuple(value) -> Optional[Tuple[str, ...]]:
+    if value is None:
+        return None
+
+    if isinstance(value, str):
+        return (value,)
+
+    return tuple(value)
+
+
 class SieveHook(Hook):
     def __init__(self, plugin, sieve_hook):
         """ """
+        kwargs = sieve_hook.kwargs
+        hook_types = _as_tuple(kwargs.pop("hook_types", None))
+        skip_hook_types = _as_tuple(kwargs.pop("skip_hook_types", None))
+        plugins = _as_tuple(kwargs.pop("plugins", None))
+        skip_plugins = _as_tuple(kwargs.pop("skip_plugins", None))
+
         super().__init__("sieve", plugin, sieve_hook)
 
+        # Hook types and plugin title patterns this sieve applies to,
+        # None meaning all of them
+        self.hook_types = hook_types
+        self.skip_hook_types = skip_hook_types or ()
+        self.plugins = plugins
+        self.skip_plugins = skip_plugins or ()
+
+        # Launch stats
+        self.launch_count = 0
+        self.skip_count = 0
+        self.run_time = 0.0
+
+    def applies_to(self, hook: Hook) -> bool:
+        """Whether this sieve needs to run before `hook`"""
+        if self.hook_types is not None and hook.type not in self.hook_types:
+            return False
+
+        if hook.type in self.skip_hook_types:
+            return False
+
+        title = hook.plugin.title
+        if self.plugins is not None and not any(
+            fnmatch.fnmatchcase(title, pattern) for pattern in self.plugins
+        ):
+            return False
+
+        return not any(
+            fnmatch.fnmatchcase(title, pattern) for pattern in self.skip_plugins
+        )
+
     def __repr__(self):
         return f"Sieve[{Hook.__repr__(self)}]"
 
@@ -210,7 +282,9 @@ class EventHook(Hook):
 class OnStartHook(Hook):
     def __init__(self, plugin, on_start_hook):
         """ """
+        single_shard = on_start_hook.kwargs.pop("single_shard", False)
         super().__init__("on_start", plugin, on_start_hook)
+        self.single_shard = single_shard
 
     def __repr__(self):
         return f"On_start[{Hook.__repr__(self)}]"
@@ -301,6 +375,19 @@ class PostHookHook(Hook):
         )
 
 
+class HookCompleteHook(Hook):
+    def __init__(self, plugin, complete_hook):
+        super().__init__("hook_complete", plugin, complete_hook)
+
+    def __repr__(self):
+        return f"HookComplete[{Hook.__repr__(self)}]"
+
+    def __str__(self):
+        return "hook_complete {} from {}".format(
+            self.function_name, self.plugin.file_name
+        )
+
+
 class ConfigHook(Hook):
     def __init__(self, plugin, out_hook):
         super().__init__("config", plugin, out_hook)
@@ -341,6 +428,7 @@ _hook_name_to_plugin = {
     "on_connect": OnConnectHook,
     "irc_out": IrcOutHook,
     "post_hook": PostHookHook,
+    "hook_complete": HookCompleteHook,
     "perm_check": PermHook,
     "config": ConfigHook,
 }
@@ -0,0 +1,344 @@
+"""
+Sharded run mode - The coordinator process runs each shard of the configured
+connections in its own process, and passes config reloads, admin log
+broadcasts and connection status between them
+"""
+
+import logging
+import logging.handlers
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cloudbot.util import async_util
+
+__all__ = (
+    "CONFIG_POLL_INTERVAL",
+    "RESTART_EXIT_CODE",
+    "STATUS_INTERVAL",
+    "ConnStatus",
+    "Coordinator",
+    "ShardLink",
+    "conn_status",
+    "setup_shard_logging",
+)
+
+logger = logging.getLogger("cloudbot")
+
+# Exit code a shard process uses to ask to be restarted
+RESTART_EXIT_CODE = 3
+
+# Seconds between the connection status updates each shard sends
+STATUS_INTERVAL = 10.0
+
+# Seconds between checks of the config file for changes
+CONFIG_POLL_INTERVAL = 1.0
+
+# Loggers whose records shards pass to the coordinator to write
+SHARD_LOGGERS = ("cloudbot", "plugins", "asyncio")
+
+# (name, connected, lag, lag warning threshold) for each connection in a shard
+ConnStatus = Tuple[str, bool, float, float]
+
+# Messages are tuples of a kind and its arguments:
+#   shard -> coordinator:
+#     ("admin_log", message)    log `message` on every other shard
+#     ("status", [ConnStatus])  this shard's connections
+#     ("reload_config",)        reload the config on every other shard
+#   coordinator -> shard:
+#     ("admin_log", message)
+#     ("status", index, [ConnStatus])
+#     ("reload_config",)
+
+
+def conn_status(conn) -> ConnStatus:
+    try:
+        warning = conn.config["ping_settings"]["warn"]
+    except LookupError:
+        warning = 120
+
+    return (
+        conn.name,
+        bool(conn.connected),
+        conn.memory.get("lag", 0),
+        warning,
+    )
+
+
+def setup_shard_logging(index: int, queue: Any) -> None:
+    """
+    Send this process's log records to the coordinator through `queue`, so
+    one process writes the log files
+    """
+    handler = logging.handlers.QueueHandler(queue)
+    handler.setFormatter(logging.Formatter(f"[shard {index}] %(message)s"))
+    for name in SHARD_LOGGERS:
+        log = logging.getLogger(name)
+        for old in list(log.handlers):
+            log.removeHandler(old)
+
+        log.addHandler(handler)
+
+
+class ShardLink:
+    """A shard's end of the pipe to the coordinator"""
+
+    def __init__(
+        self,
+        index: int,
+        count: int,
+        conn: multiprocessing.connection.Connection,
+    ) -> None:
+        self.index = index
+        self.count = count
+        self._conn = conn
+        self._lock = threading.Lock()
+        self.bot: Any = None
+        self._timer: Any = None
+        # Connection status of the other shards, by shard index
+        self.remote_status: Dict[int, List[ConnStatus]] = {}
+
+    def send(self, *message: Any) -> None:
+        """Send a message to the coordinator, safe to call from any thread"""
+        with self._lock:
+            try:
+                self._conn.send(message)
+            except (OSError, ValueError):
+                logger.debug("Unable to reach the coordinator", exc_info=True)
+
+    def attach(self, bot) -> None:
+        """Start handling coordinator messages on `bot`'s loop"""
+        self.bot = bot
+        bot.loop.add_reader(self._conn.fileno(), self._on_readable)
+        self.publish_status()
+
+    def detach(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if self.bot is not None:
+            self.bot.loop.remove_reader(self._conn.fileno())
+            self.bot = None
+
+    def publish_status(self) -> None:
+        """Send the status of this shard's connections, then every so often"""
+        self.send(
+            "status",
+            [conn_status(conn) for conn in self.bot.connections.values()],
+        )
+        self._timer = self.bot.loop.call_later(
+            STATUS_INTERVAL, self.publish_status
+        )
+
+    def _on_readable(self) -> None:
+        try:
+            while self._conn.poll():
+                self.handle(self._conn.recv())
+        except (EOFError, OSError):
+            logger.warning("Lost the connection to the coordinator")
+            self.bot.loop.remove_reader(self._conn.fileno())
+
+    def handle(self, message: Tuple[Any, ...]) -> None:
+        kind, *args = message
+        if kind == "admin_log":
+            for conn in self.bot.connections.values():
+                if conn.connected:
+                    conn.admin_log(args[0], console=False)
+        elif kind == "status":
+            index, conns = args
+            self.remote_status[index] = conns
+        elif kind == "reload_config":
+            async_util.wrap_future(self.bot.reload_config(), loop=self.bot.loop)
+        else:
+            logger.warning("Unknown message from the coordinator: %r", kind)
+
+
+class Coordinator:
+    """
+    Runs `count` shard processes and relays messages between them.
+
+    Each process calls `target(index, count, conn, log_queue)`, where `conn`
+    is its end of a pipe for a ShardLink and `log_queue` takes its log
+    records. Shards which exit with RESTART_EXIT_CODE are started again, and
+    the shards reload their config when the config file changes.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        target: Callable[..., None],
+        *,
+        config_path: Optional[Path] = None,
+    ) -> None:
+        self.count = count
+        self.target = target
+        self.config_path = config_path
+        self.stopping = False
+        self.procs: Dict[int, multiprocessing.Process] = {}
+        self.links: Dict[int, multiprocessing.connection.Connection] = {}
+        self.status: Dict[int, List[ConnStatus]] = {}
+        self.log_queue: Any = multiprocessing.Queue()
+        self._config_mtime = self._get_config_mtime()
+
+    def _get_config_mtime(self) -> Optional[float]:
+        if self.config_path is None:
+            return None
+
+        try:
+            return self.config_path.stat().st_mtime
+        except OSError:
+            return None
+
+    def start(self, index: int) -> None:
+        parent, child = multiprocessing.Pipe()
+        proc = multiprocessing.Process(
+            target=self.target,
+            args=(index, self.count, child, self.log_queue),
+            name=f"cloudbot-shard-{index}",
+        )
+        proc.start()
+        child.close()
+        self.procs[index] = proc
+        self.links[index] = parent
+        logger.info("Started shard %d (pid %s)", index, proc.pid)
+
+        # Catch a restarted shard up on the others
+        for other, conns in self.status.items():
+            if other != index:
+                self.send(index, ("status", other, conns))
+
+    def send(self, index: int, message: Tuple[Any, ...]) -> None:
+        try:
+            self.links[index].send(message)
+        except (KeyError, OSError, ValueError):
+            logger.debug("Unable to reach shard %d", index, exc_info=True)
+
+    def broadcast(
+        self, message: Tuple[Any, ...], exclude: Optional[int] = None
+    ) -> None:
+        for index in list(self.links):
+            if index != exclude:
+                self.send(index, message)
+
+    def relay(self, index: int, message: Tuple[Any, ...]) -> None:
+        """Handle a message from shard `index`"""
+        kind = message[0]
+        if kind in ("admin_log", "reload_config"):
+            self.broadcast(message, exclude=index)
+        elif kind == "status":
+            self.status[index] = message[1]
+            self.broadcast(("status", index, message[1]), exclude=index)
+        else:
+            logger.warning("Unknown message from shard %d: %r", index, kind)
+
+    def reload_config(self) -> None:
+        logger.info("Config changed, reloading it on every shard")
+        self.broadcast(("reload_config",))
+
+    def stop(self, signum: int) -> None:
+        self.stopping = True
+        if signum != signal.SIGINT:
+            # SIGINT from a terminal already reaches every shard
+            for proc in self.procs.values():
+                if proc.pid is not None:
+                    os.kill(proc.pid, signal.SIGINT)
+
+    def _read_links(self, ready: List[Any]) -> None:
+        for index, link in list(self.links.items()):
+            if link not in ready:
+                continue
+
+            try:
+                while link.poll():
+                    self.relay(index, link.recv())
+            except (EOFError, OSError):
+                # The shard has exited, its sentinel handles the rest
+                link.close()
+                del self.links[index]
+
+    def _check_config(self) -> None:
+        mtime = self._get_config_mtime()
+        if mtime != self._config_mtime:
+            self._config_mtime = mtime
+            if mtime is not None:
+                self.reload_config()
+
+    def _reap(self, exit_codes: Dict[int, Optional[int]]) -> None:
+        for index, proc in list(self.procs.items()):
+            if proc.is_alive():
+                continue
+
+            proc.join()
+            link = self.links.pop(index, None)
+            if link is not None:
+                link.close()
+
+            self.status.pop(index, None)
+            if proc.exitcode == RESTART_EXIT_CODE and not self.stopping:
+                self.start(index)
+                continue
+
+            logger.info("Shard %d stopped (exit code %s)", index, proc.exitcode)
+            exit_codes[index] = proc.exitcode
+            del self.procs[index]
+
+    def run(self) -> Dict[int, Optional[int]]:
+        """
+        Start the shards and wait for them all to stop
+
+        :return: The exit code of each shard
+        """
+        handlers = logging.getLogger("cloudbot").handlers
+        listener = logging.handlers.QueueListener(
+            self.log_queue, *handlers, respect_handler_level=True
+        )
+        listener.start()
+
+        # noinspection PyUnusedLocal
+        def on_signal(signum, frame):
+            self.stop(signum)
+
+        signums = [signal.SIGINT, signal.SIGTERM]
+        sighup = getattr(signal, "SIGHUP", None)
+        if sighup is not None:
+            signums.append(sighup)
+
+        def on_hup(signum, frame):
+            self.reload_config()
+
+        original_handlers = {
+            signum: signal.signal(
+                signum, on_hup if signum == sighup else on_signal
+            )
+            for signum in signums
+        }
+
+        exit_codes: Dict[int, Optional[int]] = {}
+        try:
+            for index in range(self.count):
+                self.start(index)
+
+            while self.procs:
+                ready = multiprocessing.connection.wait(
+                    [proc.sentinel for proc in self.procs.values()]
+                    + list(self.links.values()),
+                    timeout=CONFIG_POLL_INTERVAL,
+                )
+                self._read_links(ready)
+                self._check_config()
+                self._reap(exit_codes)
+        finally:
+            for signum, handler in original_handlers.items():
+                signal.signal(signum, handler)
+
+            for link in self.links.values():
+                link.close()
+
+            listener.stop()
+
+        return exit_codes
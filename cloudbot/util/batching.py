@@ -0,0 +1,64 @@
+"""
+Batching - Collects items to hand them on in batches instead of one at a time
+"""
+
+import asyncio
+from typing import Callable, Generic, List, Optional, TypeVar
+
+__all__ = ("Batcher",)
+
+T = TypeVar("T")
+
+
+class Batcher(Generic[T]):
+    """
+    Collects items and passes them to `deliver` as one list once `batch_size`
+    have been added, or `flush_delay` seconds after the first of them
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        deliver: Callable[[List[T]], None],
+        *,
+        batch_size: int,
+        flush_delay: float,
+    ) -> None:
+        self.loop = loop
+        self.deliver = deliver
+        self.batch_size = batch_size
+        self.flush_delay = flush_delay
+        self._items: List[T] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def scheduled(self) -> bool:
+        """Whether a delayed flush is waiting to run"""
+        return self._timer is not None
+
+    def add(self, item: T) -> None:
+        self._items.append(item)
+        if len(self._items) >= self.batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = self.loop.call_later(self.flush_delay, self.flush)
+
+    def clear(self) -> None:
+        """Drop the collected items without delivering them"""
+        self._cancel()
+        self._items.clear()
+
+    def flush(self) -> None:
+        """Deliver the collected items now"""
+        self._cancel()
+        items, self._items = self._items, []
+        if items:
+            self.deliver(items)
+
+    def _cancel(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
@@ -2,12 +2,28 @@
 database - contains variables set by cloudbot to be easily access
 """
 
-from sqlalchemy import MetaData
-from sqlalchemy.engine import Engine
+from typing import Optional
+
+from sqlalchemy import MetaData, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.ext.asyncio import AsyncSession as _AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import close_all_sessions, scoped_session, sessionmaker
 
-__all__ = ("metadata", "base", "Base", "Session", "configure")
+__all__ = (
+    "metadata",
+    "base",
+    "Base",
+    "Session",
+    "AsyncSession",
+    "configure",
+    "configure_async",
+    "async_url",
+    "create_async_db_engine",
+    "share_sqlite",
+)
 
 
 Base = declarative_base()
@@ -15,9 +31,75 @@ base = Base
 metadata: MetaData = Base.metadata
 Session = scoped_session(sessionmaker())
 
+# Sessions for the `adb` hook argument, only usable once configure_async() has
+# been given an engine. Objects aren't expired on commit, as reloading their
+# attributes would need to await the database.
+AsyncSession = sessionmaker(class_=_AsyncSession, expire_on_commit=False)
+
+# Milliseconds a SQLite connection waits for another process's write lock
+SQLITE_BUSY_TIMEOUT = 30000
+
+# The asyncio driver used for each database backend when the configured URL
+# doesn't name one
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+    "mysql": "aiomysql",
+    "mariadb": "aiomysql",
+}
+
 
 def configure(bind: Engine = None) -> None:
     metadata.bind = bind
     close_all_sessions()
     Session.remove()
     Session.configure(bind=bind)
+
+
+def configure_async(bind: Optional[AsyncEngine] = None) -> None:
+    AsyncSession.configure(bind=bind)
+
+
+def async_url(url: str) -> str:
+    """
+    Returns `url` with the asyncio driver for its backend,
+    eg. sqlite:///cloudbot.db becomes sqlite+aiosqlite:///cloudbot.db
+    """
+    parsed = make_url(url)
+    if "+" in parsed.drivername:
+        return url
+
+    driver = ASYNC_DRIVERS.get(parsed.drivername)
+    if driver is None:
+        raise ValueError(
+            f"No asyncio driver known for database {parsed.drivername!r}"
+        )
+
+    return str(parsed.set(drivername=f"{parsed.drivername}+{driver}"))
+
+
+def create_async_db_engine(url: str) -> AsyncEngine:
+    """
+    Create an asyncio engine for `url`, raises ImportError if its driver isn't
+    installed
+    """
+    return create_async_engine(async_url(url))
+
+
+def share_sqlite(
+    engine: Engine, busy_timeout: int = SQLITE_BUSY_TIMEOUT
+) -> None:
+    """
+    Set up a SQLite engine to share its file with other processes, switching
+    to WAL mode so readers don't block the writer, and waiting for the write
+    lock instead of failing with 'database is locked'
+    """
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        try:
+            cursor.execute(f"PRAGMA busy_timeout = {int(busy_timeout)}")
+            cursor.execute("PRAGMA journal_mode = WAL")
+        finally:
+            cursor.close()
@@ -0,0 +1,252 @@
+"""
+Event dispatching - Feeds incoming events to the bot through a bounded pool
+of workers instead of one task per event
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Optional,
+    Tuple,
+)
+
+__all__ = (
+    "DEFAULT_DETACH_TIMEOUT",
+    "DEFAULT_HIGH_WATER",
+    "DEFAULT_MAX_WORKERS",
+    "DEFAULT_ORDERED_COMMANDS",
+    "EventDispatcher",
+)
+
+logger = logging.getLogger("cloudbot")
+
+DEFAULT_MAX_WORKERS = 32
+
+# Seconds a worker waits on a single event before leaving it to finish in
+# the background and moving on to the next one
+DEFAULT_DETACH_TIMEOUT = 10.0
+
+# Queued events at which the connection stops reading until the queue drains
+DEFAULT_HIGH_WATER = 10000
+
+# Commands which update channel and user state, these are handled one at a
+# time in the order they were received
+DEFAULT_ORDERED_COMMANDS = frozenset(
+    {
+        "JOIN",
+        "PART",
+        "KICK",
+        "QUIT",
+        "NICK",
+        "MODE",
+        "ACCOUNT",
+        "CHGHOST",
+        "AWAY",
+        "301",  # RPL_AWAY
+        "311",  # RPL_WHOISUSER
+        "313",  # RPL_WHOISOPERATOR
+        "324",  # RPL_CHANNELMODEIS
+        "330",  # RPL_WHOISACCOUNT
+        "352",  # RPL_WHOREPLY
+        "353",  # RPL_NAMREPLY
+        "354",  # RPL_WHOSPCRPL
+        "366",  # RPL_ENDOFNAMES
+    }
+)
+
+_QueueItem = Tuple[float, Any]
+
+
+class _Worker:
+    __slots__ = ("detached",)
+
+    def __init__(self) -> None:
+        self.detached = False
+
+
+class EventDispatcher:
+    """
+    Queues events for `process` and runs them with at most `max_workers`
+    events in progress at once.
+
+    Events whose `irc_command` is in `ordered_commands` go through a separate
+    lane which handles them one at a time, in the order they were queued.
+
+    If a worker spends more than `detach_timeout` seconds on one event, it is
+    left to finish that event and a new worker takes over its queue, so hooks
+    which wait on later lines (CAP, SASL, WHO responses) can't stall it.
+
+    When a transport is attached, reading is paused once `high_water` events
+    are queued and resumed when the queue is half drained.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Any], Awaitable[Any]],
+        *,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        ordered_commands: Iterable[str] = DEFAULT_ORDERED_COMMANDS,
+        detach_timeout: Optional[float] = DEFAULT_DETACH_TIMEOUT,
+        high_water: int = DEFAULT_HIGH_WATER,
+    ) -> None:
+        self._process = process
+        self.loop = loop
+        self.max_workers = max(1, max_workers)
+        self.ordered_commands: FrozenSet[str] = frozenset(
+            cmd.upper() for cmd in ordered_commands
+        )
+        self.detach_timeout = detach_timeout
+        self.high_water = high_water
+
+        self._queue: Deque[_QueueItem] = deque()
+        self._ordered: Deque[_QueueItem] = deque()
+        self._workers = 0
+        self._ordered_running = False
+
+        self._transport: Any = None
+        self.paused = False
+
+        # Metrics
+        self.in_flight = 0
+        self.processed = 0
+        self.detached = 0
+        self.peak_depth = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of events waiting for a worker"""
+        return len(self._queue) + len(self._ordered)
+
+    @property
+    def workers(self) -> int:
+        """The number of running workers, including the ordered lane"""
+        return self._workers + self._ordered_running
+
+    def stats(self) -> Dict[str, Any]:
+        """A snapshot of the queue and worker metrics"""
+        return {
+            "queue_depth": self.queue_depth,
+            "peak_depth": self.peak_depth,
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "detached": self.detached,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "paused": self.paused,
+        }
+
+    def attach(self, transport) -> None:
+        """Apply flow control to `transport`"""
+        self._transport = transport
+        self.paused = False
+        self._check_flow()
+
+    def detach(self) -> None:
+        self._transport = None
+        self.paused = False
+
+    def put(self, event) -> None:
+        """Queue `event`, starting a worker for it if one is available"""
+        item = (time.monotonic(), event)
+        if event.irc_command in self.ordered_commands:
+            self._ordered.append(item)
+            if not self._ordered_running:
+                self._ordered_running = True
+                self._start(self._ordered)
+        else:
+            self._queue.append(item)
+            if self._workers < self.max_workers:
+                self._workers += 1
+                self._start(self._queue)
+
+        self.peak_depth = max(self.peak_depth, self.queue_depth)
+
+        self._check_flow()
+
+    def clear(self) -> int:
+        """Drop all queued events, returning how many were dropped"""
+        count = self.queue_depth
+        self._queue.clear()
+        self._ordered.clear()
+        self._check_flow()
+        return count
+
+    def _start(self, queue: Deque[_QueueItem]) -> None:
+        asyncio.ensure_future(self._drain(queue), loop=self.loop)
+
+    def _release(self, queue: Deque[_QueueItem]) -> None:
+        if queue is self._ordered:
+            self._ordered_running = False
+        else:
+            self._workers -= 1
+
+    def _check_flow(self) -> None:
+        if self._transport is None:
+            return
+
+        depth = self.queue_depth
+        if not self.paused and depth >= self.high_water:
+            self.paused = True
+            self._transport.pause_reading()
+        elif self.paused and depth <= self.high_water // 2:
+            self.paused = False
+            self._transport.resume_reading()
+
+    def _detach_worker(self, worker: _Worker, queue: Deque[_QueueItem]) -> None:
+        # The worker is stuck on an event, let it finish that event on its
+        # own and hand the rest of the queue to a new worker
+        worker.detached = True
+        self.detached += 1
+        self._release(queue)
+        if queue:
+            if queue is self._ordered:
+                self._ordered_running = True
+            else:
+                self._workers += 1
+
+            self._start(queue)
+
+    async def _drain(self, queue: Deque[_QueueItem]) -> None:
+        worker = _Worker()
+        loop = asyncio.get_running_loop()
+        try:
+            while queue and not worker.detached:
+                queued_at, event = queue.popleft()
+                self._check_flow()
+                now = time.monotonic()
+                lag = now - queued_at
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+
+                handle = None
+                if self.detach_timeout is not None:
+                    handle = loop.call_later(
+                        self.detach_timeout, self._detach_worker, worker, queue
+                    )
+
+                self.in_flight += 1
+                try:
+                    await self._process(event)
+                except Exception:
+                    logger.exception("Error occurred while processing event")
+                finally:
+                    self.in_flight -= 1
+                    self.processed += 1
+                    if handle is not None:
+                        handle.cancel()
+        finally:
+            if not worker.detached:
+                self._release(queue)
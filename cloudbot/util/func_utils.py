@@ -1,4 +1,6 @@
 import inspect
+from operator import attrgetter
+from typing import Any, Callable, Tuple
 
 
 class ParameterError(Exception):
@@ -12,15 +14,71 @@ class ParameterError(Exception):
         self.valid_args = list(valid_args)
 
 
-def call_with_args(func, arg_data):
+def get_arg_names(func) -> Tuple[str, ...]:
+    """
+    Get the names of the arguments `func` will be called with, skipping
+    arguments starting with "_"
+    """
     sig = inspect.signature(func, follow_wrapped=False)
+    return tuple(
+        key for key in sig.parameters.keys() if not key.startswith("_")
+    )
+
+
+def call_with_args(func, arg_data):
     try:
-        args = [
-            arg_data[key]
-            for key in sig.parameters.keys()
-            if not key.startswith("_")
-        ]
+        args = [arg_data[key] for key in get_arg_names(func)]
     except KeyError as e:
         raise ParameterError(e.args[0], arg_data.keys()) from e
 
     return func(*args)
+
+
+class ArgBinder:
+    """
+    Calls a function with its arguments read from the attributes of an
+    object, like call_with_args() but with the signature inspected once up
+    front
+    """
+
+    __slots__ = ("func", "arg_names", "_getter")
+
+    def __init__(self, func: Callable) -> None:
+        self.func = func
+        self.arg_names = get_arg_names(func)
+        self._getter: Callable[[Any], Tuple[Any, ...]]
+        if not self.arg_names:
+            self._getter = _no_args
+        elif len(self.arg_names) == 1:
+            self._getter = _single_getter(self.arg_names[0])
+        else:
+            self._getter = attrgetter(*self.arg_names)
+
+    def bind(self, arg_data) -> Tuple[Any, ...]:
+        """Get the arguments for the function from `arg_data`"""
+        try:
+            return self._getter(arg_data)
+        except AttributeError:
+            for name in self.arg_names:
+                try:
+                    getattr(arg_data, name)
+                except AttributeError as e:
+                    raise ParameterError(name, arg_data.keys()) from e
+
+            raise
+
+    def __call__(self, arg_data):
+        return self.func(*self.bind(arg_data))
+
+
+def _no_args(_arg_data) -> Tuple[Any, ...]:
+    return ()
+
+
+def _single_getter(name: str) -> Callable[[Any], Tuple[Any, ...]]:
+    getter = attrgetter(name)
+
+    def _get(arg_data):
+        return (getter(arg_data),)
+
+    return _get
@@ -0,0 +1,143 @@
+"""
+Inline hook timing - Decides which sync hooks are cheap enough to run directly
+on the event loop instead of handing each call off to a thread
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Iterable, Mapping
+
+__all__ = (
+    "DEFAULT_INLINE_CALIBRATION_RUNS",
+    "DEFAULT_INLINE_HOOK_TYPES",
+    "DEFAULT_INLINE_MAX_TIME",
+    "DEFAULT_INLINE_WATCHDOG",
+    "InlineHookTimer",
+)
+
+logger = logging.getLogger("cloudbot")
+
+# Hook types whose sync hooks are timed to decide whether they can run inline,
+# when inline_hooks.auto is enabled
+DEFAULT_INLINE_HOOK_TYPES = (
+    "irc_raw",
+    "event",
+    "irc_out",
+    "sieve",
+    "perm_check",
+    "post_hook",
+    "hook_complete",
+)
+
+# Runs to time before moving a hook onto the event loop
+DEFAULT_INLINE_CALIBRATION_RUNS = 10
+
+# Seconds a hook may take on every timed run and still be run inline, handing
+# the call off to a thread costs more than this
+DEFAULT_INLINE_MAX_TIME = 0.0005
+
+# Seconds an inline hook may block the event loop before it is moved back to
+# running in a thread
+DEFAULT_INLINE_WATCHDOG = 0.05
+
+
+class InlineHookTimer:
+    """
+    Times the threaded runs of hooks which haven't decided where to run yet
+    (`hook.inline is None`), and sets `hook.inline` once they have.
+
+    A hook of one of `hook_types` is moved onto the event loop after
+    `calibration_runs` runs which each took no more than `max_time` seconds.
+    Hooks of other types stay in a thread, as do hooks which ever ran longer.
+    An inline hook which blocks the loop for more than `watchdog` seconds is
+    moved back to a thread.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        *,
+        hook_types: Iterable[str] = (),
+        calibration_runs: int = DEFAULT_INLINE_CALIBRATION_RUNS,
+        max_time: float = DEFAULT_INLINE_MAX_TIME,
+        watchdog: float = DEFAULT_INLINE_WATCHDOG,
+    ) -> None:
+        self.loop = loop
+        self.hook_types = frozenset(hook_types)
+        self.calibration_runs = calibration_runs
+        self.max_time = max_time
+        self.watchdog = watchdog
+
+    @classmethod
+    def from_config(
+        cls, loop: asyncio.AbstractEventLoop, conf: Mapping[str, Any]
+    ) -> "InlineHookTimer":
+        """Create a timer from the inline_hooks config section"""
+        # Timing can't tell a hook which is usually fast from one which never
+        # blocks, so hooks only run inline when they ask to unless enabled
+        if conf.get("auto", False):
+            hook_types = conf.get("hook_types", DEFAULT_INLINE_HOOK_TYPES)
+        else:
+            hook_types = ()
+
+        return cls(
+            loop,
+            hook_types=hook_types,
+            calibration_runs=conf.get(
+                "calibration_runs", DEFAULT_INLINE_CALIBRATION_RUNS
+            ),
+            max_time=conf.get("max_time", DEFAULT_INLINE_MAX_TIME),
+            watchdog=conf.get("watchdog", DEFAULT_INLINE_WATCHDOG),
+        )
+
+    def calibrate(self, hook, duration: float) -> None:
+        """
+        Records one timed threaded run of an undecided hook, moving it onto
+        the event loop once enough runs have finished quickly
+        """
+        if hook.inline is not None:
+            return
+
+        if hook.type not in self.hook_types:
+            hook.inline = False
+            return
+
+        hook.inline_samples += 1
+        if duration > self.max_time:
+            hook.inline = False
+        elif hook.inline_samples >= self.calibration_runs:
+            hook.inline = True
+            logger.debug("Running %s inline", hook.description)
+
+    def run_timed(self, hook, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs a hook function in an executor thread, reporting how long it
+        took back to the event loop
+        """
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.loop.call_soon_threadsafe(
+                self.calibrate, hook, time.perf_counter() - start
+            )
+
+    def run_inline(self, hook, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs a hook function directly on the event loop, moving the hook back
+        to a thread if it blocks the loop for too long
+        """
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            duration = time.perf_counter() - start
+            if duration > self.watchdog:
+                hook.inline = False
+                logger.warning(
+                    "Hook %s blocked the event loop for %.3f seconds, "
+                    "running it in a thread from now on",
+                    hook.description,
+                    duration,
+                )
@@ -0,0 +1,242 @@
+"""
+Incoming line handling - Splits the raw stream from a server in to lines and
+decodes them, falling back to other codecs for lines which aren't UTF-8
+"""
+
+import codecs
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+__all__ = (
+    "DEFAULT_FALLBACK_CODECS",
+    "DEFAULT_MAX_LINE_LENGTH",
+    "DEFAULT_MAX_SENDER_CODECS",
+    "LineBuffer",
+    "LineDecoder",
+)
+
+DEFAULT_FALLBACK_CODECS = ("shift_jis", "cp1252")
+
+DEFAULT_MAX_SENDER_CODECS = 1024
+
+
+def _line_sender(data: bytes) -> Optional[bytes]:
+    """
+    Get the nick or server name from the prefix of a raw line
+
+    >>> _line_sender(b"@time=now :nick!user@host PRIVMSG #chan :hi")
+    b'nick'
+    >>> _line_sender(b"PING :server") is None
+    True
+    """
+    start = 0
+    if data.startswith(b"@"):
+        start = data.find(b" ") + 1
+        if not start:
+            return None
+
+    if data[start : start + 1] != b":":
+        return None
+
+    end = data.find(b" ", start)
+    if end < 0:
+        end = len(data)
+
+    sender = data[start + 1 : end]
+    for sep in (b"!", b"@"):
+        index = sender.find(sep)
+        if index >= 0:
+            sender = sender[:index]
+
+    return sender
+
+
+class LineDecoder:
+    """
+    Decodes raw lines, trying UTF-8 first and then each codec in
+    `fallback_codecs` in order.
+
+    With `remember_senders` set, the fallback codec that worked for a nick is
+    tried first on that nick's next line which isn't UTF-8.
+
+    `counts` tracks how many lines each path decoded, with "ascii" for the
+    fast path and "lossy" for lines no codec could decode.
+    """
+
+    def __init__(
+        self,
+        fallback_codecs: Iterable[str] = DEFAULT_FALLBACK_CODECS,
+        *,
+        remember_senders: bool = False,
+        max_senders: int = DEFAULT_MAX_SENDER_CODECS,
+    ) -> None:
+        self.fallback_codecs: Tuple[str, ...] = tuple(
+            codecs.lookup(codec).name for codec in fallback_codecs
+        )
+        self.remember_senders = remember_senders
+        self.max_senders = max_senders
+        self._sender_codecs: "OrderedDict[bytes, str]" = OrderedDict()
+        # The common paths are counted separately to keep them cheap
+        self._ascii_count = 0
+        self._utf8_count = 0
+        self._fallback_counts: Dict[str, int] = {}
+
+    @property
+    def counts(self) -> Counter:
+        """How many lines each codec path decoded"""
+        counts = Counter(self._fallback_counts)
+        if self._ascii_count:
+            counts["ascii"] = self._ascii_count
+
+        if self._utf8_count:
+            counts["utf-8"] = self._utf8_count
+
+        return counts
+
+    def decode(self, data: bytes) -> str:
+        try:
+            # The UTF-8 codec already has an ASCII fast path
+            text = data.decode("utf-8")
+        except UnicodeDecodeError:
+            return self._decode_fallback(data)
+
+        if len(text) == len(data):
+            self._ascii_count += 1
+        else:
+            self._utf8_count += 1
+
+        return text
+
+    def _decode_fallback(self, data: bytes) -> str:
+        sender = None
+        known = None
+        if self.remember_senders:
+            sender = _line_sender(data)
+            if sender is not None:
+                known = self._sender_codecs.get(sender)
+
+        if known is not None:
+            try:
+                text = data.decode(known)
+            except UnicodeDecodeError:
+                pass
+            else:
+                self._count(known)
+                self._sender_codecs.move_to_end(sender)
+                return text
+
+        for codec in self.fallback_codecs:
+            if codec == known:
+                continue
+
+            try:
+                text = data.decode(codec)
+            except UnicodeDecodeError:
+                continue
+
+            self._count(codec)
+            if sender is not None:
+                self._remember(sender, codec)
+
+            return text
+
+        self._count("lossy")
+        return data.decode("utf-8", errors="ignore")
+
+    def _count(self, codec: str) -> None:
+        counts = self._fallback_counts
+        counts[codec] = counts.get(codec, 0) + 1
+
+    def _remember(self, sender: bytes, codec: str) -> None:
+        codecs_by_sender = self._sender_codecs
+        codecs_by_sender[sender] = codec
+        codecs_by_sender.move_to_end(sender)
+        while len(codecs_by_sender) > self.max_senders:
+            codecs_by_sender.popitem(last=False)
+
+    def sender_codec(self, sender: str) -> Optional[str]:
+        """The fallback codec remembered for `sender`, if any"""
+        return self._sender_codecs.get(sender.encode("utf-8", "replace"))
+
+
+# 8191 bytes of IRCv3 message tags plus the 512 byte message body
+DEFAULT_MAX_LINE_LENGTH = 8191 + 512
+
+
+class LineBuffer:
+    """
+    Splits a stream of bytes in to lines terminated by CRLF or a bare LF.
+
+    Data is appended to a single bytearray and lines are sliced out of it
+    with a moving read offset, so each byte is only copied once when a large
+    burst is received. Lines longer than `max_line_length` (excluding the
+    terminator) are discarded.
+
+    >>> buffer = LineBuffer()
+    >>> buffer.feed(b"PING :a\\r\\nPING :b\\nPIN")
+    [b'PING :a', b'PING :b']
+    >>> buffer.feed(b"G :c\\r\\n")
+    [b'PING :c']
+    """
+
+    def __init__(self, max_line_length: int = DEFAULT_MAX_LINE_LENGTH) -> None:
+        self.max_line_length = max_line_length
+        self._buffer = bytearray()
+        # Offset to resume searching for a terminator from, everything
+        # before it is part of the current partial line
+        self._search_pos = 0
+        # Set while skipping the rest of an over-long line
+        self._discarding = False
+        # Total count of lines discarded for being too long
+        self.discarded = 0
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """
+        Add data to the buffer, returning any lines it completed
+        """
+        buffer = self._buffer
+        buffer += data
+        max_length = self.max_line_length
+        lines = []
+        pos = 0
+        with memoryview(buffer) as view:
+            end = buffer.find(b"\n", self._search_pos)
+            while end >= 0:
+                line_end = end
+                if line_end > pos and buffer[line_end - 1] == 0x0D:
+                    line_end -= 1
+
+                if self._discarding:
+                    self._discarding = False
+                elif line_end - pos > max_length:
+                    self.discarded += 1
+                else:
+                    lines.append(bytes(view[pos:line_end]))
+
+                pos = end + 1
+                end = buffer.find(b"\n", pos)
+
+        # Drop everything consumed by this call in one move
+        if pos:
+            del buffer[:pos]
+
+        if len(buffer) > max_length:
+            # An unterminated line is already too long, stop buffering it
+            buffer.clear()
+            if not self._discarding:
+                self._discarding = True
+                self.discarded += 1
+
+        self._search_pos = len(buffer)
+        return lines
+
+    def clear(self) -> None:
+        """
+        Discard any buffered partial line
+        """
+        self._buffer.clear()
+        self._search_pos = 0
+        self._discarding = False
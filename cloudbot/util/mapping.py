@@ -1,12 +1,25 @@
 import weakref
+from bisect import bisect_left, insort
 from collections import defaultdict
-from typing import TYPE_CHECKING, Generic, Optional, TypeVar, Union, cast
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
 
 __all__ = (
     "KeyFoldDict",
     "KeyFoldMixin",
     "KeyFoldWeakValueDict",
     "DefaultKeyFoldDict",
+    "PrefixIndexDict",
 )
 
 
@@ -106,3 +119,85 @@ class KeyFoldWeakValueDict(KeyFoldMixin, weakref.WeakValueDictionary):
     """
     KeyFolded WeakValueDictionary
     """
+
+
+class PrefixIndexDict(Dict[str, V]):
+    """
+    A dict which keeps a sorted index of its keys, allowing all keys starting
+    with a given prefix to be found with a binary search instead of a scan
+
+    >>> data = PrefixIndexDict(foo=1, foobar=2, bar=3)
+    >>> list(data.find_prefix("foo"))
+    [('foo', 1), ('foobar', 2)]
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__()
+        self._sorted_keys: List[str] = []
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key: str, value: V) -> None:
+        if key not in self:
+            insort(self._sorted_keys, key)
+
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        self._remove_key(key)
+
+    def _remove_key(self, key: str) -> None:
+        idx = bisect_left(self._sorted_keys, key)
+        del self._sorted_keys[idx]
+
+    def pop(self, key: str, *args) -> V:
+        """
+        Wraps `dict.pop`
+        """
+        if key in self:
+            self._remove_key(key)
+
+        return super().pop(key, *args)
+
+    def popitem(self) -> Tuple[str, V]:
+        """
+        Wraps `dict.popitem`
+        """
+        key, value = super().popitem()
+        self._remove_key(key)
+        return key, value
+
+    def clear(self) -> None:
+        """
+        Wraps `dict.clear`
+        """
+        super().clear()
+        self._sorted_keys.clear()
+
+    def setdefault(self, key: str, default=None):
+        """
+        Wraps `dict.setdefault`
+        """
+        if key not in self:
+            self[key] = default
+
+        return self[key]
+
+    def update(self, *args, **kwargs) -> None:
+        """
+        Wraps `dict.update`
+        """
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    def find_prefix(self, prefix: str) -> Iterator[Tuple[str, V]]:
+        """
+        Yields each (key, value) pair where the key starts with `prefix`,
+        in sorted key order
+        """
+        keys = self._sorted_keys
+        idx = bisect_left(keys, prefix)
+        while idx < len(keys) and keys[idx].startswith(prefix):
+            key = keys[idx]
+            yield key, self[key]
+            idx += 1
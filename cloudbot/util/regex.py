@@ -0,0 +1,285 @@
+"""
+Regex utilities - Helpers for matching text against many patterns at once
+"""
+
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Pattern, Tuple
+
+__all__ = ("RegexPrefilter", "required_literal")
+
+# Matches the body of a {m,n} repeat
+_REPEAT_RE = re.compile(r"\{(\d*)(?:,(\d*))?\}")
+
+# A parsed sequence is a list of the characters it requires in order, with
+# None in place of anything which isn't a required literal
+_Items = List[Optional[str]]
+
+
+def _skip_class(pattern: str, pos: int) -> int:
+    pos += 1
+    if pattern.startswith("^", pos):
+        pos += 1
+
+    if pattern.startswith("]", pos):
+        pos += 1
+
+    while pattern[pos] != "]":
+        pos += 2 if pattern[pos] == "\\" else 1
+
+    return pos + 1
+
+
+def _skip_ignored(pattern: str, pos: int, verbose: bool) -> int:
+    """Skip any comments, and whitespace in verbose patterns, at `pos`"""
+    while pos < len(pattern):
+        if pattern.startswith("(?#", pos):
+            pos = pattern.index(")", pos) + 1
+        elif verbose and pattern[pos].isspace():
+            pos += 1
+        elif verbose and pattern[pos] == "#":
+            end = pattern.find("\n", pos)
+            pos = len(pattern) if end < 0 else end + 1
+        else:
+            break
+
+    return pos
+
+
+def _parse_repeat(
+    pattern: str, pos: int, verbose: bool
+) -> Tuple[Optional[int], int]:
+    """Returns the minimum count of a repeat at `pos`, or None without one"""
+    # A repeat after a comment applies to the atom before the comment
+    end = _skip_ignored(pattern, pos, verbose)
+    char = pattern[end : end + 1]
+    if char in ("*", "?"):
+        min_count = 0
+        end += 1
+    elif char == "+":
+        min_count = 1
+        end += 1
+    elif char == "{" and _REPEAT_RE.match(pattern, end):
+        match = _REPEAT_RE.match(pattern, end)
+        min_count = int(match.group(1) or 0)
+        end = match.end()
+    else:
+        return None, pos
+
+    if pattern[end : end + 1] in ("?", "+"):
+        # Lazy or possessive repeat
+        end += 1
+
+    return min_count, end
+
+
+def _parse_group(pattern: str, pos: int, verbose: bool) -> Tuple[_Items, int]:
+    pos += 1
+    capture = True
+    if pattern.startswith("?", pos):
+        ext = pattern[pos + 1 : pos + 2]
+        if ext == ":":
+            capture = False
+            pos += 2
+        elif pattern.startswith("P<", pos + 1):
+            pos = pattern.index(">", pos) + 1
+        elif ext and ext in "aiLmsux-":
+            end = pos + 1
+            while pattern[end] not in ":)":
+                end += 1
+
+            if pattern[end] == ")":
+                # Global flags are already in the compiled pattern's flags
+                return [], end + 1
+
+            # Scoped flags change how the group matches, so skip it
+            flags = pattern[pos + 1 : end]
+            _, end, _ = _parse_seq(pattern, end + 1, verbose or "x" in flags)
+            return [None], end + 1
+        else:
+            # Lookarounds, conditionals and backreferences
+            _, end, _ = _parse_seq(pattern, pos + 1, verbose)
+            return [None], end + 1
+
+    items, end, alternation = _parse_seq(pattern, pos, verbose)
+    if alternation:
+        return [None], end + 1
+
+    if capture:
+        return [None, *items, None], end + 1
+
+    return items, end + 1
+
+
+def _parse_seq(
+    pattern: str, pos: int, verbose: bool
+) -> Tuple[_Items, int, bool]:
+    """
+    Parse the sequence starting at `pos` up to the end of its group, returns
+    the items, the end position and whether the sequence has alternatives
+    """
+    items: _Items = []
+    alternation = False
+    while True:
+        pos = _skip_ignored(pattern, pos, verbose)
+        if pos >= len(pattern) or pattern[pos] == ")":
+            break
+
+        char = pattern[pos]
+        atom: _Items
+        if char == "|":
+            alternation = True
+            items.append(None)
+            pos += 1
+            continue
+        elif char == "\\":
+            escaped = pattern[pos + 1 : pos + 2]
+            # Letter and digit escapes are classes, anchors or backreferences
+            atom = [None] if escaped.isalnum() else [escaped]
+            pos += 2
+        elif char == "[":
+            atom = [None]
+            pos = _skip_class(pattern, pos)
+        elif char == "(":
+            atom, pos = _parse_group(pattern, pos, verbose)
+        elif char in ".^$":
+            atom = [None]
+            pos += 1
+        else:
+            atom = [char]
+            pos += 1
+
+        min_count, pos = _parse_repeat(pattern, pos, verbose)
+        if min_count is None:
+            items.extend(atom)
+        elif min_count == 0:
+            items.append(None)
+        else:
+            # Required at least once, but the repeats break up the literal
+            items.extend((None, *atom, None))
+
+    return items, pos, alternation
+
+
+def _literal_runs(items: _Items) -> Iterator[str]:
+    run: List[str] = []
+    for char in items:
+        if char is not None:
+            run.append(char)
+        elif run:
+            yield "".join(run)
+            run = []
+
+    if run:
+        yield "".join(run)
+
+
+def required_literal(regex: Pattern) -> Optional[str]:
+    """
+    Find the longest literal string that must appear in any text the pattern
+    matches, or None if there isn't one. The literal is lowercased for
+    case-insensitive patterns.
+
+    This only reads the pattern source, so anything it doesn't understand is
+    treated as not requiring a literal.
+
+    >>> required_literal(re.compile(r"https?://(www\\.)?youtube\\.com/"))
+    'youtube.com/'
+    >>> required_literal(re.compile(r"foo|bar")) is None
+    True
+    """
+    if not isinstance(regex, re.Pattern) or not isinstance(regex.pattern, str):
+        return None
+
+    verbose = bool(regex.flags & re.VERBOSE)
+    try:
+        items, _, alternation = _parse_seq(regex.pattern, 0, verbose)
+    except (IndexError, ValueError):  # pragma: no cover
+        return None
+
+    if alternation:
+        return None
+
+    literal = max(_literal_runs(items), key=len, default=None)
+    if not literal:
+        return None
+
+    if regex.flags & re.IGNORECASE:
+        if not literal.isascii():
+            # Some non-ASCII characters match ASCII ones case-insensitively,
+            # which a substring check can't handle
+            return None
+
+        return literal.lower()
+
+    return literal
+
+
+class RegexPrefilter:
+    """
+    Rules out patterns which can't match a piece of text with a substring
+    check for a literal each pattern requires, so the full regex search only
+    runs for patterns which might match.
+
+    Patterns without a required literal are always treated as candidates.
+
+    >>> entries = [(re.compile("foo"), 1), (re.compile("(?i)bar"), 2)]
+    >>> prefilter = RegexPrefilter(regex for regex, _ in entries)
+    >>> [value for _, value in prefilter.iter_candidates(entries, "A BAR")]
+    [2]
+    """
+
+    def __init__(self, patterns: Iterable[Pattern]) -> None:
+        # Maps id(pattern) -> (literal, ignorecase)
+        self._literals: Dict[int, Tuple[str, bool]] = {}
+        # Keep a reference to each pattern so the ids stay valid
+        self._patterns: List[Pattern] = []
+        for regex in patterns:
+            if id(regex) in self._literals:
+                continue
+
+            literal = required_literal(regex)
+            if literal is None:
+                continue
+
+            ignorecase = bool(regex.flags & re.IGNORECASE)
+            self._literals[id(regex)] = (literal, ignorecase)
+            self._patterns.append(regex)
+
+    @property
+    def filtered_count(self) -> int:
+        """The number of patterns with a required literal to check"""
+        return len(self._patterns)
+
+    def is_filtered(self, regex: Any) -> bool:
+        """Whether `regex` has a required literal to check"""
+        return id(regex) in self._literals
+
+    def iter_candidates(
+        self, entries: Iterable[Tuple[Pattern, Any]], text: str
+    ) -> Iterator[Tuple[Pattern, Any]]:
+        """
+        Yields each (pattern, value) pair from `entries` whose pattern may
+        match `text`, preserving order
+        """
+        literals = self._literals
+        folded = None
+        for entry in entries:
+            try:
+                literal, ignorecase = literals[id(entry[0])]
+            except KeyError:
+                yield entry
+                continue
+
+            if not ignorecase:
+                if literal in text:
+                    yield entry
+            elif not text.isascii():
+                # Case-insensitive matching of non-ASCII text has special
+                # cases which str.lower() doesn't cover
+                yield entry
+            else:
+                if folded is None:
+                    folded = text.lower()
+
+                if literal in folded:
+                    yield entry
@@ -0,0 +1,285 @@
+"""
+Outgoing line scheduling - Paces the lines sent to a server with a token
+bucket so a burst of replies can't get the bot killed for flooding
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from enum import IntEnum
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from irclib.parser import Message
+
+from cloudbot.util.tokenbucket import TokenBucket
+
+__all__ = (
+    "DEFAULT_BURST",
+    "DEFAULT_COALESCE_LENGTH",
+    "DEFAULT_RATE",
+    "SendPriority",
+    "SendQueue",
+)
+
+# Lines which can be sent back to back before pacing starts
+DEFAULT_BURST = 5
+
+# Lines per second once the burst is used up
+DEFAULT_RATE = 1.0
+
+# Longest message text that queued messages will be merged into
+DEFAULT_COALESCE_LENGTH = 400
+
+COALESCE_SEPARATOR = " | "
+
+MESSAGE_COMMANDS = frozenset({"PRIVMSG", "NOTICE"})
+
+# Lines which skip the queue and the bucket entirely. A PONG stuck behind a
+# burst of JOINs or WHOs can get the bot disconnected for a ping timeout, and
+# a QUIT must not be dropped when the queue is cleared.
+URGENT_COMMANDS = frozenset({"PONG", "QUIT"})
+
+
+class SendPriority(IntEnum):
+    """Lines with a lower priority value are sent first"""
+
+    # JOIN, MODE and anything else which isn't a message
+    PROTOCOL = 0
+    # Messages to the admin log channel or other configured targets
+    ADMIN = 1
+    # Everything else, mostly replies to users
+    USER = 2
+
+
+class _QueuedLine:
+    __slots__ = ("line", "log", "queued_at")
+
+    def __init__(self, line: str, log: bool, queued_at: float) -> None:
+        self.line = line
+        self.log = log
+        self.queued_at = queued_at
+
+
+class SendQueue:
+    """
+    Passes lines to `send` no faster than a token bucket of `burst` lines
+    refilling at `rate` lines per second allows.
+
+    PONG and QUIT lines are always sent straight away. While lines are
+    waiting, protocol lines go first, then lines to
+    `admin_targets`, then everything else. Within a priority, targets take
+    turns so one busy channel can't hold up replies to the others.
+
+    With `coalesce` enabled, a PRIVMSG queued behind another PRIVMSG to the
+    same target is merged into it when the combined text fits in
+    `coalesce_length` characters.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, bool], Any],
+        *,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        burst: int = DEFAULT_BURST,
+        rate: float = DEFAULT_RATE,
+        admin_targets: Iterable[str] = (),
+        coalesce: bool = False,
+        coalesce_length: int = DEFAULT_COALESCE_LENGTH,
+    ) -> None:
+        self._send = send
+        self.loop = loop
+        self.bucket = TokenBucket(burst, rate)
+        self.admin_targets = frozenset(
+            target.casefold() for target in admin_targets
+        )
+        self.coalesce = coalesce
+        self.coalesce_length = coalesce_length
+
+        self._queues: "List[OrderedDict[str, Deque[_QueuedLine]]]" = [
+            OrderedDict() for _ in SendPriority
+        ]
+        self._depth = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        # Metrics
+        self.sent = 0
+        self.urgent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.peak_depth = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of lines waiting to be sent"""
+        return self._depth
+
+    def depths(self) -> Dict[SendPriority, int]:
+        """The number of lines waiting at each priority"""
+        return {
+            priority: sum(map(len, self._queues[priority].values()))
+            for priority in SendPriority
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """A snapshot of the queue metrics"""
+        return {
+            "queue_depth": self._depth,
+            "peak_depth": self.peak_depth,
+            "depths": {
+                priority.name.lower(): depth
+                for priority, depth in self.depths().items()
+            },
+            "sent": self.sent,
+            "urgent": self.urgent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "last_wait": self.last_wait,
+            "max_wait": self.max_wait,
+        }
+
+    @staticmethod
+    def _parse(line: str) -> Tuple[str, str]:
+        if line[:1] in ("@", ":"):
+            msg = Message.parse(line)
+            params = msg.parameters
+            return msg.command.upper(), params[0] if params else ""
+
+        command, _, rest = line.partition(" ")
+        return command.upper(), rest.split(" ", 1)[0]
+
+    def classify(self, line: str) -> Tuple[SendPriority, str]:
+        """Returns the priority and target of an outgoing line"""
+        return self._classify(*self._parse(line))
+
+    def _classify(self, command: str, target: str) -> Tuple[SendPriority, str]:
+        if command not in MESSAGE_COMMANDS:
+            return SendPriority.PROTOCOL, ""
+
+        if target.casefold() in self.admin_targets:
+            return SendPriority.ADMIN, target
+
+        return SendPriority.USER, target
+
+    def put(self, line: str, log: bool = True) -> None:
+        """Send `line` now if the bucket allows it, otherwise queue it"""
+        if not self._depth and self.bucket.consume(1):
+            # Nothing is waiting, so the line can skip the queue
+            self.sent += 1
+            self.last_wait = 0.0
+            self._send(line, log)
+            return
+
+        command, target = self._parse(line)
+        if command in URGENT_COMMANDS:
+            self.urgent += 1
+            self.sent += 1
+            self.last_wait = 0.0
+            self._send(line, log)
+            return
+
+        priority, target = self._classify(command, target)
+        queues = self._queues[priority]
+        queue = queues.get(target)
+        if queue is None:
+            queues[target] = queue = deque()
+        elif (
+            self.coalesce
+            and priority is not SendPriority.PROTOCOL
+            and self._merge(queue[-1], line, log)
+        ):
+            self.coalesced += 1
+            return
+
+        queue.append(_QueuedLine(line, log, time.monotonic()))
+        self._depth += 1
+        self.peak_depth = max(self.peak_depth, self._depth)
+
+        self._schedule()
+
+    def clear(self) -> int:
+        """Drop all queued lines, returning how many were dropped"""
+        count = self._depth
+        for queues in self._queues:
+            queues.clear()
+
+        self._depth = 0
+        self.dropped += count
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        return count
+
+    def reset(self) -> int:
+        """Drop all queued lines and refill the bucket for a new connection"""
+        count = self.clear()
+        self.bucket.refill()
+        return count
+
+    def _merge(self, item: _QueuedLine, line: str, log: bool) -> bool:
+        queued = Message.parse(item.line)
+        new = Message.parse(line)
+        if not (
+            queued.command == new.command == "PRIVMSG"
+            and len(queued.parameters) == len(new.parameters) == 2
+            and queued.tags == new.tags
+            and queued.prefix == new.prefix
+        ):
+            return False
+
+        target, old_text = queued.parameters
+        new_text = new.parameters[1]
+        if old_text.startswith("\1") or new_text.startswith("\1"):
+            # Never merge CTCPs
+            return False
+
+        text = old_text + COALESCE_SEPARATOR + new_text
+        if len(text) > self.coalesce_length:
+            return False
+
+        item.line = str(
+            Message(queued.tags, queued.prefix, "PRIVMSG", [target, text])
+        )
+        item.log = item.log or log
+        return True
+
+    def _pop(self) -> _QueuedLine:
+        for queues in self._queues:
+            if queues:
+                target, queue = next(iter(queues.items()))
+                item = queue.popleft()
+                if queue:
+                    # Let the other targets go before this one again
+                    queues.move_to_end(target)
+                else:
+                    del queues[target]
+
+                self._depth -= 1
+                return item
+
+        raise LookupError("Queue is empty")
+
+    def _schedule(self) -> None:
+        if self._timer is not None:
+            return
+
+        loop = self.loop or asyncio.get_event_loop()
+        missing = 1 - self.bucket.tokens
+        delay = max(missing / self.bucket.fill_rate, 0)
+        self._timer = loop.call_later(delay, self._drain)
+
+    def _drain(self) -> None:
+        self._timer = None
+        while self._depth and self.bucket.consume(1):
+            item = self._pop()
+            wait = time.monotonic() - item.queued_at
+            self.last_wait = wait
+            self.max_wait = max(self.max_wait, wait)
+
+            self.sent += 1
+            self._send(item.line, item.log)
+
+        if self._depth:
+            self._schedule()
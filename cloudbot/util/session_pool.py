@@ -0,0 +1,144 @@
+"""
+Database worker pool - Runs the database work of coroutine hooks on a bounded
+set of worker threads, so each hook's session stays bound to one thread
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+__all__ = (
+    "DEFAULT_POOL_SIZE",
+    "SessionPool",
+)
+
+logger = logging.getLogger("cloudbot")
+
+# A worker is held for the whole run of a hook, which may wait on IRC, so
+# leave room for plenty of those to run at once
+DEFAULT_POOL_SIZE = 50
+
+
+class SessionPool:
+    """
+    Hands out at most `size` single threaded executors, one per coroutine
+    hook using the database. When all of them are checked out, further hooks
+    share one overflow worker, which runs their database calls one at a time,
+    rather than waiting for a worker to be released.
+
+    Each hook opens its own session on the executor it was given, and only
+    uses it from that executor's thread.
+    """
+
+    def __init__(
+        self,
+        size: int = DEFAULT_POOL_SIZE,
+        *,
+        thread_name_prefix: str = "cloudbot-db",
+    ) -> None:
+        if size <= 0:
+            raise ValueError("size must be greater than 0")
+
+        self.size = size
+        self.thread_name_prefix = thread_name_prefix
+
+        self._workers: List[ThreadPoolExecutor] = []
+        self._free: List[ThreadPoolExecutor] = []
+        # When each checked out worker was handed out
+        self._checked_out: Dict[ThreadPoolExecutor, float] = {}
+        self._shared: Optional[ThreadPoolExecutor] = None
+
+        # Metrics
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.shared_users = 0
+        self.peak_shared_users = 0
+        self.checkouts = 0
+        self.saturated = 0
+        self.total_checkout = 0.0
+        self.max_checkout = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """A snapshot of the pool metrics"""
+        return {
+            "size": self.size,
+            "workers": len(self._workers),
+            "in_use": self.in_use,
+            "peak_in_use": self.peak_in_use,
+            "shared_users": self.shared_users,
+            "peak_shared_users": self.peak_shared_users,
+            "checkouts": self.checkouts,
+            "saturated": self.saturated,
+            "total_checkout": self.total_checkout,
+            "max_checkout": self.max_checkout,
+        }
+
+    def _new_worker(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=self.thread_name_prefix
+        )
+
+    def acquire(self) -> ThreadPoolExecutor:
+        """
+        Check out a worker, or the shared overflow worker if they are all in
+        use
+        """
+        self.checkouts += 1
+        if self._free:
+            executor = self._free.pop()
+        elif len(self._workers) < self.size:
+            executor = self._new_worker()
+            self._workers.append(executor)
+        else:
+            return self._acquire_shared()
+
+        self._checked_out[executor] = time.monotonic()
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        return executor
+
+    def _acquire_shared(self) -> ThreadPoolExecutor:
+        if self._shared is None:
+            self._shared = self._new_worker()
+
+        if not self.shared_users:
+            logger.warning(
+                "All %d database workers are in use, sharing one between "
+                "the hooks which start until one is released",
+                self.size,
+            )
+
+        self.saturated += 1
+        self.shared_users += 1
+        self.peak_shared_users = max(self.peak_shared_users, self.shared_users)
+        return self._shared
+
+    def release(self, executor: ThreadPoolExecutor) -> None:
+        """Return a worker to the pool"""
+        if executor is self._shared:
+            self.shared_users -= 1
+            return
+
+        acquired_at = self._checked_out.pop(executor, None)
+        if acquired_at is None:
+            # Already released
+            return
+
+        self.in_use -= 1
+        held = time.monotonic() - acquired_at
+        self.total_checkout += held
+        self.max_checkout = max(self.max_checkout, held)
+        self._free.append(executor)
+
+    def shutdown(self) -> None:
+        for executor in self._workers:
+            executor.shutdown(wait=False)
+
+        if self._shared is not None:
+            self._shared.shutdown(wait=False)
+            self._shared = None
+
+        self._workers.clear()
+        self._free.clear()
+        self._checked_out.clear()
@@ -0,0 +1,195 @@
+"""
+Write-behind buffering of the nick/user tracking data, used by user_tracking
+
+Author:
+    - linuxdaemon <linuxdaemon@snoonet.org>
+"""
+
+import string
+import threading
+
+from sqlalchemy import and_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+RFC_CASEMAP = str.maketrans(
+    dict(zip(string.ascii_uppercase + "[]\\", string.ascii_lowercase + "{}|"))
+)
+
+# Buffered rows which trigger a write before the next interval
+MAX_BUFFERED_ROWS = 1000
+
+# Dialects with an INSERT ... ON CONFLICT DO UPDATE statement
+UPSERT_DIALECTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+class UserDataBuffer:
+    """
+    Write-behind buffer for sightings of a nick's address, host or mask
+
+    Repeated sightings of the same (nick, value) pair are merged in memory,
+    and flush() writes everything buffered as bulk upserts in one
+    transaction. If the flush fails, the rows are put back in the buffer for
+    the next attempt. Rows which were written are recorded in `seen_cache`,
+    if one is given.
+    """
+
+    def __init__(self, max_size=MAX_BUFFERED_ROWS, seen_cache=None):
+        self.max_size = max_size
+        self.seen_cache = seen_cache
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._size = 0
+
+        # Metrics
+        self.merged = 0
+        self.flushed = 0
+        self.failed = 0
+
+    def __len__(self):
+        return self._size
+
+    def _merge(self, table, column_name, row):
+        rows = self._pending.setdefault((table, column_name), {})
+        key = (row["nick"], row[column_name])
+        old = rows.get(key)
+        if old is None:
+            rows[key] = row
+            self._size += 1
+            return
+
+        self.merged += 1
+        old["created"] = min(old["created"], row["created"])
+        if row["seen"] >= old["seen"]:
+            old["seen"] = row["seen"]
+            old["nick_case"] = row["nick_case"]
+
+    def add(self, table, column_name, now, nick, value):
+        """
+        Buffer a sighting of `nick` with `value`, returns True once the
+        buffer should be flushed
+        """
+        row = {
+            "nick": rfc_casefold(nick),
+            column_name: value,
+            "created": now,
+            "seen": now,
+            "reg": False,
+            "nick_case": nick,
+            folded_column(column_name): fold_value(value),
+        }
+
+        with self._lock:
+            self._merge(table, column_name, row)
+            return self._size >= self.max_size
+
+    def flush(self, db):
+        """Write all buffered rows, returns the number of rows written"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._size = 0
+
+        if not pending:
+            return 0
+
+        try:
+            for (table, column_name), rows in pending.items():
+                upsert_user_data(db, table, column_name, list(rows.values()))
+
+            db.commit()
+        except Exception:
+            db.rollback()
+            self.failed += 1
+            with self._lock:
+                for (table, column_name), rows in pending.items():
+                    for row in rows.values():
+                        self._merge(table, column_name, row)
+
+            raise
+
+        if self.seen_cache is not None:
+            for (table, column_name), rows in pending.items():
+                for row in rows.values():
+                    self.seen_cache.record(
+                        table, row["seen"], row["nick_case"], row[column_name]
+                    )
+
+        count = sum(map(len, pending.values()))
+        self.flushed += count
+        return count
+
+
+def upsert_rows(db, table, key_columns, rows):
+    """
+    Insert `rows` in to `table`, updating the seen time, nick case and
+    case-folded value of rows which already exist
+
+    :type db: sqlalchemy.orm.Session
+    :type table: Table
+    :type key_columns: list[str]
+    :type rows: list[dict]
+    """
+    update_columns = ["seen", "nick_case"]
+    update_columns.extend(
+        name
+        for name in table.c.keys()
+        if name.endswith("_cf") and name not in key_columns
+    )
+    dialect = db.get_bind().dialect.name
+    if dialect in UPSERT_DIALECTS:
+        stmt = UPSERT_DIALECTS[dialect](table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[name] for name in key_columns],
+            set_={name: stmt.excluded[name] for name in update_columns},
+        )
+        db.execute(stmt, rows)
+        return
+
+    if dialect == "mysql":
+        stmt = mysql.insert(table)
+        stmt = stmt.on_duplicate_key_update(
+            {name: stmt.inserted[name] for name in update_columns}
+        )
+        db.execute(stmt, rows)
+        return
+
+    # No native upsert, so try an update first and insert if it missed
+    for row in rows:
+        clause = and_(*(table.c[name] == row[name] for name in key_columns))
+        result = db.execute(
+            table.update()
+            .values({name: row[name] for name in update_columns})
+            .where(clause)
+        )
+        if not result.rowcount:
+            db.execute(table.insert().values(**row))
+
+
+def upsert_user_data(db, table, column_name, rows):
+    """
+    Insert `rows` in to `table`, updating the seen time and nick case of rows
+    which already exist
+
+    :type db: sqlalchemy.orm.Session
+    :type table: Table
+    :type column_name: str
+    :type rows: list[dict]
+    """
+    upsert_rows(db, table, ["nick", column_name], rows)
+
+
+def folded_column(column_name):
+    """The name of the indexed, case-folded copy of `column_name`"""
+    return column_name + "_cf"
+
+
+def fold_value(value):
+    """Case-fold a mask, host or address for reverse lookups"""
+    return value.lower()
+
+
+def rfc_casefold(text):
+    return text.translate(RFC_CASEMAP)
@@ -0,0 +1,234 @@
+"""
+Batched USERHOST/USERIP lookups for the nick/user tracking, used by
+user_tracking
+
+Author:
+    - linuxdaemon <linuxdaemon@snoonet.org>
+"""
+
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set
+
+from cloudbot.util.async_util import create_future
+from cloudbot.util.tokenbucket import TokenBucket
+from plugins._user_tracking_buffer import rfc_casefold
+
+# Nicks per USERHOST/USERIP command when the server doesn't advertise a limit
+# in TARGMAX, and the most we'll send even if it allows more
+DEFAULT_LOOKUP_BATCH = 5
+MAX_LOOKUP_BATCH = 20
+
+# Longest nick list we'll put in one command, to stay under the line limit
+MAX_LOOKUP_LENGTH = 400
+
+# Lookup settings, overridden by plugins.sherlock.lookup_batching in the
+# connection config
+DEFAULT_LOOKUP_BATCHING = {
+    # Commands waiting for a reply at once
+    "max_in_flight": 4,
+    # Commands sent per second, with bursts of up to `burst`
+    "rate": 2.0,
+    "burst": 4,
+    # Seconds to wait for the reply to a command
+    "timeout": 60,
+}
+
+# USERIP replies in the same format as USERHOST
+LOOKUP_REPLIES = {
+    "302": "USERHOST",
+    "340": "USERIP",
+}
+
+
+def parse_userhost_reply(irc_paramlist):
+    """
+    Returns a mapping of case-folded nick to host for each entry in a
+    USERHOST or USERIP reply
+    """
+    replies = {}
+    for response in irc_paramlist[-1].split():
+        nick, _, ident_host = response.lstrip(":").partition("=")
+        ident_host = ident_host[1:]  # strip the +/-
+        nick = nick.rstrip("*")  # strip the * which indicates oper status
+        _, _, host = ident_host.partition("@")
+        replies[rfc_casefold(nick)] = host.strip()
+
+    return replies
+
+
+class _LookupBatch:
+    __slots__ = ("nicks", "timer")
+
+    def __init__(self, nicks: Set[str]) -> None:
+        self.nicks = nicks
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class LookupBatcher:
+    """
+    Resolves USERHOST or USERIP lookups, packing as many nicks in to each
+    command as the server allows
+
+    Up to `max_in_flight` commands wait for a reply at once, and new ones are
+    sent at no more than `rate` per second. Each reply is matched to the
+    oldest waiting command which asked for the nicks in it. Nicks missing
+    from that reply resolve to None, and lookups in a command which gets no
+    matching reply within `timeout` seconds fail with asyncio.TimeoutError.
+    """
+
+    def __init__(
+        self,
+        conn,
+        command,
+        *,
+        batch_size=DEFAULT_LOOKUP_BATCH,
+        max_in_flight=DEFAULT_LOOKUP_BATCHING["max_in_flight"],
+        rate=DEFAULT_LOOKUP_BATCHING["rate"],
+        burst=DEFAULT_LOOKUP_BATCHING["burst"],
+        timeout=DEFAULT_LOOKUP_BATCHING["timeout"],
+    ):
+        self.conn = conn
+        self.command = command
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.bucket = TokenBucket(burst, rate)
+        # Nicks waiting to be sent
+        self._queue: Deque[str] = deque()
+        # The result of each pending lookup, by casefolded nick
+        self._futures: Dict[str, "asyncio.Future[Optional[str]]"] = {}
+        # Commands waiting for a reply, oldest first
+        self._in_flight: List[_LookupBatch] = []
+        self._retry_timer: Optional[asyncio.Handle] = None
+
+        # Metrics
+        self.sent = 0
+        self.resolved = 0
+        self.timeouts = 0
+
+    @property
+    def pending(self):
+        """The number of lookups waiting for a result"""
+        return len(self._futures)
+
+    def lookup(self, nick: str) -> "asyncio.Future[Optional[str]]":
+        """Returns a future for the result of looking up `nick`"""
+        nick_cf = rfc_casefold(nick)
+        fut = self._futures.get(nick_cf)
+        if fut is None:
+            self._futures[nick_cf] = fut = create_future(self.conn.loop)
+            self._queue.append(nick)
+            if self._retry_timer is None:
+                # Wait for the rest of this tick's lookups before sending
+                self._retry_timer = self.conn.loop.call_soon(self._retry)
+
+        return fut
+
+    def _next_batch(self) -> List[str]:
+        nicks: List[str] = []
+        length = 0
+        while self._queue and len(nicks) < self.batch_size:
+            nick = self._queue[0]
+            if nicks and length + len(nick) > MAX_LOOKUP_LENGTH:
+                break
+
+            self._queue.popleft()
+            nicks.append(nick)
+            length += len(nick) + 1
+
+        return nicks
+
+    def _pump(self):
+        loop = self.conn.loop
+        while self._queue and len(self._in_flight) < self.max_in_flight:
+            if not self.bucket.consume(1):
+                if self._retry_timer is None:
+                    delay = (1 - self.bucket.tokens) / self.bucket.fill_rate
+                    self._retry_timer = loop.call_later(delay, self._retry)
+
+                return
+
+            nicks = self._next_batch()
+            batch = _LookupBatch({rfc_casefold(nick) for nick in nicks})
+            batch.timer = loop.call_later(self.timeout, self._expire, batch)
+            self._in_flight.append(batch)
+            self.sent += 1
+            self.conn.cmd(self.command, *nicks)
+
+    def _retry(self):
+        self._retry_timer = None
+        self._pump()
+
+    def on_reply(self, replies):
+        """Resolve the lookups answered by a parsed reply"""
+        # An empty reply, or one about nicks we didn't ask for, can't be
+        # matched to a command, those are left to time out
+        for batch in self._in_flight:
+            if not batch.nicks.isdisjoint(replies):
+                break
+        else:
+            return
+
+        self._in_flight.remove(batch)
+        if batch.timer is not None:
+            batch.timer.cancel()
+        for nick_cf in batch.nicks:
+            fut = self._futures.pop(nick_cf, None)
+            if fut is not None and not fut.done():
+                fut.set_result(replies.get(nick_cf))
+                self.resolved += 1
+
+        self._pump()
+
+    def _expire(self, batch):
+        self._in_flight.remove(batch)
+        self.timeouts += 1
+        for nick_cf in batch.nicks:
+            fut = self._futures.pop(nick_cf, None)
+            if fut is not None and not fut.done():
+                fut.set_exception(asyncio.TimeoutError())
+
+        self._pump()
+
+
+def get_lookup_limit(conn, command):
+    """Returns the number of nicks the server accepts in one `command`"""
+    server_info = conn.memory.get("server_info", {})
+    targmax = server_info.get("isupport_tokens", {}).get("TARGMAX")
+    for token in (targmax or "").split(","):
+        name, _, limit = token.partition(":")
+        if name.upper() == command:
+            if not limit:
+                return MAX_LOOKUP_BATCH
+
+            return max(1, min(int(limit), MAX_LOOKUP_BATCH))
+
+    return DEFAULT_LOOKUP_BATCH
+
+
+def get_lookup_batcher(conn, command):
+    batchers = conn.memory["sherlock"].setdefault("batchers", {})
+    conf = (
+        conn.config.get("plugins", {})
+        .get("sherlock", {})
+        .get("lookup_batching", {})
+    )
+    try:
+        batcher = batchers[command]
+    except LookupError:
+        settings = {**DEFAULT_LOOKUP_BATCHING, **conf}
+        batchers[command] = batcher = LookupBatcher(
+            conn,
+            command,
+            max_in_flight=settings["max_in_flight"],
+            rate=settings["rate"],
+            burst=settings["burst"],
+            timeout=settings["timeout"],
+        )
+
+    # ISUPPORT may have changed since the batcher was made
+    batcher.batch_size = conf.get("batch_size") or get_lookup_limit(
+        conn, command
+    )
+    return batcher
@@ -0,0 +1,99 @@
+"""
+Retention of the nick/user tracking data, used by user_tracking
+
+Author:
+    - linuxdaemon <linuxdaemon@snoonet.org>
+"""
+
+import logging
+import time
+from typing import Optional, Set, Tuple
+
+from sqlalchemy import bindparam, select
+
+from plugins._user_tracking_buffer import folded_column, upsert_rows
+
+logger = logging.getLogger("cloudbot")
+
+
+def compact_table(
+    db, table, column_name, cutoff, *, chunk_size, archive=None, pause=0
+):
+    """
+    Move rows of `table` last seen before `cutoff` in to the `archive` table,
+    or just delete them if no archive table is given
+
+    Rows are moved `chunk_size` at a time, each chunk in its own short
+    transaction, oldest first.
+
+    :type db: sqlalchemy.orm.Session
+    :type table: Table
+    :type column_name: str
+    :type cutoff: datetime.datetime
+    :type archive: Optional[Table]
+    :return: The number of rows moved
+    """
+    value_col = table.c[column_name]
+    folded = table.c[folded_column(column_name)]
+    expired = (
+        select(
+            table.c.nick,
+            value_col.label("value"),
+            table.c.created,
+            table.c.seen,
+            table.c.nick_case,
+            folded.label("value_cf"),
+        )
+        .where(table.c.seen < cutoff)
+        .order_by(table.c.seen, table.c.nick, value_col)
+        .limit(chunk_size)
+    )
+    # Rows seen again since they were selected are left alone. Old rows may
+    # have NULL keys, which `==` would never match.
+    delete = (
+        table.delete()
+        .where(table.c.nick.is_not_distinct_from(bindparam("_nick")))
+        .where(value_col.is_not_distinct_from(bindparam("_value")))
+        .where(table.c.seen < cutoff)
+    )
+    count = 0
+    previous: Set[Tuple[Optional[str], Optional[str]]] = set()
+    while True:
+        rows = db.execute(expired).fetchall()
+        if not rows:
+            break
+
+        # Deleted rows can't be selected again, so finding any of the last
+        # chunk means the delete didn't match them. The delete's rowcount
+        # can't tell us this, not every driver reports it for executemany.
+        keys = {(row.nick, row.value) for row in rows}
+        stuck = keys & previous
+        if stuck:
+            logger.warning(
+                "Unable to remove expired rows from %s, stopping", table.name
+            )
+            count -= len(stuck)
+            break
+
+        # Rows missing a key can't be archived, they're just dropped
+        archived = [
+            {"kind": column_name, **row._mapping}
+            for row in rows
+            if row.nick is not None and row.value is not None
+        ]
+        if archive is not None and archived:
+            upsert_rows(db, archive, ["kind", "nick", "value"], archived)
+
+        db.execute(
+            delete, [{"_nick": row.nick, "_value": row.value} for row in rows]
+        )
+        db.commit()
+        count += len(rows)
+        if len(rows) < chunk_size:
+            break
+
+        previous = keys
+        if pause:
+            time.sleep(pause)
+
+    return count
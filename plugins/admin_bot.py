@@ -218,6 +218,9 @@ async def restart(text, bot):
 async def rehash_config(bot: CloudBot) -> str:
     """- Rehash config"""
     await bot.reload_config()
+    if bot.shard_link is not None:
+        bot.shard_link.send("reload_config")
+
     return "Config reloaded."
 
 
@@ -172,11 +172,14 @@ def format_attrs(obj: object, ignore_dunder: bool = False) -> Iterable[str]:
         yield f"{k} = {v!r}"
 
 
-@hook.post_hook()
-def on_hook_end(error, launched_hook, launched_event, admin_log):
-    if error is None:
-        return
+@hook.hook_complete()
+def on_hook_end(records):
+    for record in records:
+        if record.error is not None:
+            log_hook_error(record.error, record.hook, record.event)
 
+
+def log_hook_error(error, launched_hook, launched_event):
     should_broadcast = True
     messages = [
         "Error occurred in {}.{}".format(
@@ -215,4 +218,4 @@ def on_hook_end(error, launched_hook, launched_event, admin_log):
         messages.append(f"Error occurred while gathering error data {msg}")
 
     for message in messages:
-        admin_log(message, should_broadcast)
+        launched_event.admin_log(message, should_broadcast)
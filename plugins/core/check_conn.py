@@ -2,6 +2,7 @@ import asyncio
 import time
 
 from cloudbot import hook
+from cloudbot.shards import conn_status
 from cloudbot.util import colors
 
 
@@ -51,13 +52,11 @@ async def check_conns(bot):
 
 
 def format_conn(conn):
-    lag = conn.memory["lag"]
-    try:
-        warning = conn.config["ping_settings"]["warn"]
-    except LookupError:
-        warning = 120
+    return format_conn_status(*conn_status(conn))
 
-    if conn.connected:
+
+def format_conn_status(name, connected, lag, warning):
+    if connected:
         if lag >= warning:
             out = "$(yellow){name}$(clear) (lag: {activity} ms)"
         else:
@@ -65,9 +64,7 @@ def format_conn(conn):
     else:
         out = "$(red){name}$(clear)"
 
-    return colors.parse(
-        out.format(name=conn.name, activity=round(lag * 1000, 3))
-    )
+    return colors.parse(out.format(name=name, activity=round(lag * 1000, 3)))
 
 
 @hook.command(
@@ -75,8 +72,90 @@ def format_conn(conn):
 )
 def list_conns(bot):
     """- Lists all current connections and their status"""
-    conns = ", ".join(map(format_conn, bot.connections.values()))
-    return f"Current connections: {conns}"
+    conns = [format_conn(conn) for conn in bot.connections.values()]
+    if bot.shard_link is not None:
+        # Connections in the other shard processes, as of their last update
+        for _, statuses in sorted(bot.shard_link.remote_status.items()):
+            conns.extend(format_conn_status(*status) for status in statuses)
+
+    return "Current connections: {}".format(", ".join(conns))
+
+
+def format_dispatch(conn):
+    stats = conn.dispatcher.stats()
+    out = (
+        "{name}: {queued} queued (peak {peak}), {in_flight} in progress, "
+        "lag {lag} ms (max {max_lag} ms), {detached} detached"
+    ).format(
+        name=conn.name,
+        queued=stats["queue_depth"],
+        peak=stats["peak_depth"],
+        in_flight=stats["in_flight"],
+        lag=round(stats["last_lag"] * 1000, 3),
+        max_lag=round(stats["max_lag"] * 1000, 3),
+        detached=stats["detached"],
+    )
+    if stats["paused"]:
+        out += ", reading paused"
+
+    return out
+
+
+@hook.command("eventqueue", autohelp=False, permissions=["botcontrol"])
+def event_queue(bot):
+    """- Shows the incoming event queue for each connection"""
+    return "; ".join(
+        format_dispatch(conn)
+        for conn in bot.connections.values()
+        if hasattr(conn, "dispatcher")
+    )
+
+
+def format_send_queue(conn):
+    stats = conn.send_queue.stats()
+    depths = ", ".join(
+        f"{priority} {depth}" for priority, depth in stats["depths"].items()
+    )
+    return (
+        "{name}: {queued} queued ({depths}, peak {peak}), {sent} sent, "
+        "{coalesced} coalesced, wait {wait} ms (max {max_wait} ms)"
+    ).format(
+        name=conn.name,
+        queued=stats["queue_depth"],
+        depths=depths,
+        peak=stats["peak_depth"],
+        sent=stats["sent"],
+        coalesced=stats["coalesced"],
+        wait=round(stats["last_wait"] * 1000, 3),
+        max_wait=round(stats["max_wait"] * 1000, 3),
+    )
+
+
+@hook.command("sendqueue", autohelp=False, permissions=["botcontrol"])
+def send_queue(bot):
+    """- Shows the outgoing line queue for each connection"""
+    return "; ".join(
+        format_send_queue(conn)
+        for conn in bot.connections.values()
+        if getattr(conn, "send_queue", None) is not None
+    )
+
+
+@hook.command("codecstats", autohelp=False, permissions=["botcontrol"])
+def codec_stats(bot):
+    """- Shows how many incoming lines each codec decoded per connection"""
+    out = []
+    for conn in bot.connections.values():
+        if not hasattr(conn, "decoder"):
+            continue
+
+        counts = ", ".join(
+            f"{codec}: {count}"
+            for codec, count in conn.decoder.counts.most_common()
+        )
+        out.append(f"{conn.name}: {counts or 'no lines'}")
+
+    return "; ".join(out)
 
 
 @hook.connect()
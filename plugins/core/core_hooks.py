@@ -2,7 +2,7 @@ from cloudbot import hook
 from cloudbot.hook import Priority
 
 
-@hook.sieve(priority=Priority.LOWEST)
+@hook.sieve(priority=Priority.LOWEST, hook_types=["command"], inline=True)
 def cmd_autohelp(bot, event, _hook):
     if (
         _hook.type == "command"
@@ -16,7 +16,7 @@ def cmd_autohelp(bot, event, _hook):
     return event
 
 
-@hook.post_hook(priority=Priority.LOWEST)
+@hook.post_hook(priority=Priority.LOWEST, inline=True)
 def do_reply(result, error, launched_event, launched_hook):
     if launched_hook.type in ("sieve", "on_start", "on_stop"):
         return
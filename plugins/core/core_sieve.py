@@ -72,7 +72,7 @@ async def perm_sieve(
 
 
 # noinspection PyUnusedLocal
-@hook.sieve()
+@hook.sieve(hook_types=["command"])
 def check_disabled(
     bot: CloudBot, event: CommandEvent, _hook: Hook
 ) -> Optional[Event]:
@@ -89,7 +89,7 @@ def check_disabled(
 
 
 # noinspection PyUnusedLocal
-@hook.sieve()
+@hook.sieve(hook_types=["command", "regex"])
 def rate_limit(bot: CloudBot, event: Event, _hook: Hook) -> Optional[Event]:
     """
     Handle rate limiting certain hooks
@@ -40,21 +40,22 @@ def get_stats(bot):
     return stats
 
 
-@hook.post_hook(priority=Priority.HIGHEST)
-def stats_sieve(launched_event, error, bot, launched_hook):
-    chan = launched_event.chan
-    conn = launched_event.conn
-    status = "success" if error is None else "failure"
+@hook.hook_complete(priority=Priority.HIGHEST)
+def stats_sieve(records, bot):
     stats = get_stats(bot)
-    name = launched_hook.plugin.title + "." + launched_hook.function_name
-    stats["global"][name][status] += 1
-    if conn:
-        stats["network"][conn.name.casefold()][name][status] += 1
+    for record in records:
+        chan = record.event.chan
+        conn = record.event.conn
+        status = "success" if record.ok else "failure"
+        name = record.hook.plugin.title + "." + record.hook.function_name
+        stats["global"][name][status] += 1
+        if conn:
+            stats["network"][conn.name.casefold()][name][status] += 1
 
-        if chan:
-            stats["channel"][conn.name.casefold()][chan.casefold()][name][
-                status
-            ] += 1
+            if chan:
+                stats["channel"][conn.name.casefold()][chan.casefold()][name][
+                    status
+                ] += 1
 
 
 def do_basic_stats(data):
@@ -128,3 +129,61 @@ def hookstats(text, bot, notice_doc):
     table = gen_markdown_table(headers, data)
 
     return web.paste(table, "md", "hastebin")
+
+
+@hook.command(autohelp=False, permissions=["snoonetstaff", "botcontrol"])
+def sievestats(bot):
+    """- Get sieve launch counts and the time saved by skipping sieves which don't apply"""
+    table = [
+        (
+            sieve.plugin.title + "." + sieve.function_name,
+            str(launches),
+            str(skips),
+            f"{saved * 1000:.3f}",
+        )
+        for sieve, launches, skips, saved in sorted(
+            bot.plugin_manager.sieve_stats(),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+    ]
+    if not table:
+        return "No stats available."
+
+    headers = ("Sieve", "Launches", "Skipped", "Time Saved (ms)")
+    return web.paste(gen_markdown_table(headers, table), "md", "hastebin")
+
+
+@hook.command(autohelp=False, permissions=["snoonetstaff", "botcontrol"])
+def plugintasks(bot):
+    """- Get the number of running tasks for each plugin"""
+    plugins = sorted(
+        bot.plugin_manager.plugins.values(),
+        key=lambda plugin: (plugin.in_flight, plugin.peak_tasks),
+        reverse=True,
+    )
+    out = [
+        f"{plugin.title}: {plugin.in_flight} (peak {plugin.peak_tasks})"
+        for plugin in plugins
+        if plugin.peak_tasks
+    ]
+    if not out:
+        return "No tasks have run."
+
+    return ", ".join(out)
+
+
+@hook.command(autohelp=False, permissions=["snoonetstaff", "botcontrol"])
+def dbpool(bot):
+    """- Get the checkout and overflow counts for the database worker pool"""
+    stats = bot.db_executor_pool.stats()
+    return (
+        "{in_use}/{size} workers in use (peak {peak}), {shared_users} hooks "
+        "on the shared worker (peak {peak_shared}), {checkouts} checkouts, "
+        "{saturated} used the shared worker, longest checkout "
+        "{max_checkout:.3f}s".format(
+            peak=stats["peak_in_use"],
+            peak_shared=stats["peak_shared_users"],
+            **stats,
+        )
+    )
@@ -107,7 +107,7 @@ def is_ignored(conn, chan, mask):
 
 
 # noinspection PyUnusedLocal
-@hook.sieve(priority=50)
+@hook.sieve(priority=50, skip_hook_types=["irc_raw", "event"])
 async def ignore_sieve(bot, event, _hook):
     # don't block event hooks
     if _hook.type in ("irc_raw", "event"):
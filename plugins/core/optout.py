@@ -188,7 +188,7 @@ def load_cache(db):
 
 
 # noinspection PyUnusedLocal
-@hook.sieve(priority=Priority.HIGHEST)
+@hook.sieve(priority=Priority.HIGHEST, skip_plugins=["core.*"])
 def optout_sieve(bot, event, _hook):
     if not event.chan or not event.conn:
         return event
@@ -8,6 +8,7 @@ Author:
 import datetime
 import re
 import shlex
+import time
 import zlib
 from argparse import ArgumentParser
 from base64 import b64encode
@@ -15,21 +16,32 @@ from collections import defaultdict
 from contextlib import redirect_stderr, redirect_stdout
 from io import StringIO
 from operator import itemgetter
-from typing import Dict, List, Tuple
+from typing import Any, Dict, Iterable, List, Set, Tuple
 
 from requests import RequestException
-from sqlalchemy import column, func
+from sqlalchemy import column, literal, select, union_all
+from sqlalchemy.sql import Select
 
 from cloudbot import hook
 from cloudbot.util import colors, timeparse, web
 from cloudbot.util.formatting import chunk_str, get_text_list, pluralize_auto
 from plugins.user_tracking import (
     address_table,
+    fold_value,
+    folded_column,
     hosts_table,
     masks_table,
     rfc_casefold,
 )
 
+# Default limits on the rows read and seconds spent walking the tracking
+# tables for one query, set per connection in the query_budget config
+DEFAULT_MAX_ROWS = 100000
+DEFAULT_MAX_TIME = 30.0
+
+# Most values bound in one query, below SQLite's limit on query variables
+MAX_QUERY_PARAMS = 10000
+
 
 def format_list(name, data):
     begin = colors.parse(f"$(dgreen){name}$(clear): ")
@@ -177,40 +189,41 @@ def filter_seen(_query, last_seen):
     return _query
 
 
-def get_for_nicks(db, table, column_name, nicks, last_seen=None):
-    nicks = [row[0][0] for row in nicks]
-    _query = filter_seen(
-        table.select().where(table.c.nick.in_(nicks)), last_seen
+# The tables linking nicks to each kind of value
+VALUE_TABLES = {
+    "mask": masks_table,
+    "host": hosts_table,
+    "addr": address_table,
+}
+
+
+def _select_values(column_name, nicks, last_seen):
+    table = VALUE_TABLES[column_name]
+    return filter_seen(
+        select(
+            literal(column_name).label("kind"),
+            table.c[column_name].label("value"),
+            table.c.nick,
+            table.c.nick_case,
+            table.c.seen,
+        ).where(table.c.nick.in_(nicks)),
+        last_seen,
     )
 
-    results = db.execute(_query)
-
-    return [[row[column_name], row["seen"]] for row in results]
-
-
-def get_hosts_for_nicks(db, nicks, last_seen=None):
-    return get_for_nicks(db, hosts_table, "host", nicks, last_seen)
 
-
-def get_addrs_for_nicks(db, nicks, last_seen=None):
-    return get_for_nicks(db, address_table, "addr", nicks, last_seen)
-
-
-def get_masks_for_nicks(db, nicks, last_seen=None):
-    return get_for_nicks(db, masks_table, "mask", nicks, last_seen)
-
-
-def get_nicks(db, table, column_name, values, last_seen=None):
-    values = [v[0].lower() for v in values]
-    _query = filter_seen(
-        table.select().where(func.lower(table.c[column_name]).in_(values)),
+def _select_nicks(column_name, values, last_seen):
+    table = VALUE_TABLES[column_name]
+    return filter_seen(
+        select(
+            literal("nick").label("kind"),
+            table.c[column_name].label("value"),
+            table.c.nick,
+            table.c.nick_case,
+            table.c.seen,
+        ).where(table.c[folded_column(column_name)].in_(values)),
         last_seen,
     )
 
-    results = db.execute(_query)
-
-    return [((row["nick"], row["nick_case"]), row["seen"]) for row in results]
-
 
 CLOAK_STRIP_PREFIX_RE = re.compile(r"^(?i:Snoonet-|irc-)(.*)\.IP$")
 CLOAK_FORMATS = [
@@ -219,39 +232,34 @@ CLOAK_FORMATS = [
 ]
 
 
-def get_nicks_for_mask(db, mask, last_seen=None):
-    new_masks: List[Tuple[str, ...]] = []
-    for m in mask:
-        msk, *other = m
+def expand_cloaks(masks):
+    """Yield each mask, swapping cloaked masks for every cloak format"""
+    for msk in masks:
         cloak = CLOAK_STRIP_PREFIX_RE.match(msk)
         if not cloak:
-            new_masks.append(m)
+            yield msk
             continue
 
-        new_masks.extend(
-            (fmt.format(cloak=cloak.group(1)), *other) for fmt in CLOAK_FORMATS
-        )
-
-    return get_nicks(db, masks_table, "mask", new_masks, last_seen)
-
-
-def get_nicks_for_host(db, host, last_seen=None):
-    return get_nicks(db, hosts_table, "host", host, last_seen)
-
-
-def get_nicks_for_addr(db, addr, last_seen=None):
-    return get_nicks(db, address_table, "addr", addr, last_seen)
+        yield from (fmt.format(cloak=cloak.group(1)) for fmt in CLOAK_FORMATS)
 
 
 class QueryResults:
-    def __init__(self, nicks=(), masks=(), hosts=(), addrs=()):
+    def __init__(self, nicks=(), masks=(), hosts=(), addrs=(), truncated=None):
         self.nicks = list(nicks)
         self.masks = list(masks)
         self.hosts = list(hosts)
         self.addrs = list(addrs)
+        # Why the traversal stopped before reaching the requested depth
+        self.truncated = truncated
 
     def copy(self):
-        return type(self)(*(l.copy() for l in self))
+        return type(self)(
+            nicks=self.nicks,
+            masks=self.masks,
+            hosts=self.hosts,
+            addrs=self.addrs,
+            truncated=self.truncated,
+        )
 
     __copy__ = copy
 
@@ -270,27 +278,38 @@ class QueryResults:
         return self_copy
 
 
-def _query(db, nicks, masks, hosts, addrs, last_seen):
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _batch_unions(selects):
     """
-    :type db: sqlalchemy.orm.Session
+    Combine (bound parameters, select) pairs in to as few UNION ALL queries
+    as MAX_QUERY_PARAMS allows
     """
-    results = QueryResults()
+    batch: List[Select] = []
+    params = 0
+    for count, stmt in selects:
+        if batch and params + count > MAX_QUERY_PARAMS:
+            yield union_all(*batch)
+            batch = []
+            params = 0
 
-    if nicks:
-        results.masks.extend(get_masks_for_nicks(db, nicks, last_seen))
-        results.hosts.extend(get_hosts_for_nicks(db, nicks, last_seen))
-        results.addrs.extend(get_addrs_for_nicks(db, nicks, last_seen))
+        batch.append(stmt)
+        params += count
 
-    if masks:
-        results.nicks.extend(get_nicks_for_mask(db, masks, last_seen))
+    if batch:
+        yield union_all(*batch)
 
-    if hosts:
-        results.nicks.extend(get_nicks_for_host(db, hosts, last_seen))
 
-    if addrs:
-        results.nicks.extend(get_nicks_for_addr(db, addrs, last_seen))
+def _seed_values(values):
+    if not values:
+        return []
+    elif isinstance(values, str):
+        return [values]
 
-    return results
+    return [value for value, _seen in values]
 
 
 def query(
@@ -301,37 +320,114 @@ def query(
     addrs=None,
     last_seen=None,
     depth=0,
-    first=True,
+    *,
+    max_rows=None,
+    max_time=None,
 ):
-    def _to_list(var):
-        if not var:
-            return []
-        elif isinstance(var, str):
-            return [(var, datetime.datetime.now())]
-        return var
+    """
+    Walk the links between nicks and the masks, hosts and addresses they were
+    seen with, `depth` + 1 steps out from the starting values
 
-    nicks = _to_list(nicks)
-    masks = _to_list(masks)
-    hosts = _to_list(hosts)
-    addrs = _to_list(addrs)
+    Each step expands only the nicks and values found by the step before it
+    which haven't been expanded yet, using a single UNION query. The walk
+    stops early once `max_rows` rows have been read or after the first step
+    to finish past `max_time` seconds.
+
+    :type db: sqlalchemy.orm.Session
+    :rtype: QueryResults
+    """
+    start = time.monotonic()
 
-    if depth < 0:
-        return nicks, masks, hosts, addrs
+    if isinstance(nicks, str):
+        nicks = [((rfc_casefold(nicks), nicks), None)]
 
-    results = _query(db, nicks, masks, hosts, addrs, last_seen)
+    frontier_nicks = {nick_cf for (nick_cf, _nick), _seen in nicks or ()}
+    frontier_values = {
+        "mask": set(_seed_values(masks)),
+        "host": set(_seed_values(hosts)),
+        "addr": set(_seed_values(addrs)),
+    }
 
-    if not first:
-        results += (nicks, masks, hosts, addrs)
+    seen_nicks: Set[str] = set()
+    seen_values: Dict[str, Set[str]] = {name: set() for name in VALUE_TABLES}
+    found: Dict[str, Dict[Any, datetime.datetime]] = {
+        name: {} for name in ("nick", *VALUE_TABLES)
+    }
+    truncated = None
+    rows_read = 0
+
+    for _ in range(max(depth + 1, 0)):
+        # (bound parameters, select) for each lookup in this step
+        selects: List[Tuple[int, Select]] = []
+        new_nicks = list(frontier_nicks - seen_nicks)
+        seen_nicks.update(new_nicks)
+        for chunk in _chunks(new_nicks, MAX_QUERY_PARAMS // len(VALUE_TABLES)):
+            selects.extend(
+                (len(chunk), _select_values(name, chunk, last_seen))
+                for name in VALUE_TABLES
+            )
 
-    return query(
-        db,
-        results.nicks,
-        results.masks,
-        results.hosts,
-        results.addrs,
-        last_seen,
-        depth - 1,
-        False,
+        for name, frontier in frontier_values.items():
+            candidates: Iterable[str] = frontier
+            if name == "mask":
+                candidates = expand_cloaks(frontier)
+
+            new_values = {fold_value(value) for value in candidates}
+            new_values -= seen_values[name]
+            seen_values[name].update(new_values)
+            selects.extend(
+                (len(chunk), _select_nicks(name, chunk, last_seen))
+                for chunk in _chunks(list(new_values), MAX_QUERY_PARAMS)
+            )
+
+        if not selects:
+            break
+
+        frontier_nicks = set()
+        frontier_values = {name: set() for name in VALUE_TABLES}
+        for stmt in _batch_unions(selects):
+            if max_rows is not None:
+                stmt = stmt.limit(max_rows - rows_read)
+
+            for row in db.execute(stmt):
+                rows_read += 1
+                if row.kind == "nick":
+                    key = (row.nick, row.nick_case)
+                    frontier_nicks.add(row.nick)
+                else:
+                    key = row.value
+                    frontier_values[row.kind].add(row.value)
+
+                last_seen_at = found[row.kind]
+                if key not in last_seen_at or row.seen > last_seen_at[key]:
+                    last_seen_at[key] = row.seen
+
+            if max_rows is not None and rows_read >= max_rows:
+                break
+
+        if max_rows is not None and rows_read >= max_rows:
+            truncated = f"row limit of {max_rows} reached"
+            break
+
+        if max_time is not None and time.monotonic() - start > max_time:
+            truncated = f"time limit of {max_time} seconds reached"
+            break
+
+    return QueryResults(
+        nicks=found["nick"].items(),
+        masks=found["mask"].items(),
+        hosts=found["host"].items(),
+        addrs=found["addr"].items(),
+        truncated=truncated,
+    )
+
+
+def get_query_budget(conn):
+    """Returns the row and time limits for queries on `conn`"""
+    conf = conn.config["plugins"]["sherlock"].get("query_budget", {})
+    return (
+        conf.get("max_rows", DEFAULT_MAX_ROWS),
+        conf.get("max_time", DEFAULT_MAX_TIME),
     )
 
 
@@ -345,6 +441,8 @@ def query_and_format(
     depth=1,
     is_admin=False,
     paste=None,
+    max_rows=None,
+    max_time=None,
 ):
     def _to_list(_arg):
         if _arg is None:
@@ -384,9 +482,18 @@ def query_and_format(
         ((rfc_casefold(_nick), _nick), _seen) for _nick, _seen in __nicks
     ]
 
-    nicks, masks, hosts, addrs = query(
-        db, __nicks, __masks, __hosts, __addrs, last_seen, depth
+    results = query(
+        db,
+        __nicks,
+        __masks,
+        __hosts,
+        __addrs,
+        last_seen,
+        depth,
+        max_rows=max_rows,
+        max_time=max_time,
     )
+    nicks, masks, hosts, addrs = results
     end = datetime.datetime.now()
     query_time = end - start
     nicks = [(nick_case, time) for (_nick, nick_case), time in nicks]
@@ -430,6 +537,9 @@ def query_and_format(
         )
     )
 
+    if results.truncated:
+        lines += (f"Search stopped early, {results.truncated}.",)
+
     return lines
 
 
@@ -510,6 +620,7 @@ def new_check(conn, chan, triggered_command, text, db, reply):
             seconds=args.lastseen
         )
 
+    max_rows, max_time = get_query_budget(conn)
     return query_and_format(
         db,
         args.nick,
@@ -520,6 +631,8 @@ def new_check(conn, chan, triggered_command, text, db, reply):
         is_admin=admin,
         paste=paste,
         last_seen=last_seen,
+        max_rows=max_rows,
+        max_time=max_time,
     )
 
 
@@ -546,7 +659,15 @@ def check_command(conn, chan, text, db):
     else:
         last_time = None
 
-    return query_and_format(db, nick, last_seen=last_time, is_admin=admin)
+    max_rows, max_time = get_query_budget(conn)
+    return query_and_format(
+        db,
+        nick,
+        last_seen=last_time,
+        is_admin=admin,
+        max_rows=max_rows,
+        max_time=max_time,
+    )
 
 
 @hook.command("checkhost", "check2")
@@ -580,6 +701,7 @@ def check_host_command(db, conn, chan, text):
         hosts = None
         addrs = None
 
+    max_rows, max_time = get_query_budget(conn)
     return query_and_format(
         db,
         _masks=host_lower,
@@ -587,6 +709,8 @@ def check_host_command(db, conn, chan, text):
         _addrs=addrs,
         last_seen=last_time,
         is_admin=admin,
+        max_rows=max_rows,
+        max_time=max_time,
     )
 
 
@@ -9,26 +9,40 @@ import asyncio
 import datetime
 import logging
 import re
-import string
-from collections import defaultdict
+import threading
+import time
+from collections import OrderedDict, defaultdict
 from contextlib import suppress
 
-import sqlalchemy.exc
 from sqlalchemy import (
     Boolean,
     Column,
     DateTime,
+    Index,
     PrimaryKeyConstraint,
     Table,
     Text,
-    and_,
+    bindparam,
 )
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy import select, text
 
 from cloudbot import hook
 from cloudbot.event import EventType
 from cloudbot.util import database
 from cloudbot.util.async_util import create_future, wrap_future
-from cloudbot.util.backoff import Delayer
+from plugins._user_tracking_buffer import (
+    UserDataBuffer,
+    fold_value,
+    folded_column,
+    rfc_casefold,
+)
+from plugins._user_tracking_lookup import (
+    LOOKUP_REPLIES,
+    get_lookup_batcher,
+    parse_userhost_reply,
+)
+from plugins._user_tracking_retention import compact_table
 
 address_table = Table(
     "addrs",
@@ -39,7 +53,10 @@ address_table = Table(
     Column("seen", DateTime),
     Column("reg", Boolean, default=False),
     Column("nick_case", Text),
+    Column("addr_cf", Text),
     PrimaryKeyConstraint("nick", "addr"),
+    Index("ix_addrs_addr_cf", "addr_cf"),
+    Index("ix_addrs_seen", "seen"),
 )
 
 hosts_table = Table(
@@ -51,7 +68,10 @@ hosts_table = Table(
     Column("seen", DateTime),
     Column("reg", Boolean, default=False),
     Column("nick_case", Text),
+    Column("host_cf", Text),
     PrimaryKeyConstraint("nick", "host"),
+    Index("ix_hosts_host_cf", "host_cf"),
+    Index("ix_hosts_seen", "seen"),
 )
 
 masks_table = Table(
@@ -63,60 +83,303 @@ masks_table = Table(
     Column("seen", DateTime),
     Column("reg", Boolean, default=False),
     Column("nick_case", Text),
+    Column("mask_cf", Text),
     PrimaryKeyConstraint("nick", "mask"),
+    Index("ix_masks_mask_cf", "mask_cf"),
+    Index("ix_masks_seen", "seen"),
 )
 
-RFC_CASEMAP = str.maketrans(
-    dict(zip(string.ascii_uppercase + "[]\\", string.ascii_lowercase + "{}|"))
+# Rows moved out of the tables above by the retention job, kind is the name of
+# the value column they came from
+archive_table = Table(
+    "tracking_archive",
+    database.metadata,
+    Column("kind", Text),
+    Column("nick", Text),
+    Column("value", Text),
+    Column("created", DateTime),
+    Column("seen", DateTime),
+    Column("nick_case", Text),
+    Column("value_cf", Text),
+    PrimaryKeyConstraint("kind", "nick", "value"),
+    Index("ix_tracking_archive_value_cf", "value_cf"),
 )
 
 logger = logging.getLogger("cloudbot")
 
+# Seconds between writes of the buffered user data
+FLUSH_INTERVAL = 5
+
+# Recent sightings cache settings, overridden by
+# plugins.user_tracking.write_cache in the bot config
+DEFAULT_WRITE_CACHE = {
+    "enabled": True,
+    # Seconds after a write during which the same sighting isn't written again
+    "window": 5 * 60,
+    # Most sightings remembered, each takes a few hundred bytes
+    "max_entries": 50000,
+}
+
+# Rows filled in per transaction when adding the case-folded columns
+MIGRATION_CHUNK_SIZE = 1000
+
+# Seconds between runs of the retention job
+RETENTION_INTERVAL = 60 * 60
+
+# Retention settings, overridden by plugins.user_tracking.retention in the
+# bot config
+DEFAULT_RETENTION = {
+    "enabled": False,
+    # Rows not seen for this many days are moved out of the tracking tables
+    "days": 90,
+    # Keep a copy of the moved rows in the archive table
+    "archive": True,
+    # Rows moved per transaction, and seconds to wait between transactions so
+    # other writers can take the database lock
+    "chunk_size": 500,
+    "pause": 0.1,
+}
 
-def update_user_data(db, table, column_name, now, nick, value):
+# Seconds between progress reports while fetching the data for all users
+SYNC_PROGRESS_INTERVAL = 30
+
+
+def migrate_folded_column(db, table, column_name):
     """
+    Add the case-folded copy of `column_name` to a table created before it
+    existed, fill it in for the existing rows and create any missing indexes
+
     :type db: sqlalchemy.orm.Session
     :type table: Table
     :type column_name: str
-    :type now: datetime.datetime
-    :type nick: str
-    :type value: str
+    :return: The number of rows filled in
     """
+    bind = db.get_bind()
+    folded = table.c[folded_column(column_name)]
+    columns = {col["name"] for col in sa_inspect(bind).get_columns(table.name)}
+    if folded.name not in columns:
+        preparer = bind.dialect.identifier_preparer
+        db.execute(
+            text(
+                "ALTER TABLE {} ADD COLUMN {} {}".format(
+                    preparer.format_table(table),
+                    preparer.format_column(folded),
+                    folded.type.compile(bind.dialect),
+                )
+            )
+        )
+        db.commit()
+
+    value_col = table.c[column_name]
+    pending = (
+        select(table.c.nick, value_col)
+        .where(folded.is_(None))
+        .where(table.c.nick.isnot(None))
+        .where(value_col.isnot(None))
+        .limit(MIGRATION_CHUNK_SIZE)
+    )
+    fill = (
+        table.update()
+        .where(table.c.nick == bindparam("_nick"))
+        .where(value_col == bindparam("_value"))
+        .values({folded.name: bindparam("_folded")})
+    )
+    count = 0
+    while True:
+        rows = db.execute(pending).fetchall()
+        if not rows:
+            break
 
-    def _insert_or_update():
-        try:
-            db.execute(table.insert().values(**args))
-        except sqlalchemy.exc.IntegrityError:
-            db.rollback()
-            db.execute(
-                table.update().values(seen=now, nick_case=nick).where(clause)
+        db.execute(
+            fill,
+            [
+                {"_nick": nick, "_value": value, "_folded": fold_value(value)}
+                for nick, value in rows
+            ],
+        )
+        db.commit()
+        count += len(rows)
+
+    for index in table.indexes:
+        index.create(bind, checkfirst=True)
+
+    return count
+
+
+@hook.on_start(single_shard=True)
+def migrate_folded_columns(db):
+    for table, column_name in (
+        (address_table, "addr"),
+        (hosts_table, "host"),
+        (masks_table, "mask"),
+    ):
+        count = migrate_folded_column(db, table, column_name)
+        if count:
+            logger.info(
+                "[user_tracking] Filled in %s for %d rows in %s",
+                folded_column(column_name),
+                count,
+                table.name,
             )
-        finally:
-            db.commit()
 
-    nick_cf = rfc_casefold(nick)
-    clause = and_(
-        table.c.nick == nick_cf, getattr(table.c, column_name) == value
-    )
 
-    args = {
-        "nick": nick_cf,
-        column_name: value,
-        "created": now,
-        "seen": now,
-        "reg": False,
-        "nick_case": nick,
-    }
+def get_retention_config(bot):
+    conf = bot.config.get("plugins", {}).get("user_tracking", {})
+    return {**DEFAULT_RETENTION, **conf.get("retention", {})}
+
+
+@hook.periodic(RETENTION_INTERVAL, single_shard=True)
+def compact_user_data(bot, db):
+    conf = get_retention_config(bot)
+    if not conf["enabled"]:
+        return
+
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=conf["days"])
+    for table, column_name in (
+        (address_table, "addr"),
+        (hosts_table, "host"),
+        (masks_table, "mask"),
+    ):
+        count = compact_table(
+            db,
+            table,
+            column_name,
+            cutoff,
+            chunk_size=conf["chunk_size"],
+            archive=archive_table if conf["archive"] else None,
+            pause=conf["pause"],
+        )
+        if count:
+            logger.info(
+                "[user_tracking] Moved %d rows older than %d days out of %s",
+                count,
+                conf["days"],
+                table.name,
+            )
+
+
+class SeenCache:
+    """
+    LRU cache of recently written (nick, value) sightings per table
+
+    A sighting already written within the last `window` seconds doesn't need
+    its `seen` time refreshed again, so reconnect storms after a netsplit
+    don't turn in to bursts of identical upserts. At most `max_entries`
+    sightings are remembered, the least recently seen are dropped first.
+
+    Nicks are kept in their exact case, as a sighting with a different case
+    still needs to update the stored nick_case.
+    """
+
+    def __init__(
+        self,
+        window=DEFAULT_WRITE_CACHE["window"],
+        max_entries=DEFAULT_WRITE_CACHE["max_entries"],
+    ):
+        self.window = datetime.timedelta(seconds=window)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """A snapshot of the cache metrics"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def configure(self, window, max_entries):
+        with self._lock:
+            self.window = datetime.timedelta(seconds=window)
+            self.max_entries = max_entries
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def check(self, table, now, nick, value):
+        """Returns True if this sighting was written within the window"""
+        if self.max_entries <= 0:
+            return False
+
+        key = (table.name, nick, value)
+        with self._lock:
+            seen = self._entries.get(key)
+            if seen is not None and now - seen < self.window:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+
+            self.misses += 1
+            return False
+
+    def record(self, table, seen, nick, value):
+        """Remember a sighting which has been written to the database"""
+        if self.max_entries <= 0:
+            return
+
+        key = (table.name, nick, value)
+        with self._lock:
+            old = self._entries.get(key)
+            if old is None or seen > old:
+                self._entries[key] = seen
+
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
 
-    delayer = Delayer(2)
-    while True:
-        with delayer:
-            try:
-                _insert_or_update()
-            except sqlalchemy.exc.TimeoutError:
-                logger.warning("SQL timeout hit, trying again")
-            else:
-                break
+
+seen_cache = SeenCache()
+
+user_data = UserDataBuffer(seen_cache=seen_cache)
+
+
+def get_write_cache_config(bot):
+    conf = bot.config.get("plugins", {}).get("user_tracking", {})
+    return {**DEFAULT_WRITE_CACHE, **conf.get("write_cache", {})}
+
+
+@hook.on_start()
+@hook.config()
+def configure_seen_cache(bot):
+    conf = get_write_cache_config(bot)
+    if conf["enabled"]:
+        seen_cache.configure(conf["window"], conf["max_entries"])
+    else:
+        seen_cache.configure(0, 0)
+
+
+async def buffer_user_data(event, db, table, column_name, now, nick, value):
+    """Buffer a sighting, flushing the buffer if it is full"""
+    if seen_cache.check(table, now, nick, value):
+        return
+
+    if user_data.add(table, column_name, now, nick, value):
+        await event.async_call(user_data.flush, db)
+
+
+@hook.on_stop()
+@hook.periodic(FLUSH_INTERVAL)
+def flush_user_data(db):
+    count = user_data.flush(db)
+    if count:
+        logger.debug("[user_tracking] Wrote %d buffered user records", count)
 
 
 def _set_result(fut, result):
@@ -144,23 +407,10 @@ def get_regex(conn, name):
     return regex
 
 
-def rfc_casefold(text):
-    return text.translate(RFC_CASEMAP)
-
-
 def _handle_who_response(irc_paramlist):
     return irc_paramlist[5], irc_paramlist[3]
 
 
-def _handle_userhost_response(irc_paramlist):
-    response = irc_paramlist[1].lstrip(":")
-    nick, _, ident_host = response.partition("=")
-    ident_host = ident_host[1:]  # strip the +/-
-    nick = nick.rstrip("*")  # strip the * which indicates oper status
-    _, _, host = ident_host.partition("@")
-    return nick, host
-
-
 def _handle_whowas(irc_paramlist):
     return irc_paramlist[1], irc_paramlist[3]
 
@@ -174,11 +424,6 @@ def _handle_whowas_host(irc_paramlist):
 
 response_map = {
     "352": ("user_mask", _handle_who_response),
-    "302": ("user_host", _handle_userhost_response),
-    "340": (
-        "user_ip",
-        _handle_userhost_response,
-    ),  # USERIP responds with the same format as USERHOST
     "314": ("user_whowas_mask", _handle_whowas),
     "652": ("user_whowas_host", _handle_whowas_host),
 }
@@ -207,11 +452,13 @@ async def await_command_response(conn, name, cmd, nick):
 
 
 async def get_user_host(conn, nick):
-    return await await_command_response(conn, "user_host", "USERHOST", nick)
+    fut = get_lookup_batcher(conn, "USERHOST").lookup(nick)
+    return await asyncio.shield(fut)
 
 
 async def get_user_ip(conn, nick):
-    return await await_command_response(conn, "user_ip", "USERIP", nick)
+    fut = get_lookup_batcher(conn, "USERIP").lookup(nick)
+    return await asyncio.shield(fut)
 
 
 async def get_user_mask(conn, nick):
@@ -244,6 +491,20 @@ async def get_user_whowas(conn, nick):
         return None, None
 
 
+@hook.command("trackingcache", permissions=["botcontrol"], autohelp=False)
+def tracking_cache_stats():
+    """- Get the hit and miss counts for the recent sightings cache"""
+    stats = seen_cache.stats()
+    total = stats["hits"] + stats["misses"]
+    rate = stats["hits"] / total if total else 0
+    return (
+        "{entries}/{max_entries} sightings cached, {hits} writes skipped, "
+        "{misses} written ({rate:.1%} hit rate), {evictions} evicted".format(
+            rate=rate, **stats
+        )
+    )
+
+
 @hook.command("testdata", permissions=["botcontrol"])
 async def get_nick_data(conn, text):
     """<nick> - Get data for <nick> to debug"""
@@ -319,6 +580,18 @@ async def handle_response_numerics(conn, irc_command, irc_paramlist):
     _set_result(fut, value.strip())
 
 
+@hook.irc_raw(list(LOOKUP_REPLIES.keys()))
+async def handle_lookup_reply(conn, irc_command, irc_paramlist):
+    try:
+        batcher = conn.memory["sherlock"]["batchers"][
+            LOOKUP_REPLIES[irc_command]
+        ]
+    except LookupError:
+        return
+
+    batcher.on_reply(parse_userhost_reply(irc_paramlist))
+
+
 async def handle_snotice(db, event):
     conn = event.conn
     content = event.content
@@ -336,9 +609,11 @@ async def set_user_data(
     event, db, table, column_name, now, nick, value_func, conn=None
 ):
     value = await value_func(event.conn if conn is None else conn, nick)
-    await event.async_call(
-        update_user_data, db, table, column_name, now, nick, value
-    )
+    if value is None:
+        # The server didn't know the nick
+        return
+
+    await buffer_user_data(event, db, table, column_name, now, nick, value)
 
 
 async def on_nickchange(db, event, match):
@@ -386,6 +661,9 @@ async def on_nickchange(db, event, match):
         try:
             value = await value_func(event.conn, new_nick)
         except (asyncio.TimeoutError, asyncio.CancelledError):
+            value = None
+
+        if value is None:
             value = await asyncio.wait_for(futs[name], 300)
 
         del futs[name]
@@ -394,12 +672,8 @@ async def on_nickchange(db, event, match):
             _set_result(old_futs[name], value)
 
         await asyncio.gather(
-            event.async_call(
-                update_user_data, db, table, name, now, old_nick, value
-            ),
-            event.async_call(
-                update_user_data, db, table, name, now, new_nick, value
-            ),
+            buffer_user_data(event, db, table, name, now, old_nick, value),
+            buffer_user_data(event, db, table, name, now, new_nick, value),
         )
 
     async def _do_mask():
@@ -421,8 +695,8 @@ async def on_nickchange(db, event, match):
                     _set_result(old_futs["mask"], mask)
 
                 await asyncio.gather(
-                    event.async_call(
-                        update_user_data,
+                    buffer_user_data(
+                        event,
                         db,
                         hosts_table,
                         "host",
@@ -430,8 +704,8 @@ async def on_nickchange(db, event, match):
                         old_nick,
                         host,
                     ),
-                    event.async_call(
-                        update_user_data,
+                    buffer_user_data(
+                        event,
                         db,
                         hosts_table,
                         "host",
@@ -439,8 +713,8 @@ async def on_nickchange(db, event, match):
                         new_nick,
                         host,
                     ),
-                    event.async_call(
-                        update_user_data,
+                    buffer_user_data(
+                        event,
                         db,
                         masks_table,
                         "mask",
@@ -448,8 +722,8 @@ async def on_nickchange(db, event, match):
                         old_nick,
                         mask,
                     ),
-                    event.async_call(
-                        update_user_data,
+                    buffer_user_data(
+                        event,
                         db,
                         masks_table,
                         "mask",
@@ -492,24 +766,21 @@ async def on_user_connect(db, event, match):
         try:
             value = await value_func(event.conn, nick)
         except (asyncio.TimeoutError, asyncio.CancelledError):
+            value = None
+
+        if value is None:
             value = await futs[name]
 
         del futs[name]
 
-        await event.async_call(
-            update_user_data, db, table, name, now, nick, value
-        )
+        await buffer_user_data(event, db, table, name, now, nick, value)
 
     async def _do_mask():
         await _handle_set(masks_table, "mask", get_user_mask)
 
     await asyncio.gather(
-        event.async_call(
-            update_user_data, db, hosts_table, "host", now, nick, host
-        ),
-        event.async_call(
-            update_user_data, db, address_table, "addr", now, nick, addr
-        ),
+        buffer_user_data(event, db, hosts_table, "host", now, nick, host),
+        buffer_user_data(event, db, address_table, "addr", now, nick, addr),
         _do_mask(),
     )
 
@@ -556,17 +827,13 @@ async def on_user_quit(db, event, match):
             with suppress(KeyError):
                 _set_result(old_futs["mask"], mask)
 
-            await event.async_call(
-                update_user_data, db, masks_table, "mask", now, nick, mask
+            await buffer_user_data(
+                event, db, masks_table, "mask", now, nick, mask
             )
 
     await asyncio.gather(
-        event.async_call(
-            update_user_data, db, hosts_table, "host", now, nick, host
-        ),
-        event.async_call(
-            update_user_data, db, address_table, "addr", now, nick, addr
-        ),
+        buffer_user_data(event, db, hosts_table, "host", now, nick, host),
+        buffer_user_data(event, db, address_table, "addr", now, nick, addr),
         _do_whowas(),
     )
 
@@ -610,6 +877,17 @@ async def on_who_end(conn, irc_paramlist):
     _set_result(fut, lines)
 
 
+def report_sync_progress(event, done, total, start):
+    elapsed = time.monotonic() - start
+    msg = f"Fetched {done}/{total} user lookups in {elapsed:.0f}s"
+    if done:
+        msg += f", about {elapsed * (total - done) / done:.0f}s left"
+
+    logger.info("[user_tracking] %s", msg)
+    if hasattr(event, "triggered_command"):
+        event.notice(msg)
+
+
 @hook.on_start()
 async def get_initial_data(bot, loop, db, event):
     wrap_future(
@@ -667,43 +945,29 @@ async def get_initial_connection_data(conn, loop, db, event):
         _, _, realname = realname.partition(" ")
         users.append((nick, host))
 
-    futs = [
-        wrap_future(
-            event.async_call(
-                update_user_data, db, masks_table, "mask", now, nick, mask
-            )
-        )
-        for nick, mask in users
-    ]
+    for nick, mask in users:
+        await buffer_user_data(event, db, masks_table, "mask", now, nick, mask)
 
-    for nick, _ in users:
-        await asyncio.gather(
-            ignore_timeout(
-                set_user_data(
-                    event,
-                    db,
-                    hosts_table,
-                    "host",
-                    now,
-                    nick,
-                    get_user_host,
-                    conn,
-                )
-            ),
+    # Queue every lookup at once so the batchers can fill each command
+    pending = {
+        asyncio.ensure_future(
             ignore_timeout(
                 set_user_data(
-                    event,
-                    db,
-                    address_table,
-                    "addr",
-                    now,
-                    nick,
-                    get_user_ip,
-                    conn,
+                    event, db, table, column_name, now, nick, value_func, conn
                 )
-            ),
+            )
         )
-
-    await asyncio.gather(*futs)
-
-    return "Done."
+        for nick, _ in users
+        for table, column_name, value_func in (
+            (hosts_table, "host", get_user_host),
+            (address_table, "addr", get_user_ip),
+        )
+    }
+    total = len(pending)
+    start = time.monotonic()
+    while pending:
+        _, pending = await asyncio.wait(pending, timeout=SYNC_PROGRESS_INTERVAL)
+        if pending:
+            report_sync_progress(event, total - len(pending), total, start)
+
+    return f"Done, {total} lookups in {time.monotonic() - start:.1f}s."
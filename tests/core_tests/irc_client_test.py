@@ -1,14 +1,16 @@
 import asyncio
 from asyncio import CancelledError
 from typing import TYPE_CHECKING, Any, Dict
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import pytest
+from irclib.parser import Message
 
 from cloudbot.client import ClientConnectError
 from cloudbot.clients import irc
 from cloudbot.event import Event, EventType
 from cloudbot.util import async_util
+from cloudbot.util.func_utils import ArgBinder
 from tests.util.async_mock import AsyncMock
 
 if TYPE_CHECKING:
@@ -50,6 +52,87 @@ def test_send_closed(event_loop):
         TestLineParsing.wait_tasks(client)
 
 
+def test_dispatch_config():
+    bot = MagicMock()
+    client = irc.IrcClient(
+        bot,
+        "irc",
+        "foo",
+        "bar",
+        config={
+            "connection": {"server": "server"},
+            "dispatch": {
+                "workers": 4,
+                "ordered_commands": ["join"],
+                "detach_timeout": 1,
+                "high_water": 100,
+            },
+        },
+    )
+    dispatcher = client.dispatcher
+    assert dispatcher.max_workers == 4
+    assert dispatcher.ordered_commands == {"JOIN"}
+    assert dispatcher.detach_timeout == 1
+    assert dispatcher.high_water == 100
+
+
+def test_decoder_config():
+    bot = MagicMock()
+    client = irc.IrcClient(
+        bot,
+        "irc",
+        "foo",
+        "bar",
+        config={
+            "connection": {
+                "server": "server",
+                "fallback_codecs": ["latin-1"],
+                "remember_sender_codecs": True,
+            },
+        },
+    )
+    assert client.decoder.fallback_codecs == ("iso8859-1",)
+    assert client.decoder.remember_senders
+
+
+def test_send_queue_config():
+    bot = MagicMock()
+    client = irc.IrcClient(
+        bot,
+        "irc",
+        "foo",
+        "bar",
+        config={
+            "connection": {"server": "server"},
+            "log_channel": "#log",
+            "send_queue": {
+                "enabled": True,
+                "burst": 10,
+                "rate": 2,
+                "admin_targets": ["#Ops"],
+                "coalesce": True,
+            },
+        },
+    )
+    queue = client.send_queue
+    assert queue is not None
+    assert queue.bucket.capacity == 10
+    assert queue.bucket.fill_rate == 2
+    assert queue.admin_targets == {"#ops", "#log"}
+    assert queue.coalesce
+
+    client = irc.IrcClient(
+        bot,
+        "irc",
+        "foo",
+        "bar",
+        config={
+            "connection": {"server": "server"},
+        },
+    )
+    assert client.send_queue is None
+
+
 class TestLineParsing:
     @staticmethod
     def wait_tasks(conn, cancel=False):
@@ -97,6 +180,7 @@ class TestLineParsing:
                 "content_raw": None,
                 "db": None,
                 "db_executor": None,
+                "adb": None,
                 "hook": None,
                 "host": "",
                 "irc_command": "COMMAND",
@@ -117,6 +201,7 @@ class TestLineParsing:
                 "content_raw": "hi",
                 "db": None,
                 "db_executor": None,
+                "adb": None,
                 "hook": None,
                 "host": "",
                 "irc_command": "PRIVMSG",
@@ -150,6 +235,7 @@ class TestLineParsing:
                 "content_raw": None,
                 "db": None,
                 "db_executor": None,
+                "adb": None,
                 "hook": None,
                 "host": "",
                 "irc_command": "CMD",
@@ -170,6 +256,7 @@ class TestLineParsing:
                 "content_raw": "hi",
                 "db": None,
                 "db_executor": None,
+                "adb": None,
                 "hook": None,
                 "host": "",
                 "irc_command": "PRIVMSG",
@@ -195,6 +282,42 @@ class TestLineParsing:
         ]
         assert conn.mock_calls == [("describe_server", (), {})]
 
+    def test_line_too_long(self, caplog_bot, event_loop):
+        conn, out, proto = self.make_proto(event_loop)
+        proto._input_buffer.max_line_length = 30
+        proto.data_received(
+            b":server.host PRIVMSG me :this line is too long\r\n"
+            b":server.host PRIVMSG me :hi\n"
+        )
+
+        self.wait_tasks(conn)
+
+        assert [event["irc_raw"] for event in out] == [
+            ":server.host PRIVMSG me :hi"
+        ]
+        assert caplog_bot.record_tuples == [
+            (
+                "cloudbot",
+                30,
+                "[testconn] Discarded IRC line longer than 30 bytes from "
+                "server.name:port",
+            )
+        ]
+
+    def test_ordered_lines(self, caplog_bot, event_loop):
+        conn, out, proto = self.make_proto(event_loop)
+        proto.data_received(
+            b"".join(b":nick%d!user@host JOIN #chan\r\n" % i for i in range(50))
+        )
+        assert proto._dispatcher.queue_depth == 50
+
+        self.wait_tasks(conn)
+
+        assert [event["nick"] for event in out] == [
+            "nick%d" % i for i in range(50)
+        ]
+        assert proto._dispatcher.processed == 50
+
     def test_pong(self, caplog_bot, event_loop):
         conn, _, proto = self.make_proto(event_loop)
         proto.data_received(b":server PING hi\r\n")
@@ -214,6 +337,7 @@ class TestLineParsing:
             "content_raw": None,
             "db": None,
             "db_executor": None,
+            "adb": None,
             "hook": None,
             "host": "",
             "irc_command": "COMMAND",
@@ -243,6 +367,7 @@ class TestLineParsing:
             "content_raw": "this is a message",
             "db": None,
             "db_executor": None,
+            "adb": None,
             "hook": None,
             "host": "host",
             "irc_command": "PRIVMSG",
@@ -272,6 +397,7 @@ class TestLineParsing:
             "content_raw": "\x01ACTION this is an action\x01",
             "db": None,
             "db_executor": None,
+            "adb": None,
             "hook": None,
             "host": "host",
             "irc_command": "PRIVMSG",
@@ -302,6 +428,7 @@ class TestLineParsing:
             "content_raw": "\x01VERSION\x01",
             "db": None,
             "db_executor": None,
+            "adb": None,
             "hook": None,
             "host": "host",
             "irc_command": "PRIVMSG",
@@ -330,6 +457,7 @@ class TestLineParsing:
             "content_raw": "\x01VERSION\x01aa",
             "db": None,
             "db_executor": None,
+            "adb": None,
             "hook": None,
             "host": "host",
             "irc_command": "PRIVMSG",
@@ -365,6 +493,7 @@ class TestLineParsing:
             "content_raw": "\x02some text\x0faa",
             "db": None,
             "db_executor": None,
+            "adb": None,
             "hook": None,
             "host": "host",
             "irc_command": "PRIVMSG",
@@ -393,6 +522,7 @@ class TestLineParsing:
             "content_raw": None,
             "db": None,
             "db_executor": None,
+            "adb": None,
             "hook": None,
             "host": None,
             "irc_command": "SOMECMD",
@@ -422,6 +552,7 @@ class TestLineParsing:
             "content_raw": "this is a message",
             "db": None,
             "db_executor": None,
+            "adb": None,
             "hook": None,
             "host": "host",
             "irc_command": "PRIVMSG",
@@ -692,3 +823,127 @@ class TestSend:
             ("cloudbot", 10, "Line was: PRIVMSG #foo bar"),
             ("cloudbot", 10, "[testconn|out] >> b'PRIVMSG #foo bar\\r\\n'"),
         ]
+
+    @staticmethod
+    def _setup_sieves(event_loop, *funcs):
+        conn = make_mock_conn(event_loop=event_loop)
+        proto = irc._IrcProtocol(conn)
+        proto.connection_made(MagicMock())
+        sieves = []
+        for func in funcs:
+            binder = ArgBinder(func)
+            sieves.append(
+                MagicMock(required_args=binder.arg_names, binder=binder)
+            )
+
+        async def launch(hook, event):
+            event.prepare_threaded()
+            return True, hook.binder(event)
+
+        proto.bot.plugin_manager.out_sieves = sieves
+        proto.bot.plugin_manager.internal_launch = launch
+        return proto
+
+    @pytest.mark.asyncio()
+    async def test_send_shared_parse(self, event_loop):
+        seen = []
+
+        def mark(parsed_line):
+            parsed_line.parameters[-1] = "[!!] " + parsed_line.parameters[-1]
+            return parsed_line
+
+        def check(parsed_line, line):
+            seen.append((parsed_line, line))
+            return line
+
+        def encode(line):
+            return (line + "\r\n").encode()
+
+        proto = self._setup_sieves(event_loop, mark, check, encode)
+        with patch("cloudbot.event.Message.parse", wraps=Message.parse) as m:
+            await proto.send("PRIVMSG #foo :bar")
+
+        assert m.call_count == 1
+        assert seen == [(seen[0][0], "PRIVMSG #foo :[!!] bar")]
+        assert isinstance(seen[0][0], Message)
+        await asyncio.sleep(0)
+        proto._transport.write.assert_called_once_with(
+            b"PRIVMSG #foo :[!!] bar\r\n"
+        )
+
+    @pytest.mark.asyncio()
+    async def test_send_reparse_on_change(self, event_loop):
+        def parse_first(parsed_line, line):
+            return line
+
+        def replace(line):
+            return line.upper()
+
+        def parse_again(parsed_line):
+            return parsed_line
+
+        proto = self._setup_sieves(
+            event_loop, parse_first, replace, parse_again
+        )
+        with patch("cloudbot.event.Message.parse", wraps=Message.parse) as m:
+            await proto.send("privmsg #foo :bar")
+
+        assert m.call_count == 2
+        await asyncio.sleep(0)
+        proto._transport.write.assert_called_once_with(b"PRIVMSG #FOO :BAR")
+
+    @pytest.mark.asyncio()
+    async def test_send_no_parse(self, event_loop):
+        def strip(line):
+            return line.strip()
+
+        proto = self._setup_sieves(event_loop, strip)
+        with patch("cloudbot.event.Message.parse") as m:
+            await proto.send(" PRIVMSG #foo :bar ")
+
+        m.assert_not_called()
+        await asyncio.sleep(0)
+        proto._transport.write.assert_called_once_with(b"PRIVMSG #foo :bar")
+
+    @pytest.mark.asyncio()
+    async def test_write_batch(self, event_loop):
+        proto = self._setup_sieves(event_loop)
+        transport = proto._transport
+        for i in range(3):
+            await proto.send(f"PRIVMSG #foo :{i}")
+
+        transport.write.assert_not_called()
+        assert proto.flushes == 0
+
+        await asyncio.sleep(0)
+
+        transport.writelines.assert_called_once_with(
+            [f"PRIVMSG #foo :{i}\r\n".encode() for i in range(3)]
+        )
+        assert proto.flushes == 1
+        assert proto.lines_written == 3
+
+    @pytest.mark.asyncio()
+    async def test_write_batch_max_bytes(self, event_loop):
+        proto = self._setup_sieves(event_loop)
+        proto.max_batch_bytes = 30
+        transport = proto._transport
+        await proto.send("PRIVMSG #foo :a")
+        await proto.send("PRIVMSG #foo :b")
+
+        # The second line fills the batch, so both are written at once
+        transport.writelines.assert_called_once_with(
+            [b"PRIVMSG #foo :a\r\n", b"PRIVMSG #foo :b\r\n"]
+        )
+
+        await proto.send("PRIVMSG #foo :c")
+        proto.close()
+        transport.write.assert_called_once_with(b"PRIVMSG #foo :c\r\n")
+        transport.close.assert_called_once_with()
+
+    @pytest.mark.asyncio()
+    async def test_write_batch_disabled(self, event_loop):
+        proto = self._setup_sieves(event_loop)
+        proto.max_batch_bytes = 0
+        await proto.send("PRIVMSG #foo :a")
+        proto._transport.write.assert_called_once_with(b"PRIVMSG #foo :a\r\n")
@@ -1,14 +1,21 @@
 from itertools import product
+from typing import Any, Dict
 from unittest.mock import MagicMock, call, patch
 
 import pytest
 from sqlalchemy import Column, String, Table
 
 from cloudbot import hook
-from cloudbot.bot import CloudBot, clean_name, get_cmd_regex
+from cloudbot.bot import CloudBot, clean_name, get_cmd_matcher, get_cmd_regex
 from cloudbot.event import Event, EventType
 from cloudbot.hook import Action, Priority
-from cloudbot.plugin_hooks import CommandHook, ConfigHook, EventHook, RawHook
+from cloudbot.plugin_hooks import (
+    CommandHook,
+    ConfigHook,
+    EventHook,
+    RawHook,
+    RegexHook,
+)
 from cloudbot.util import database
 from tests.util.async_mock import AsyncMock
 from tests.util.mock_config import MockConfig
@@ -93,6 +100,7 @@ async def test_start_plugin_reload(tmp_path):
     bot = MagicMock(
         old_db=None,
         do_migrate_db=False,
+        shard_link=None,
     )
 
     bot.plugin_manager.load_all = AsyncMock()
@@ -413,6 +421,91 @@ class TestProcessing:
             key=id,
         )
 
+    @pytest.mark.asyncio()
+    async def test_regex(self, mock_bot_factory, event_loop) -> None:
+        bot = mock_bot_factory(loop=event_loop)
+        conn = MockConn(nick="bot")
+        event = Event(
+            irc_command="PRIVMSG",
+            event_type=EventType.message,
+            channel="#foo",
+            nick="bar",
+            conn=conn,
+            content="some text about foo",
+        )
+
+        plugin = MagicMock()
+
+        run_hooks = []
+
+        @hook.regex("foo")
+        async def coro(hook):
+            run_hooks.append(hook)
+
+        @hook.regex("bar")
+        async def coro1(hook):  # pragma: no cover
+            run_hooks.append(hook)
+
+        @hook.regex(r"(?P<word>about)")
+        async def coro2(hook, match):
+            run_hooks.append(hook)
+            assert match.group("word") == "about"
+
+        @hook.regex("text", only_no_match=True)
+        async def coro3(hook):  # pragma: no cover
+            run_hooks.append(hook)
+
+        hooks = [
+            RegexHook(plugin, hook._get_hook(func, "regex"))
+            for func in (coro, coro1, coro2, coro3)
+        ]
+        for regex_hook in hooks:
+            for regex in regex_hook.regexes:
+                bot.plugin_manager.regex_hooks.append((regex, regex_hook))
+
+        await CloudBot.process(bot, event)
+        assert bot.plugin_manager.regex_prefilter.filtered_count == 4
+        assert sorted(run_hooks, key=id) == sorted(
+            [hooks[0], hooks[2]],
+            key=id,
+        )
+
+    @pytest.mark.asyncio()
+    async def test_regex_block(self, mock_bot_factory, event_loop) -> None:
+        bot = mock_bot_factory(loop=event_loop)
+        conn = MockConn(nick="bot")
+        event = Event(
+            irc_command="PRIVMSG",
+            event_type=EventType.message,
+            channel="#foo",
+            nick="bar",
+            conn=conn,
+            content="foo",
+        )
+
+        plugin = MagicMock()
+
+        run_hooks = []
+
+        @hook.regex("foo", action=Action.HALTTYPE)
+        async def coro(hook):
+            run_hooks.append(hook)
+
+        @hook.regex("foo")
+        async def coro1(hook):  # pragma: no cover
+            run_hooks.append(hook)
+
+        hooks = [
+            RegexHook(plugin, hook._get_hook(func, "regex"))
+            for func in (coro, coro1)
+        ]
+        for regex_hook in hooks:
+            for regex in regex_hook.regexes:
+                bot.plugin_manager.regex_hooks.append((regex, regex_hook))
+
+        await CloudBot.process(bot, event)
+        assert run_hooks == [hooks[0]]
+
 
 @pytest.mark.asyncio()
 async def test_reload_config(mock_bot_factory, event_loop):
@@ -471,6 +564,35 @@ def test_get_cmd_regex():
     )
 
 
+def test_cmd_matcher_cached():
+    conn = MockConn("Bot")
+    matcher = get_cmd_matcher(conn)
+    assert get_cmd_matcher(conn) is matcher
+    assert matcher.get_regex(False).match(".foo bar")
+    assert not matcher.get_regex(False).match("foo bar")
+    assert matcher.get_regex(True).match("foo bar")
+
+
+@pytest.mark.parametrize(
+    "nick,prefix,text",
+    [
+        ("Bot1", ".", "Bot1: foo bar"),
+        ("Bot", "!", "!foo bar"),
+    ],
+)
+def test_cmd_matcher_rebuild(nick, prefix, text):
+    conn = MockConn("Bot")
+    matcher = get_cmd_matcher(conn)
+    assert not matcher.get_regex(False).match(text)
+
+    conn.nick = nick
+    conn.config["command_prefix"] = prefix
+    new_matcher = get_cmd_matcher(conn)
+    assert new_matcher is not matcher
+    assert new_matcher.get_regex(False).match(text)
+    assert get_cmd_matcher(conn) is new_matcher
+
+
 def config_mock(config):
     def _make_config(bot):
         conf = MockConfig(bot)
@@ -546,3 +668,69 @@ def test_load_clients(event_loop, tmp_path, unset_bot):
             assert bot.data_dir == str(tmp_path / "data")
 
         bot.observer.stop()
+
+
+@pytest.mark.parametrize(
+    "index,names",
+    [
+        (0, ["a", "c", "d"]),
+        (1, ["b"]),
+    ],
+)
+def test_create_connections_shard(
+    event_loop, tmp_path, unset_bot, index, names
+):
+    extras: Dict[str, Dict[str, Any]] = {
+        "a": {},
+        "b": {},
+        "c": {},
+        "d": {"shard": 2},
+    }
+    with patch(
+        "cloudbot.bot.Config",
+        new=config_mock(
+            {
+                "connections": [
+                    {
+                        "type": "irc",
+                        "name": name,
+                        "nick": "TestBot",
+                        "channels": [],
+                        "connection": {"server": "irc.example.com"},
+                        **extra,
+                    }
+                    for name, extra in extras.items()
+                ]
+            }
+        ),
+    ):
+        bot = CloudBot(loop=event_loop, base_dir=tmp_path, shard=(index, 2))
+        assert sorted(bot.connections) == names
+        bot.observer.stop()
+
+
+@pytest.mark.parametrize(
+    "url,enabled",
+    [
+        (None, True),
+        ("oracle://h/db", False),
+    ],
+)
+def test_async_database(event_loop, tmp_path, unset_bot, url, enabled):
+    pytest.importorskip("aiosqlite")
+    with patch(
+        "cloudbot.bot.Config",
+        new=config_mock(
+            {
+                "connections": [],
+                "database": "sqlite:///" + str(tmp_path / "cloudbot.db"),
+                "async_database": {"enabled": True, "url": url},
+            }
+        ),
+    ):
+        bot = CloudBot(loop=event_loop, base_dir=tmp_path)
+        try:
+            assert (bot.async_db_engine is not None) is enabled
+        finally:
+            bot.observer.stop()
+            database.configure_async()
@@ -2,9 +2,13 @@ from unittest.mock import MagicMock, call, patch
 
 import pytest
 from irclib.parser import Message
+from sqlalchemy import Column, String, Table
 
 from cloudbot import hook
-from cloudbot.event import Event, IrcOutEvent
+from cloudbot.event import CommandEvent, Event, IrcOutEvent
+from cloudbot.util import database
+from cloudbot.util.session_pool import SessionPool
+from tests.util.async_mock import AsyncMock
 from tests.util.mock_module import MockModule
 
 
@@ -26,10 +30,82 @@ def test_event_copy():
     assert event.conn is new_event.conn
     assert event.hook is new_event.hook
     assert event.nick is new_event.nick
-    assert len(event) == 20
+    assert len(event) == 21
     assert len(new_event) == len(event)
 
 
+def test_event_copy_shares_data():
+    event = Event(bot=object(), nick="foo", content="bar")
+    new_event = Event(base_event=event, hook=object())
+    assert new_event._data is event._data
+
+    new_event.content = "baz"
+    assert new_event.content == "baz"
+    assert event.content == "bar"
+    assert new_event._data is not event._data
+
+    # Changing the original mustn't affect copies made earlier either
+    other = Event(base_event=event)
+    event.nick = "other"
+    assert other.nick == "foo"
+    assert new_event.nick == "foo"
+
+
+def test_event_mapping():
+    event = Event(nick="foo", channel="#bar")
+    assert list(event) == [
+        "db",
+        "db_executor",
+        "adb",
+        "bot",
+        "conn",
+        "hook",
+        "type",
+        "content",
+        "content_raw",
+        "target",
+        "chan",
+        "nick",
+        "user",
+        "host",
+        "mask",
+        "irc_raw",
+        "irc_tags",
+        "irc_prefix",
+        "irc_command",
+        "irc_paramlist",
+        "irc_ctcp_text",
+    ]
+    assert event["nick"] == "foo"
+    assert event["chan"] == "#bar"
+    with pytest.raises(KeyError):
+        _ = event["foo"]
+
+    # Arbitrary attributes are still allowed
+    event.extra = "baz"  # type: ignore[attr-defined]
+    assert event["extra"] == "baz"
+    assert len(event) == 22
+    assert list(event)[-1] == "extra"
+
+
+def test_subclass_mapping():
+    event = CommandEvent(
+        hook=MagicMock(doc="doc"),
+        text="text",
+        triggered_command="cmd",
+        cmd_prefix=".",
+        base_event=Event(nick="foo"),
+    )
+    assert len(event) == 25
+    assert {k: event[k] for k in list(event)[-4:]} == {
+        "text": "text",
+        "doc": "doc",
+        "triggered_command": "cmd",
+        "triggered_prefix": ".",
+    }
+    assert event.nick == "foo"
+
+
 def test_event_message_no_rarget():
     conn = MagicMock()
     event = Event(conn=conn)
@@ -233,3 +309,99 @@ async def test_irc_out_prepare_error():
         await event.prepare()
 
     assert event.parsed_line is None
+
+
+@pytest.mark.asyncio()
+async def test_db_worker_released(mock_bot_factory, mock_db):
+    bot = mock_bot_factory(db=mock_db)
+    _hook = MagicMock(required_args=["db"])
+    event = Event(hook=_hook, bot=bot)
+    await event.prepare()
+    assert event.db is not None
+    assert bot.db_executor_pool.in_use == 1
+
+    await event.close()
+    assert event.db is None
+    assert event.db_executor is None
+    assert bot.db_executor_pool.in_use == 0
+    assert bot.db_executor_pool.stats()["checkouts"] == 1
+
+
+@pytest.mark.asyncio()
+async def test_db_shared_worker(mock_bot_factory, mock_db):
+    bot = mock_bot_factory(db=mock_db)
+    bot.db_executor_pool = SessionPool(1)
+    _hook = MagicMock(required_args=["db"])
+    events = [Event(hook=_hook, bot=bot) for _ in range(3)]
+    try:
+        for event in events:
+            await event.prepare()
+
+        # Hooks on the shared worker each get their own session
+        assert events[1].db_executor is events[2].db_executor
+        assert events[1].db is not events[2].db
+        assert bot.db_executor_pool.shared_users == 2
+
+        for event in events:
+            await event.close()
+
+        assert bot.db_executor_pool.in_use == 0
+        assert bot.db_executor_pool.shared_users == 0
+    finally:
+        bot.db_executor_pool.shutdown()
+
+
+@pytest.mark.asyncio()
+async def test_adb(mock_bot_factory, mock_db):
+    pytest.importorskip("aiosqlite")
+    bot = mock_bot_factory(db=mock_db)
+    bot.async_db_engine = database.create_async_db_engine(
+        str(mock_db.engine.url)
+    )
+    database.configure_async(bot.async_db_engine)
+    table = Table("adb_test", database.metadata, Column("name", String))
+    try:
+        table.create(mock_db.engine)
+        _hook = MagicMock(required_args=["adb"])
+        event = Event(hook=_hook, bot=bot)
+        await event.prepare()
+        assert event.db is None
+        assert event.db_executor is None
+
+        await event.adb.execute(table.insert().values(name="foo"))
+        await event.adb.commit()
+        await event.close()
+        assert event.adb is None
+
+        assert mock_db.get_data(table) == [("foo",)]
+    finally:
+        database.metadata.remove(table)
+        database.configure_async()
+        await bot.async_db_engine.dispose()
+
+
+@pytest.mark.asyncio()
+async def test_adb_close_error(mock_bot_factory, mock_db):
+    bot = mock_bot_factory(db=mock_db)
+    bot.async_db_engine = MagicMock()
+    _hook = MagicMock(required_args=["db", "adb"])
+    event = Event(hook=_hook, bot=bot)
+    with patch("cloudbot.event.AsyncSession") as session:
+        session.return_value.close = AsyncMock(side_effect=ValueError())
+        await event.prepare()
+
+    with pytest.raises(ValueError):
+        await event.close()
+
+    assert event.adb is None
+    assert event.db is None
+    assert bot.db_executor_pool.in_use == 0
+
+
+@pytest.mark.asyncio()
+async def test_adb_disabled(mock_bot_factory):
+    bot = mock_bot_factory()
+    _hook = MagicMock(required_args=["adb"])
+    event = Event(hook=_hook, bot=bot)
+    with pytest.raises(ValueError):
+        await event.prepare()
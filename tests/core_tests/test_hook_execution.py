@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import threading
+import time
+
+import pytest
+
+from cloudbot import hook
+from cloudbot.event import CommandEvent, Event
+from cloudbot.util.inline_hooks import DEFAULT_INLINE_HOOK_TYPES
+from tests.util.mock_module import MockModule
+
+
+@pytest.fixture()
+def mock_bot(mock_bot_factory, event_loop, tmp_path):
+    tmp_base = tmp_path / "tmp"
+    tmp_base.mkdir(exist_ok=True)
+
+    yield mock_bot_factory(base_dir=tmp_base, loop=event_loop)
+
+
+@pytest.fixture()
+def mock_manager(mock_bot):
+    yield mock_bot.plugin_manager
+
+
+@pytest.mark.asyncio
+async def test_hook_completion_batch(
+    mock_manager, mock_bot, patch_import_module, patch_import_reload
+):
+    batches = []
+
+    @hook.irc_raw("PRIVMSG")
+    def raw_cb(content):
+        if content == "fail":
+            raise ValueError(content)
+
+        return content
+
+    @hook.hook_complete()
+    def complete_cb(records):
+        batches.append(list(records))
+
+    mod = MockModule()
+    mod.raw_cb = raw_cb  # type: ignore[attr-defined]
+    mod.complete_cb = complete_cb  # type: ignore[attr-defined]
+    patch_import_module.return_value = mod
+    plugin_file = mock_bot.base_dir / "plugins" / "test.py"
+
+    await mock_manager.load_plugin(plugin_file)
+
+    raw_hook = mock_manager.raw_triggers["PRIVMSG"][0]
+    for content in ("a", "fail", "b"):
+        await mock_manager.launch(
+            raw_hook, Event(bot=mock_bot, hook=raw_hook, content=content)
+        )
+
+    # Nothing is delivered until the batch is flushed
+    assert batches == []
+    assert len(mock_manager._completions) == 3
+
+    mock_manager.flush_completions()
+    await asyncio.sleep(0.01)
+
+    assert len(batches) == 1
+    records = batches[0]
+    assert [r.event.content for r in records] == ["a", "fail", "b"]
+    assert [r.ok for r in records] == [True, False, True]
+    assert [r.result for r in records] == ["a", None, "b"]
+    assert records[1].error[0] is ValueError
+    assert all(r.hook is raw_hook and r.duration >= 0 for r in records)
+
+    await mock_manager.unload_plugin(plugin_file)
+
+    assert mock_manager.completion_hooks == []
+    assert not mock_manager._completions.scheduled
+
+
+@pytest.mark.asyncio
+async def test_inline_hooks(
+    mock_manager, mock_bot, patch_import_module, patch_import_reload, caplog
+):
+    delay = 0.0
+
+    @hook.irc_raw("PRIVMSG")
+    def raw_cb():
+        time.sleep(delay)
+        return threading.current_thread()
+
+    @hook.irc_raw("NOTICE", inline=False)
+    def threaded_cb():
+        pass
+
+    @hook.irc_raw("PART", inline=True)
+    def inline_cb():
+        return threading.current_thread()
+
+    @hook.irc_raw("KICK")
+    def default_cb():
+        return threading.current_thread()
+
+    @hook.command("test")
+    def cmd_cb():
+        pass
+
+    @hook.irc_raw("JOIN")
+    def db_cb(db):
+        pass
+
+    mod = MockModule()
+    mod.raw_cb = raw_cb  # type: ignore[attr-defined]
+    mod.threaded_cb = threaded_cb  # type: ignore[attr-defined]
+    mod.inline_cb = inline_cb  # type: ignore[attr-defined]
+    mod.default_cb = default_cb  # type: ignore[attr-defined]
+    mod.cmd_cb = cmd_cb  # type: ignore[attr-defined]
+    mod.db_cb = db_cb  # type: ignore[attr-defined]
+    patch_import_module.return_value = mod
+    plugin_file = mock_bot.base_dir / "plugins" / "test.py"
+
+    await mock_manager.load_plugin(plugin_file)
+
+    raw_hook = mock_manager.raw_triggers["PRIVMSG"][0]
+    cmd_hook = mock_manager.commands["test"]
+    assert mock_manager.raw_triggers["NOTICE"][0].inline is False
+    assert mock_manager.raw_triggers["JOIN"][0].inline is False
+    assert raw_hook.inline is None
+
+    # Only hooks which ask to run inline do so by default
+    inline_hook = mock_manager.raw_triggers["PART"][0]
+    ok, thread = await mock_manager.internal_launch(
+        inline_hook, Event(bot=mock_bot, hook=inline_hook)
+    )
+    assert ok
+    assert thread is threading.current_thread()
+
+    default_hook = mock_manager.raw_triggers["KICK"][0]
+    ok, thread = await mock_manager.internal_launch(
+        default_hook, Event(bot=mock_bot, hook=default_hook)
+    )
+    assert ok
+    assert thread is not threading.current_thread()
+    await asyncio.sleep(0)
+    assert default_hook.inline is False
+
+    mock_manager.inline_timer.hook_types = frozenset(DEFAULT_INLINE_HOOK_TYPES)
+    mock_manager.inline_timer.max_time = 1
+    for _ in range(mock_manager.inline_timer.calibration_runs):
+        ok, thread = await mock_manager.internal_launch(
+            raw_hook, Event(bot=mock_bot, hook=raw_hook)
+        )
+        assert ok
+        assert thread is not threading.current_thread()
+        await asyncio.sleep(0)
+
+    assert raw_hook.inline is True
+
+    # Command hooks aren't timed, so they stay in a thread
+    await mock_manager.internal_launch(
+        cmd_hook,
+        CommandEvent(
+            bot=mock_bot,
+            hook=cmd_hook,
+            cmd_prefix=".",
+            text="",
+            triggered_command="test",
+        ),
+    )
+    await asyncio.sleep(0)
+    assert cmd_hook.inline is False
+
+    ok, thread = await mock_manager.internal_launch(
+        raw_hook, Event(bot=mock_bot, hook=raw_hook)
+    )
+    assert thread is threading.current_thread()
+
+    # The watchdog moves hooks which block the loop back to a thread
+    delay = 0.02
+    mock_manager.inline_timer.watchdog = 0.01
+    with caplog.at_level(logging.WARNING, "cloudbot"):
+        ok, thread = await mock_manager.internal_launch(
+            raw_hook, Event(bot=mock_bot, hook=raw_hook)
+        )
+
+    assert ok
+    assert raw_hook.inline is False
+    assert "blocked the event loop" in caplog.text
+
+    ok, thread = await mock_manager.internal_launch(
+        raw_hook, Event(bot=mock_bot, hook=raw_hook)
+    )
+    assert thread is not threading.current_thread()
@@ -1,9 +1,11 @@
 import logging
+import sys
+from functools import partial
 from unittest.mock import patch
 
 import pytest
 
-from cloudbot.__main__ import async_main
+from cloudbot.__main__ import RESTART_EXIT_CODE, async_main, run_shards
 
 
 @pytest.mark.asyncio
@@ -17,3 +19,24 @@ async def test_main():
         assert logging._srcfile is None
         assert not logging.logThreads
         assert not logging.logProcesses
+
+
+def _exit_shard(path, index, count, conn, log_queue):
+    marker = path / f"shard{index}"
+    if index == 0 and not marker.exists():
+        # Ask to be restarted once
+        marker.touch()
+        sys.exit(RESTART_EXIT_CODE)
+
+    (path / f"ran{index}").write_text(str(count))
+    sys.exit(index)
+
+
+def test_run_shards(tmp_path):
+    exit_codes = run_shards(3, partial(_exit_shard, tmp_path))
+    assert exit_codes == {0: 0, 1: 1, 2: 2}
+    assert [(tmp_path / f"ran{i}").read_text() for i in range(3)] == [
+        "3",
+        "3",
+        "3",
+    ]
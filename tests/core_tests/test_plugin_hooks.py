@@ -21,6 +21,7 @@ from cloudbot.event import (
     CommandEvent,
     Event,
     EventType,
+    HookCompletionEvent,
     IrcOutEvent,
     PostHookEvent,
     RegexEvent,
@@ -206,6 +207,7 @@ def test_hook_args(hook, mock_bot):
         "on_stop",
         "event",
         "on_connect",
+        "config",
     ):
         event = Event(bot=bot)
     elif hook.type == "command":
@@ -220,6 +222,8 @@ def test_hook_args(hook, mock_bot):
         event = PostHookEvent(bot=bot)
     elif hook.type == "irc_out":
         event = IrcOutEvent(bot=bot)
+    elif hook.type == "hook_complete":
+        event = HookCompletionEvent(bot=bot, records=[])
     elif hook.type == "sieve":
         return
     else:  # pragma: no cover
@@ -230,6 +234,8 @@ def test_hook_args(hook, mock_bot):
             event, arg
         ), f"Undefined parameter '{arg}' for hook function"
 
+    assert len(hook.binder.bind(event)) == len(hook.binder.arg_names)
+
 
 def test_coroutine_hooks(hook):
     if inspect.isgeneratorfunction(hook.function):  # pragma: no cover
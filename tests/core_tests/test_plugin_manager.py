@@ -1,3 +1,4 @@
+import asyncio
 import itertools
 import logging
 import re
@@ -9,7 +10,7 @@ import sqlalchemy as sa
 from sqlalchemy import Column, String, Table, inspect
 
 from cloudbot import hook
-from cloudbot.event import CommandEvent, EventType
+from cloudbot.event import CommandEvent, Event, EventType
 from cloudbot.plugin import Plugin, PluginManager
 from cloudbot.util import database
 from tests.util.mock_module import MockModule
@@ -57,6 +58,27 @@ def test_get_plugin(mock_manager):
     assert mock_manager.find_plugin("test") is None
 
 
+@pytest.mark.asyncio
+async def test_plugin_track_task(event_loop):
+    plugin = Plugin("plugins/test.py", "test.py", "test", MockModule())
+    fut = event_loop.create_future()
+    task = asyncio.ensure_future(fut)
+    plugin.track_task(task)
+    plugin.track_task(asyncio.ensure_future(asyncio.sleep(0)))
+    assert plugin.in_flight == 2
+    assert plugin.peak_tasks == 2
+
+    await asyncio.sleep(0.01)
+
+    assert plugin.tasks == {task}
+    fut.set_result(None)
+    await task
+    await asyncio.sleep(0)
+
+    assert plugin.in_flight == 0
+    assert plugin.peak_tasks == 2
+
+
 def test_find_tables(mock_manager):
     file_path = mock_manager.bot.plugin_dir / "test.py"
     file_name = file_path.name
@@ -354,10 +376,13 @@ class TestPluginLoad:
             ),
         ]
         assert len(mock_manager.regex_hooks) == 1
+        prefilter = mock_manager.regex_prefilter
+        assert mock_manager.regex_prefilter is prefilter
         caplog.clear()
 
         await mock_manager.unload_plugin(str(plugin_file))
         assert len(mock_manager.regex_hooks) == 0
+        assert mock_manager.regex_prefilter is not prefilter
         assert caplog.record_tuples == [
             ("cloudbot", 20, "Unloaded all plugins from test")
         ]
@@ -400,6 +425,9 @@ async def test_load_all(
     await mock_manager.load_all(str(plugin_dir))
     assert "foo" in mock_manager.commands
     assert mock_manager.commands["foo"].function is cmd_func
+    assert [name for name, _ in mock_manager.commands.find_prefix("f")] == [
+        "foo"
+    ]
     assert started == 1
     assert stopped == 0
 
@@ -408,6 +436,7 @@ async def test_load_all(
     assert stopped == 1
 
     assert "foo" not in mock_manager.commands
+    assert list(mock_manager.commands.find_prefix("f")) == []
 
 
 @pytest.mark.asyncio
@@ -533,6 +562,86 @@ async def test_unload_raw_hooks(
     ]
 
 
+@pytest.mark.asyncio
+async def test_sieve_chain(
+    mock_manager, mock_bot, patch_import_module, patch_import_reload
+):
+    called = []
+
+    @hook.command("test")
+    def cmd_cb():
+        called.append("cmd")
+
+    @hook.irc_raw("PRIVMSG")
+    def raw_cb():
+        called.append("raw")
+
+    @hook.sieve(hook_types=["command"])
+    def cmd_sieve(_bot, _event, _hook):
+        called.append("cmd_sieve")
+        return _event
+
+    @hook.sieve(skip_plugins=["te*"])
+    def other_sieve(_bot, _event, _hook):
+        called.append("other_sieve")
+        return _event
+
+    @hook.sieve()
+    def all_sieve(_bot, _event, _hook):
+        called.append("all_sieve")
+        return _event
+
+    mod = MockModule()
+    mod.cmd_cb = cmd_cb  # type: ignore[attr-defined]
+    mod.raw_cb = raw_cb  # type: ignore[attr-defined]
+    mod.cmd_sieve = cmd_sieve  # type: ignore[attr-defined]
+    mod.other_sieve = other_sieve  # type: ignore[attr-defined]
+    mod.all_sieve = all_sieve  # type: ignore[attr-defined]
+    patch_import_module.return_value = mod
+    plugin_file = mock_bot.base_dir / "plugins" / "test.py"
+
+    await mock_manager.load_plugin(plugin_file)
+
+    cmd_hook = mock_manager.commands["test"]
+    raw_hook = mock_manager.raw_triggers["PRIVMSG"][0]
+    cmd_event = CommandEvent(
+        bot=mock_bot,
+        hook=cmd_hook,
+        cmd_prefix=".",
+        text="",
+        triggered_command="test",
+    )
+    assert await mock_manager.launch(cmd_hook, cmd_event)
+    assert await mock_manager.launch(
+        raw_hook, Event(bot=mock_bot, hook=raw_hook)
+    )
+    assert await mock_manager.launch(
+        raw_hook, Event(bot=mock_bot, hook=raw_hook)
+    )
+
+    assert sorted(called[:3]) == ["all_sieve", "cmd", "cmd_sieve"]
+    assert called[3:] == ["all_sieve", "raw", "all_sieve", "raw"]
+
+    chain = mock_manager.get_sieve_chain(raw_hook)
+    assert [s.function for s in chain.sieves] == [all_sieve]
+    assert chain.launches == 2
+
+    stats = {
+        sieve.function: (launches, skips)
+        for sieve, launches, skips, _ in mock_manager.sieve_stats()
+    }
+    assert stats == {
+        cmd_sieve: (1, 2),
+        other_sieve: (0, 3),
+        all_sieve: (3, 0),
+    }
+
+    await mock_manager.unload_plugin(plugin_file)
+
+    assert mock_manager.sieves == []
+    assert not mock_manager._sieve_chains
+
+
 @pytest.mark.asyncio
 async def test_unload_event_hooks(
     mock_manager,
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess  # nosec
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, call
+
+import pytest
+
+from cloudbot import hook
+from cloudbot.shards import Coordinator, ShardLink, conn_status
+from tests.util.fake_ircd import FakeIrcd
+from tests.util.mock_module import MockModule
+
+
+def _noop(*args):
+    raise NotImplementedError
+
+
+def _make_conn(name, connected=True, lag=0.5):
+    conn = MagicMock(config={"ping_settings": {"warn": 60}}, memory={})
+    conn.name = name
+    conn.connected = connected
+    conn.memory["lag"] = lag
+    return conn
+
+
+def test_conn_status():
+    conn = _make_conn("foo")
+    assert conn_status(conn) == ("foo", True, 0.5, 60)
+    conn.config = {}
+    conn.memory.clear()
+    assert conn_status(conn) == ("foo", True, 0, 120)
+
+
+def test_link_send():
+    ours, theirs = multiprocessing.Pipe()
+    link = ShardLink(0, 2, ours)
+    link.send("admin_log", "foo")
+    assert theirs.recv() == ("admin_log", "foo")
+    theirs.close()
+    ours.close()
+    # Sending after the coordinator is gone is ignored
+    link.send("admin_log", "bar")
+
+
+@pytest.mark.asyncio
+async def test_link_handle():
+    ours, theirs = multiprocessing.Pipe()
+    link = ShardLink(1, 2, ours)
+    link.bot = bot = MagicMock(loop=asyncio.get_running_loop())
+    bot.reload_config = AsyncMock()
+    up = _make_conn("up")
+    down = _make_conn("down", connected=False)
+    bot.connections = {"up": up, "down": down}
+
+    link.handle(("admin_log", "foo"))
+    assert up.admin_log.mock_calls == [call("foo", console=False)]
+    assert down.admin_log.mock_calls == []
+
+    link.handle(("status", 0, [("other", True, 0.1, 120)]))
+    assert link.remote_status == {0: [("other", True, 0.1, 120)]}
+
+    link.handle(("reload_config",))
+    await asyncio.sleep(0)
+    bot.reload_config.assert_awaited_once_with()
+    theirs.close()
+    ours.close()
+
+
+def _link_coordinator(count):
+    coordinator = Coordinator(count, _noop)
+    shards = {}
+    for index in range(count):
+        parent, child = multiprocessing.Pipe()
+        coordinator.links[index] = parent
+        shards[index] = child
+
+    return coordinator, shards
+
+
+def _received(conn):
+    messages = []
+    while conn.poll():
+        messages.append(conn.recv())
+
+    return messages
+
+
+def test_coordinator_relay():
+    coordinator, shards = _link_coordinator(3)
+    coordinator.relay(0, ("admin_log", "foo"))
+    status = [("conn", True, 0.1, 120)]
+    coordinator.relay(1, ("status", status))
+    coordinator.relay(2, ("reload_config",))
+
+    assert coordinator.status == {1: status}
+    assert _received(shards[0]) == [
+        ("status", 1, status),
+        ("reload_config",),
+    ]
+    assert _received(shards[1]) == [("admin_log", "foo"), ("reload_config",)]
+    assert _received(shards[2]) == [
+        ("admin_log", "foo"),
+        ("status", 1, status),
+    ]
+
+
+def test_coordinator_config_change(tmp_path):
+    config = tmp_path / "config.json"
+    config.write_text("{}")
+    os.utime(config, (0, 0))
+    coordinator, shards = _link_coordinator(2)
+    coordinator.config_path = config
+    coordinator._config_mtime = coordinator._get_config_mtime()
+
+    coordinator._check_config()
+    assert not shards[0].poll()
+
+    config.write_text('{"foo": 1}')
+    coordinator._check_config()
+    assert _received(shards[0]) == [("reload_config",)]
+    assert _received(shards[1]) == [("reload_config",)]
+
+
+@pytest.mark.asyncio
+async def test_single_shard_hooks(mock_bot_factory, patch_import_module):
+    ran = []
+
+    @hook.on_start(single_shard=True)
+    def primary_start():
+        ran.append("primary")
+
+    @hook.on_start()
+    def every_start():
+        ran.append("every")
+
+    @hook.periodic(60, single_shard=True)
+    def primary_periodic():
+        raise NotImplementedError
+
+    mod = MockModule()
+    mod.primary_start = primary_start  # type: ignore[attr-defined]
+    mod.every_start = every_start  # type: ignore[attr-defined]
+    mod.primary_periodic = primary_periodic  # type: ignore[attr-defined]
+    patch_import_module.return_value = mod
+
+    bot = mock_bot_factory()
+    bot.shard = (1, 2)
+    bot.is_primary_shard = False
+    await bot.plugin_manager.load_plugin(bot.plugin_dir / "test.py")
+
+    assert ran == ["every"]
+    plugin = bot.plugin_manager.get_plugin(bot.plugin_dir / "test.py")
+    assert not plugin.tasks
+
+
+def _write_config(path: Path, port: int, count: int) -> None:
+    config = {
+        "shards": 2,
+        "database": "sqlite:///cloudbot.db",
+        "logging": {"console_log_info": False, "file_log": False},
+        "reloading": {"plugin_reloading": False, "config_reloading": True},
+        "connections": [
+            {
+                "name": f"conn{i}",
+                "type": "irc",
+                "nick": f"bot{i}",
+                "channels": [],
+                "connection": {"server": "127.0.0.1", "port": port},
+            }
+            for i in range(count)
+        ],
+    }
+    path.write_text(json.dumps(config))
+
+
+def test_sharded_bot(tmp_path):
+    ircd = FakeIrcd()
+    ircd.start()
+    try:
+        _write_config(tmp_path / "config.json", ircd.port, 4)
+        root = Path(__file__).resolve().parents[2]
+        plugin_dir = tmp_path / "plugins" / "core"
+        plugin_dir.mkdir(parents=True)
+        for name in ("__init__.py", "core_connect.py", "core_misc.py"):
+            shutil.copy(root / "plugins" / "core" / name, plugin_dir)
+
+        (tmp_path / "plugins" / "__init__.py").touch()
+        env = dict(os.environ, PYTHONPATH=str(root))
+        proc = subprocess.Popen(  # nosec
+            [sys.executable, "-m", "cloudbot"], cwd=tmp_path, env=env
+        )
+        try:
+            assert ircd.wait_for(lambda s: len(s.clients) == 4, timeout=60)
+            assert sorted(ircd.clients) == ["bot0", "bot1", "bot2", "bot3"]
+
+            ircd.ping_all(25)
+            assert ircd.wait_for(lambda s: s.pongs == 100, timeout=30)
+            proc.send_signal(signal.SIGTERM)
+            assert proc.wait(timeout=60) == 0
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+        for client in ircd.clients.values():
+            assert client.lines[-1].startswith("QUIT")
+    finally:
+        ircd.stop()
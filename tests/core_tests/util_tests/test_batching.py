@@ -0,0 +1,58 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from cloudbot.util.batching import Batcher
+
+
+@pytest.mark.asyncio
+async def test_batch_size():
+    batches: List[List[int]] = []
+    batcher = Batcher(
+        asyncio.get_running_loop(),
+        batches.append,
+        batch_size=2,
+        flush_delay=60,
+    )
+    batcher.add(1)
+    assert len(batcher) == 1
+    assert batcher.scheduled
+    batcher.add(2)
+    assert batches == [[1, 2]]
+    assert not batcher
+    assert not batcher.scheduled
+
+
+@pytest.mark.asyncio
+async def test_flush_delay():
+    batches: List[List[int]] = []
+    batcher = Batcher(
+        asyncio.get_running_loop(),
+        batches.append,
+        batch_size=10,
+        flush_delay=0.01,
+    )
+    batcher.add(1)
+    batcher.add(2)
+    assert batches == []
+    await asyncio.sleep(0.05)
+    assert batches == [[1, 2]]
+    assert not batcher.scheduled
+
+
+@pytest.mark.asyncio
+async def test_clear():
+    batches: List[List[int]] = []
+    batcher = Batcher(
+        asyncio.get_running_loop(),
+        batches.append,
+        batch_size=10,
+        flush_delay=0.01,
+    )
+    batcher.add(1)
+    batcher.clear()
+    assert not batcher.scheduled
+    await asyncio.sleep(0.05)
+    batcher.flush()
+    assert batches == []
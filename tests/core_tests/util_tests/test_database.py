@@ -1,3 +1,5 @@
+import pytest
+
 from cloudbot.util import database
 
 
@@ -7,3 +9,20 @@ def test_database(mock_db):
     engine = mock_db.engine
     database.configure(engine)
     assert database.metadata.bind is engine
+
+
+@pytest.mark.parametrize(
+    "url,result",
+    [
+        ("sqlite:///cloudbot.db", "sqlite+aiosqlite:///cloudbot.db"),
+        ("postgresql://u:p@h/db", "postgresql+asyncpg://u:p@h/db"),
+        ("mysql+aiomysql://h/db", "mysql+aiomysql://h/db"),
+    ],
+)
+def test_async_url(url, result):
+    assert database.async_url(url) == result
+
+
+def test_async_url_unknown():
+    with pytest.raises(ValueError):
+        database.async_url("oracle://h/db")
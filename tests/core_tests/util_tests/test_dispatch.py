@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from unittest.mock import MagicMock
+
+import pytest
+
+from cloudbot.event import Event
+from cloudbot.util.dispatch import EventDispatcher
+
+
+def make_event(cmd, content=None):
+    return Event(irc_command=cmd, content=content)
+
+
+class Recorder:
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.started = []
+        self.finished = []
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, event):
+        self.started.append(event.content)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delays.get(event.content, 0))
+        finally:
+            self.running -= 1
+
+        self.finished.append(event.content)
+
+
+async def drain():
+    while True:
+        tasks = [
+            task
+            for task in asyncio.all_tasks()
+            if task is not asyncio.current_task()
+        ]
+        if not tasks:
+            return
+
+        await asyncio.gather(*tasks)
+
+
+@pytest.mark.asyncio()
+async def test_worker_limit():
+    process = Recorder()
+    dispatcher = EventDispatcher(process, max_workers=3)
+    for i in range(20):
+        dispatcher.put(make_event("PRIVMSG", i))
+
+    assert dispatcher.queue_depth == 20
+    assert dispatcher.peak_depth == 20
+    assert dispatcher.workers == 3
+
+    await drain()
+
+    assert sorted(process.finished) == list(range(20))
+    assert process.max_running == 3
+    assert dispatcher.queue_depth == 0
+    assert dispatcher.workers == 0
+    assert dispatcher.in_flight == 0
+    assert dispatcher.processed == 20
+    assert dispatcher.max_lag > 0
+
+
+@pytest.mark.asyncio()
+async def test_ordered_lane():
+    # Earlier events take longer, so they'd finish last if run concurrently
+    delays = {i: (10 - i) / 1000 for i in range(10)}
+    process = Recorder(delays)
+    dispatcher = EventDispatcher(process, max_workers=10)
+    for i in range(10):
+        dispatcher.put(make_event("JOIN", i))
+
+    await drain()
+
+    assert process.finished == list(range(10))
+    assert process.max_running == 1
+
+
+@pytest.mark.asyncio()
+async def test_ordered_commands_config():
+    process = Recorder()
+    dispatcher = EventDispatcher(process, ordered_commands=["privmsg"])
+    assert dispatcher.ordered_commands == {"PRIVMSG"}
+    dispatcher.put(make_event("PRIVMSG", 1))
+    dispatcher.put(make_event("JOIN", 2))
+    assert dispatcher.workers == 2
+
+    await drain()
+
+    assert sorted(process.finished) == [1, 2]
+
+
+@pytest.mark.asyncio()
+async def test_detach():
+    fut = asyncio.get_running_loop().create_future()
+
+    async def process(event):
+        if event.content == "wait":
+            await fut
+
+    dispatcher = EventDispatcher(
+        process, ordered_commands=["CAP"], detach_timeout=0.01
+    )
+    dispatcher.put(make_event("CAP", "wait"))
+    dispatcher.put(make_event("CAP", "next"))
+
+    # The first event waits on a later one, it must not block the lane
+    while dispatcher.processed < 1:
+        await asyncio.sleep(0.01)
+
+    assert dispatcher.detached == 1
+    assert dispatcher.in_flight == 1
+
+    fut.set_result(None)
+    await drain()
+
+    assert dispatcher.in_flight == 0
+    assert dispatcher.processed == 2
+
+
+@pytest.mark.asyncio()
+async def test_flow_control():
+    transport = MagicMock()
+    dispatcher = EventDispatcher(Recorder(), high_water=4)
+    dispatcher.attach(transport)
+    for i in range(4):
+        dispatcher.put(make_event("PRIVMSG", i))
+
+    assert dispatcher.paused
+    transport.pause_reading.assert_called_once_with()
+
+    await drain()
+
+    assert not dispatcher.paused
+    transport.resume_reading.assert_called_once_with()
+
+
+@pytest.mark.asyncio()
+async def test_clear():
+    dispatcher = EventDispatcher(Recorder(), max_workers=1)
+    for i in range(5):
+        dispatcher.put(make_event("PRIVMSG", i))
+
+    assert dispatcher.clear() == 5
+    assert dispatcher.queue_depth == 0
+
+    await drain()
+
+    assert dispatcher.processed == 0
+
+
+@pytest.mark.asyncio()
+async def test_error_logged(caplog):
+    async def process(event):
+        raise ValueError("boom")
+
+    dispatcher = EventDispatcher(process)
+    with caplog.at_level(logging.ERROR, "cloudbot"):
+        dispatcher.put(make_event("PRIVMSG"))
+        await drain()
+
+    assert dispatcher.processed == 1
+    assert [r.message for r in caplog.records] == [
+        "Error occurred while processing event"
+    ]
@@ -15,3 +15,52 @@ def test_call_with_args():
 
     with pytest.raises(func_utils.ParameterError):
         func_utils.call_with_args(func, {})
+
+
+class ArgData:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def keys(self):
+        return self.__dict__.keys()
+
+
+@pytest.mark.parametrize(
+    "func,expected",
+    [
+        (lambda: "no args", "no args"),
+        (lambda arg1: [arg1], [1]),
+        (lambda arg1, arg2=None, _arg3=None: [arg1, arg2, _arg3], [1, 2, None]),
+    ],
+)
+def test_arg_binder(func, expected):
+    binder = func_utils.ArgBinder(func)
+    assert binder.func is func
+    assert binder(ArgData(arg1=1, arg2=2, arg3=3)) == expected
+
+
+def test_arg_binder_missing():
+    binder = func_utils.ArgBinder(lambda arg1, arg2: None)
+    assert binder.arg_names == ("arg1", "arg2")
+    with pytest.raises(func_utils.ParameterError) as exc:
+        binder(ArgData(arg1=1, other=2))
+
+    assert exc.value.name == "arg2"
+    assert exc.value.valid_args == ["arg1", "other"]
+    assert str(exc.value) == (
+        "'arg2' is not a valid parameter, valid parameters are: "
+        "['arg1', 'other']"
+    )
+
+
+def test_arg_binder_property_error():
+    class Data(ArgData):
+        @property
+        def broken(self):
+            raise AttributeError("inner")
+
+    binder = func_utils.ArgBinder(lambda arg1, broken: None)
+    with pytest.raises(func_utils.ParameterError) as exc:
+        binder(Data(arg1=1))
+
+    assert exc.value.name == "broken"
@@ -0,0 +1,64 @@
+from unittest.mock import MagicMock
+
+from cloudbot.util.inline_hooks import (
+    DEFAULT_INLINE_CALIBRATION_RUNS,
+    DEFAULT_INLINE_HOOK_TYPES,
+    InlineHookTimer,
+)
+
+
+def _make_hook(hook_type="irc_raw"):
+    return MagicMock(type=hook_type, inline=None, inline_samples=0)
+
+
+def test_from_config():
+    timer = InlineHookTimer.from_config(MagicMock(), {})
+    assert timer.hook_types == frozenset()
+    assert timer.calibration_runs == DEFAULT_INLINE_CALIBRATION_RUNS
+
+    timer = InlineHookTimer.from_config(
+        MagicMock(), {"auto": True, "max_time": 1}
+    )
+    assert timer.hook_types == frozenset(DEFAULT_INLINE_HOOK_TYPES)
+    assert timer.max_time == 1
+
+    timer = InlineHookTimer.from_config(
+        MagicMock(), {"auto": True, "hook_types": ["event"]}
+    )
+    assert timer.hook_types == {"event"}
+
+
+def test_calibrate():
+    timer = InlineHookTimer(
+        MagicMock(), hook_types=["irc_raw"], calibration_runs=2, max_time=1
+    )
+    fast = _make_hook()
+    timer.calibrate(fast, 0.5)
+    assert fast.inline is None
+    timer.calibrate(fast, 0.5)
+    assert fast.inline is True
+
+    slow = _make_hook()
+    timer.calibrate(slow, 2)
+    assert slow.inline is False
+
+    command = _make_hook("command")
+    timer.calibrate(command, 0)
+    assert command.inline is False
+    assert command.inline_samples == 0
+
+
+def test_run_timed():
+    loop = MagicMock()
+    timer = InlineHookTimer(
+        loop, hook_types=["irc_raw"], calibration_runs=1, max_time=1
+    )
+    hook = _make_hook()
+    assert timer.run_timed(hook, lambda x: x + 1, 1) == 2
+    callback, timed_hook, duration = loop.call_soon_threadsafe.call_args.args
+    assert timed_hook is hook
+    assert duration >= 0
+
+    # The reported duration is handed to the timer's calibration
+    callback(timed_hook, duration)
+    assert hook.inline is True
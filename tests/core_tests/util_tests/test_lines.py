@@ -0,0 +1,100 @@
+import pytest
+
+from cloudbot.util.lines import LineBuffer, LineDecoder
+
+
+class TestLineDecoder:
+    def test_ascii(self):
+        decoder = LineDecoder()
+        assert decoder.decode(b":nick PRIVMSG #chan :hi") == (
+            ":nick PRIVMSG #chan :hi"
+        )
+        assert decoder.counts == {"ascii": 1}
+
+    def test_utf8(self):
+        decoder = LineDecoder()
+        assert decoder.decode("caf\u00e9".encode()) == "caf\u00e9"
+        assert decoder.counts == {"utf-8": 1}
+
+    def test_fallback(self):
+        decoder = LineDecoder()
+        assert decoder.decode("caf\u00e9".encode("cp1252")) == "caf\u00e9"
+        assert decoder.decode("\u3042".encode("shift_jis")) == "\u3042"
+        assert decoder.decode(b"\x81\x81\xff") == ""
+        assert decoder.counts == {"cp1252": 1, "shift_jis": 1, "lossy": 1}
+
+    def test_custom_codecs(self):
+        decoder = LineDecoder(["latin-1"])
+        assert decoder.decode(b"\x81") == "\x81"
+        assert decoder.counts == {"iso8859-1": 1}
+
+    def test_unknown_codec(self):
+        with pytest.raises(LookupError):
+            LineDecoder(["not-a-codec"])
+
+    def test_remember_sender(self):
+        decoder = LineDecoder(remember_senders=True)
+        # Not valid shift_jis, so this falls back to cp1252
+        assert decoder.decode(b":nick!user@host PRIVMSG #chan :\xe9") == (
+            ":nick!user@host PRIVMSG #chan :\u00e9"
+        )
+        assert decoder.sender_codec("nick") == "cp1252"
+        assert decoder.sender_codec("other") is None
+
+        # Valid in both codecs, the remembered codec is tried first
+        line = b" PRIVMSG #chan :\x82\xa0"
+        assert (
+            decoder.decode(b":nick" + line) == ":nick PRIVMSG #chan :\u201a\xa0"
+        )
+        assert (
+            decoder.decode(b":other" + line) == ":other PRIVMSG #chan :\u3042"
+        )
+        assert decoder.counts == {"cp1252": 2, "shift_jis": 1}
+
+    def test_sender_limit(self):
+        decoder = LineDecoder(remember_senders=True, max_senders=2)
+        for nick in ("a", "b", "c"):
+            decoder.decode(b":" + nick.encode() + b" PRIVMSG #chan :\xe9")
+
+        assert decoder.sender_codec("a") is None
+        assert decoder.sender_codec("b") == "cp1252"
+        assert decoder.sender_codec("c") == "cp1252"
+
+
+class TestLineBuffer:
+    def test_split_lines(self):
+        buffer = LineBuffer()
+        assert buffer.feed(b"a\r\nb\nc\r\n\r\nd") == [b"a", b"b", b"c", b""]
+        assert len(buffer) == 1
+        assert buffer.feed(b"e\r") == []
+        assert buffer.feed(b"\nf\n") == [b"de", b"f"]
+        assert len(buffer) == 0
+
+    def test_bytes_only_in_line(self):
+        buffer = LineBuffer()
+        assert buffer.feed(b"a\rb\r\n") == [b"a\rb"]
+
+    def test_long_line(self):
+        buffer = LineBuffer(max_line_length=5)
+        assert buffer.feed(b"12345\r\n123456\r\nabc\n") == [
+            b"12345",
+            b"abc",
+        ]
+        assert buffer.discarded == 1
+
+    def test_long_partial_line(self):
+        buffer = LineBuffer(max_line_length=5)
+        assert buffer.feed(b"abc\n123") == [b"abc"]
+        assert buffer.feed(b"456") == []
+        assert len(buffer) == 0
+        assert buffer.discarded == 1
+        assert buffer.feed(b"789") == []
+        assert buffer.discarded == 1
+        assert buffer.feed(b"0\r\ndef\r\n") == [b"def"]
+        assert buffer.discarded == 1
+
+    def test_clear(self):
+        buffer = LineBuffer(max_line_length=5)
+        buffer.feed(b"123456")
+        buffer.clear()
+        assert buffer.feed(b"abc\n") == [b"abc"]
@@ -1,4 +1,4 @@
-from cloudbot.util.mapping import KeyFoldDict
+from cloudbot.util.mapping import KeyFoldDict, PrefixIndexDict
 
 
 class TestKeyFoldDict:
@@ -73,3 +73,61 @@ class TestKeyFoldDict:
         assert data["SEA"] == 3
         assert data["SeA"] == 3
         assert data["Sea"] == 3
+
+
+class TestPrefixIndexDict:
+    @staticmethod
+    def test_find_prefix():
+        data: PrefixIndexDict[int] = PrefixIndexDict()
+        data["foob"] = 1
+        data["bar"] = 2
+        data["fooa"] = 3
+        data["fo"] = 4
+
+        assert list(data.find_prefix("foo")) == [("fooa", 3), ("foob", 1)]
+        assert list(data.find_prefix("f")) == [
+            ("fo", 4),
+            ("fooa", 3),
+            ("foob", 1),
+        ]
+        assert list(data.find_prefix("baz")) == []
+        assert list(data.find_prefix("")) == [
+            ("bar", 2),
+            ("fo", 4),
+            ("fooa", 3),
+            ("foob", 1),
+        ]
+
+    @staticmethod
+    def test_replace_value():
+        data: PrefixIndexDict[int] = PrefixIndexDict(foo=1)
+        data["foo"] = 2
+
+        assert list(data.find_prefix("foo")) == [("foo", 2)]
+
+    @staticmethod
+    def test_remove():
+        data: PrefixIndexDict[int] = PrefixIndexDict(
+            foo=1, foobar=2, bar=3, baz=4
+        )
+        del data["foo"]
+        assert data.pop("bar") == 3
+        assert data.pop("bar", None) is None
+
+        assert list(data.find_prefix("foo")) == [("foobar", 2)]
+        assert list(data.find_prefix("ba")) == [("baz", 4)]
+
+        key, _ = data.popitem()
+        assert list(data.find_prefix(key)) == []
+
+        data.clear()
+        assert list(data.find_prefix("")) == []
+
+    @staticmethod
+    def test_setdefault():
+        data: PrefixIndexDict[int] = PrefixIndexDict()
+
+        assert data.setdefault("foo", 1) == 1
+        assert data.setdefault("foo", 2) == 1
+
+        assert list(data.find_prefix("f")) == [("foo", 1)]
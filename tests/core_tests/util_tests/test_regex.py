@@ -0,0 +1,77 @@
+import re
+
+import pytest
+
+from cloudbot.util.regex import RegexPrefilter, required_literal
+
+
+@pytest.mark.parametrize(
+    "pattern,literal",
+    [
+        (re.compile("foo"), "foo"),
+        (re.compile("FOO", re.IGNORECASE), "foo"),
+        (re.compile("(?i)FOO"), "foo"),
+        (re.compile(r"ab+cdef"), "cdef"),
+        (re.compile(r"a(bcd)?e"), "a"),
+        (re.compile(r"x(?:abc)y"), "xabcy"),
+        (re.compile(r"x(?i:abc)y"), "x"),
+        (re.compile(r"a b # comment", re.VERBOSE), "ab"),
+        (re.compile(r"[)|(]abc"), "abc"),
+        (re.compile(r"(?=foo)bar{0,2}"), "ba"),
+        (re.compile(r"(?#comment)xyz"), "xyz"),
+        # Repeats after a comment apply to the atom before it
+        (re.compile(r"xyza(?#comment)*b"), "xyz"),
+        (re.compile("xyza # comment\n *b", re.VERBOSE), "xyz"),
+        (re.compile(r"a(?#comment)*"), None),
+        (re.compile(r"(?P<name>ab)\.cd"), ".cd"),
+        (re.compile(r"foo|bar"), None),
+        (re.compile(r"\w+"), None),
+        (re.compile("ſ", re.IGNORECASE), None),
+        (re.compile(b"foo"), None),
+    ],
+)
+def test_required_literal(pattern, literal):
+    assert required_literal(pattern) == literal
+
+
+@pytest.mark.parametrize(
+    "pattern,text,matches",
+    [
+        (re.compile("foo"), "a foo b", True),
+        (re.compile("foo"), "a FOO b", False),
+        (re.compile("foo", re.IGNORECASE), "a FOO b", True),
+        (re.compile("(?i)foo"), "a FOO b", True),
+        (re.compile("s", re.IGNORECASE), "ſ", True),
+        (re.compile("^foo$", re.MULTILINE), "a\nfoo\nb", True),
+        (re.compile("^foo$"), "a\nfoo\nb", False),
+        (re.compile(r"(\w+)-\d"), "abc-1", True),
+        (re.compile(r"(\w+)-\d"), "abc 1", False),
+    ],
+)
+def test_iter_candidates(pattern, text, matches):
+    entries = [(pattern, 1)]
+    prefilter = RegexPrefilter([pattern])
+    candidates = list(prefilter.iter_candidates(entries, text))
+    assert bool(pattern.search(text)) is matches
+    if matches:
+        # The prefilter must never rule out a pattern which matches
+        assert candidates == entries
+
+
+def test_iter_candidates_order():
+    filtered = re.compile("foo")
+    unfiltered = re.compile(r"\w+")
+    entries = [(filtered, 1), (unfiltered, 2), (filtered, 3)]
+    prefilter = RegexPrefilter(regex for regex, _ in entries)
+
+    assert prefilter.filtered_count == 1
+    assert prefilter.is_filtered(filtered)
+    assert not prefilter.is_filtered(unfiltered)
+    assert list(prefilter.iter_candidates(entries, "baz")) == [(unfiltered, 2)]
+    assert list(prefilter.iter_candidates(entries, "foo")) == entries
+
+
+def test_empty():
+    prefilter = RegexPrefilter([])
+    assert prefilter.filtered_count == 0
+    assert list(prefilter.iter_candidates([], "foo")) == []
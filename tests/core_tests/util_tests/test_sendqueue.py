@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+
+from cloudbot.util.sendqueue import SendPriority, SendQueue
+
+
+class FakeTransport:
+    def __init__(self):
+        self.lines = []
+
+    def __call__(self, line, log):
+        self.lines.append(line)
+
+
+async def wait_sent(queue):
+    while queue.queue_depth:
+        await asyncio.sleep(0.001)
+
+
+def test_classify():
+    queue = SendQueue(FakeTransport(), admin_targets=["#Admin"])
+    assert queue.classify("PONG :server") == (SendPriority.PROTOCOL, "")
+    assert queue.classify("JOIN #foo") == (SendPriority.PROTOCOL, "")
+    assert queue.classify("PRIVMSG #foo :hi") == (SendPriority.USER, "#foo")
+    assert queue.classify("notice nick :hi") == (SendPriority.USER, "nick")
+    assert queue.classify("PRIVMSG #admin :x") == (SendPriority.ADMIN, "#admin")
+    assert queue.classify("@a=b PRIVMSG #foo :hi") == (
+        SendPriority.USER,
+        "#foo",
+    )
+
+
+@pytest.mark.asyncio()
+async def test_burst():
+    transport = FakeTransport()
+    queue = SendQueue(transport, burst=3, rate=100)
+    for i in range(5):
+        queue.put(f"PRIVMSG #foo :{i}")
+
+    # The burst is sent straight away, the rest waits for tokens
+    assert transport.lines == [f"PRIVMSG #foo :{i}" for i in range(3)]
+    assert queue.queue_depth == 2
+    assert queue.peak_depth == 2
+
+    await wait_sent(queue)
+
+    assert transport.lines == [f"PRIVMSG #foo :{i}" for i in range(5)]
+    assert queue.sent == 5
+    assert queue.max_wait > 0
+
+
+@pytest.mark.asyncio()
+async def test_priority_and_fairness():
+    transport = FakeTransport()
+    queue = SendQueue(transport, burst=1, rate=1000, admin_targets=["#log"])
+    queue.put("PRIVMSG #busy :first")
+    for i in range(3):
+        queue.put(f"PRIVMSG #busy :{i}")
+
+    queue.put("PRIVMSG #quiet :hello")
+    queue.put("PRIVMSG #log :error")
+    queue.put("MODE #busy +o nick")
+    assert queue.depths() == {
+        SendPriority.PROTOCOL: 1,
+        SendPriority.ADMIN: 1,
+        SendPriority.USER: 4,
+    }
+
+    await wait_sent(queue)
+
+    assert transport.lines == [
+        "PRIVMSG #busy :first",
+        "MODE #busy +o nick",
+        "PRIVMSG #log :error",
+        "PRIVMSG #busy :0",
+        "PRIVMSG #quiet :hello",
+        "PRIVMSG #busy :1",
+        "PRIVMSG #busy :2",
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_urgent():
+    transport = FakeTransport()
+    queue = SendQueue(transport, burst=1, rate=1)
+    queue.put("PRIVMSG #foo :first")
+    for i in range(3):
+        queue.put(f"JOIN #chan{i}")
+
+    # PONG and QUIT skip the queued lines and the empty bucket
+    queue.put("PONG :server")
+    queue.put(":me QUIT :bye")
+    assert transport.lines == [
+        "PRIVMSG #foo :first",
+        "PONG :server",
+        ":me QUIT :bye",
+    ]
+    assert queue.queue_depth == 3
+    assert queue.urgent == 2
+
+    assert queue.reset() == 3
+    assert queue.stats()["sent"] == 3
+
+
+@pytest.mark.asyncio()
+async def test_coalesce():
+    transport = FakeTransport()
+    queue = SendQueue(
+        transport, burst=1, rate=1000, coalesce=True, coalesce_length=12
+    )
+    queue.put("PRIVMSG #foo :first")
+    queue.put("PRIVMSG #foo :a")
+    queue.put("PRIVMSG #foo :b")
+    queue.put("PRIVMSG #foo :\1ACTION c\1")
+    queue.put("PRIVMSG #foo :too long to merge")
+    queue.put("NOTICE #foo :d")
+    queue.put("PRIVMSG #bar :e")
+
+    assert queue.coalesced == 1
+
+    await wait_sent(queue)
+
+    assert transport.lines == [
+        "PRIVMSG #foo :first",
+        "PRIVMSG #foo :a | b",
+        "PRIVMSG #bar :e",
+        "PRIVMSG #foo :\1ACTION c\1",
+        "PRIVMSG #foo :too long to merge",
+        "NOTICE #foo :d",
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_coalesce_tags():
+    transport = FakeTransport()
+    queue = SendQueue(transport, burst=1, rate=1000, coalesce=True)
+    queue.put("PRIVMSG #foo :first")
+    queue.put("@+draft/reply=1 PRIVMSG #foo :a")
+    queue.put("@+draft/reply=1 PRIVMSG #foo :b")
+    queue.put("@+draft/reply=2 PRIVMSG #foo :c")
+    queue.put("PRIVMSG #foo :d")
+    queue.put(":bot PRIVMSG #foo :e")
+
+    assert queue.coalesced == 1
+
+    await wait_sent(queue)
+
+    assert transport.lines == [
+        "PRIVMSG #foo :first",
+        "@+draft/reply=1 PRIVMSG #foo :a | b",
+        "@+draft/reply=2 PRIVMSG #foo :c",
+        "PRIVMSG #foo :d",
+        ":bot PRIVMSG #foo :e",
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_reset():
+    transport = FakeTransport()
+    queue = SendQueue(transport, burst=1, rate=1)
+    for i in range(4):
+        queue.put(f"PRIVMSG #foo :{i}")
+
+    assert queue.reset() == 3
+    assert queue.queue_depth == 0
+    assert queue.stats()["dropped"] == 3
+
+    queue.put("PRIVMSG #foo :new")
+    assert transport.lines == ["PRIVMSG #foo :0", "PRIVMSG #foo :new"]
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+import pytest
+
+from cloudbot.util.session_pool import SessionPool
+
+
+def test_reuse():
+    pool = SessionPool(2)
+    try:
+        executor = pool.acquire()
+        assert pool.in_use == 1
+        pool.release(executor)
+        # Releasing twice is a no-op
+        pool.release(executor)
+        assert pool.in_use == 0
+
+        again = pool.acquire()
+        assert again is executor
+        pool.release(again)
+
+        stats = pool.stats()
+        assert stats["workers"] == 1
+        assert stats["checkouts"] == 2
+        assert stats["saturated"] == 0
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio()
+async def test_thread_bound():
+    pool = SessionPool(2)
+    loop = asyncio.get_running_loop()
+    try:
+        executor = pool.acquire()
+        first = await loop.run_in_executor(executor, threading.get_ident)
+        second = await loop.run_in_executor(executor, threading.get_ident)
+        assert first == second
+        pool.release(executor)
+    finally:
+        pool.shutdown()
+
+
+def test_shared_overflow(caplog):
+    pool = SessionPool(1)
+    try:
+        held = pool.acquire()
+        shared = pool.acquire()
+        assert shared is not held
+        assert pool.acquire() is shared
+        assert pool.shared_users == 2
+        assert pool.saturated == 2
+        assert "All 1 database workers are in use" in caplog.text
+
+        pool.release(shared)
+        pool.release(shared)
+        assert pool.shared_users == 0
+        assert pool.in_use == 1
+
+        # Released workers are handed out before the shared one
+        pool.release(held)
+        assert pool.acquire() is held
+
+        stats = pool.stats()
+        assert stats["workers"] == 1
+        assert stats["peak_shared_users"] == 2
+        assert stats["checkouts"] == 4
+    finally:
+        pool.shutdown()
+
+
+def test_bad_size():
+    with pytest.raises(ValueError):
+        SessionPool(0)
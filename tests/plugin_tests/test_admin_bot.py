@@ -32,7 +32,7 @@ def test_parse_targets(text, chan, out):
 
 @pytest.mark.asyncio
 async def test_reload_config(event_loop):
-    bot = MagicMock()
+    bot = MagicMock(shard_link=None)
     future = event_loop.create_future()
     bot.reload_config.return_value = future
     future.set_result(True)
@@ -41,6 +41,20 @@ async def test_reload_config(event_loop):
     assert bot.mock_calls == [call.reload_config()]
 
 
+@pytest.mark.asyncio
+async def test_reload_config_shards(event_loop):
+    bot = MagicMock()
+    future = event_loop.create_future()
+    bot.reload_config.return_value = future
+    future.set_result(True)
+    res = await admin_bot.rehash_config(bot)
+    assert res == "Config reloaded."
+    assert bot.mock_calls == [
+        call.reload_config(),
+        call.shard_link.send("reload_config"),
+    ]
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize(
     "input_text,chan,key",
@@ -0,0 +1,76 @@
+from unittest.mock import MagicMock
+
+from cloudbot.util.dispatch import EventDispatcher
+from cloudbot.util.lines import LineDecoder
+from cloudbot.util.sendqueue import SendQueue
+from plugins.core import check_conn
+
+
+def test_event_queue():
+    conn = MagicMock()
+    conn.name = "foo"
+    conn.dispatcher = dispatcher = EventDispatcher(MagicMock())
+    dispatcher.peak_depth = 10
+    dispatcher.max_lag = 0.5
+    dispatcher.detached = 1
+    dispatcher.paused = True
+    bot = MagicMock(connections={"foo": conn, "bar": MagicMock(spec=[])})
+
+    assert check_conn.event_queue(bot) == (
+        "foo: 0 queued (peak 10), 0 in progress, lag 0.0 ms (max 500.0 ms), "
+        "1 detached, reading paused"
+    )
+
+
+def test_send_queue():
+    conn = MagicMock()
+    conn.name = "foo"
+    conn.send_queue = queue = SendQueue(MagicMock(), burst=1)
+    queue.put("PRIVMSG #foo :a")
+    queue.put("JOIN #foo")
+    queue.max_wait = 0.25
+    bot = MagicMock(connections={"foo": conn, "bar": MagicMock(spec=[])})
+
+    assert check_conn.send_queue(bot) == (
+        "foo: 1 queued (protocol 1, admin 0, user 0, peak 1), 1 sent, "
+        "0 coalesced, wait 0.0 ms (max 250.0 ms)"
+    )
+    queue.clear()
+
+
+def test_codec_stats():
+    conn = MagicMock()
+    conn.name = "foo"
+    conn.decoder = decoder = LineDecoder()
+    decoder.decode(b"hi")
+    decoder.decode(b"hello")
+    decoder.decode(b"\xe9")
+    idle = MagicMock()
+    idle.name = "bar"
+    idle.decoder = LineDecoder()
+    bot = MagicMock(connections={"foo": conn, "bar": idle})
+
+    assert check_conn.codec_stats(bot) == (
+        "foo: ascii: 2, cp1252: 1; bar: no lines"
+    )
+
+
+def test_list_conns():
+    conn = MagicMock(config={}, memory={"lag": 0.01}, connected=True)
+    conn.name = "foo"
+    bot = MagicMock(connections={"foo": conn}, shard_link=None)
+
+    assert check_conn.list_conns(bot) == (
+        "Current connections: \x0309foo\x0f (lag: 10.0 ms)"
+    )
+
+    bot.shard_link = MagicMock(
+        remote_status={
+            2: [("baz", False, 0, 120)],
+            1: [("bar", True, 200, 120)],
+        }
+    )
+    assert check_conn.list_conns(bot) == (
+        "Current connections: \x0309foo\x0f (lag: 10.0 ms), "
+        "\x0308bar\x0f (lag: 200000 ms), \x0304baz\x0f"
+    )
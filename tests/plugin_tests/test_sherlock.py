@@ -0,0 +1,144 @@
+import datetime
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import text
+
+from plugins import sherlock
+from plugins.user_tracking import hosts_table, masks_table
+
+FIRST = datetime.datetime(2020, 1, 1)
+LATER = datetime.datetime(2020, 1, 2)
+
+
+def _row(column_name, nick, value, seen, nick_case=None):
+    return {
+        "nick": nick,
+        column_name: value,
+        "seen": seen,
+        "nick_case": nick_case or nick,
+        column_name + "_cf": value.lower(),
+    }
+
+
+@pytest.fixture()
+def tracking_db(mock_db):
+    for table in sherlock.VALUE_TABLES.values():
+        table.create(mock_db.engine)
+
+    mock_db.load_data(
+        masks_table,
+        [
+            _row("mask", "alice", "a@x", FIRST, "Alice"),
+            _row("mask", "bob", "A@X", LATER),
+            _row("mask", "bob", "b@y", FIRST),
+            _row("mask", "carol", "b@y", FIRST),
+        ],
+    )
+    mock_db.load_data(
+        hosts_table, [_row("host", "alice", "h1", FIRST, "Alice")]
+    )
+    return mock_db
+
+
+def _query(db, depth, **kwargs):
+    return sherlock.query(
+        db, [(("alice", "Alice"), None)], depth=depth, **kwargs
+    )
+
+
+def test_query_depth(tracking_db):
+    db = tracking_db.session()
+    results = _query(db, 0)
+    assert results.nicks == []
+    assert results.masks == [("a@x", FIRST)]
+    assert results.hosts == [("h1", FIRST)]
+    assert results.truncated is None
+
+    results = _query(db, 1)
+    assert sorted(results.nicks) == [
+        (("alice", "Alice"), FIRST),
+        (("bob", "bob"), LATER),
+    ]
+
+    results = _query(db, 3)
+    assert sorted(results.nicks) == [
+        (("alice", "Alice"), FIRST),
+        (("bob", "bob"), LATER),
+        (("carol", "carol"), FIRST),
+    ]
+    assert sorted(results.masks) == [
+        ("A@X", LATER),
+        ("a@x", FIRST),
+        ("b@y", FIRST),
+    ]
+
+
+def test_query_values(tracking_db):
+    db = tracking_db.session()
+    results = sherlock.query(db, masks="B@Y", depth=0)
+    assert sorted(results.nicks) == [
+        (("bob", "bob"), FIRST),
+        (("carol", "carol"), FIRST),
+    ]
+
+    results = sherlock.query(db, masks="B@Y", depth=0, last_seen=FIRST)
+    assert results.nicks == []
+
+
+def test_query_budget(tracking_db):
+    db = tracking_db.session()
+    results = _query(db, 3, max_rows=3)
+    assert results.truncated == "row limit of 3 reached"
+    assert len(results.nicks) == 1
+
+    results = _query(db, 3, max_time=0)
+    assert results.truncated == "time limit of 0 seconds reached"
+    assert results.masks == [("a@x", FIRST)]
+
+
+def test_expand_cloaks():
+    assert list(sherlock.expand_cloaks(["irc-abc.IP", "foo"])) == [
+        "Snoonet-abc.IP",
+        "irc-abc.IP",
+        "foo",
+    ]
+
+
+def test_query_and_format_truncated(tracking_db):
+    db = tracking_db.session()
+    lines = sherlock.query_and_format(db, "Alice", depth=3, max_rows=3)
+    assert lines[-1] == "Search stopped early, row limit of 3 reached."
+
+
+def test_get_query_budget():
+    conn = MagicMock(config={"plugins": {"sherlock": {}}})
+    assert sherlock.get_query_budget(conn) == (
+        sherlock.DEFAULT_MAX_ROWS,
+        sherlock.DEFAULT_MAX_TIME,
+    )
+    conn.config["plugins"]["sherlock"]["query_budget"] = {"max_rows": 5}
+    assert sherlock.get_query_budget(conn) == (5, sherlock.DEFAULT_MAX_TIME)
+
+
+def test_query_batches(tracking_db):
+    db = tracking_db.session()
+    expected = sorted(_query(db, 3).masks)
+    with patch.object(sherlock, "MAX_QUERY_PARAMS", 3):
+        assert sorted(_query(db, 3).masks) == expected
+
+
+@pytest.mark.parametrize("column_name", list(sherlock.VALUE_TABLES))
+def test_reverse_lookup_plan(tracking_db, column_name):
+    db = tracking_db.session()
+    stmt = sherlock._select_nicks(column_name, ["a@x", "b@y"], None)
+    sql = stmt.compile(
+        dialect=tracking_db.engine.dialect,
+        compile_kwargs={"literal_binds": True},
+    )
+    plan = [row.detail for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    table = sherlock.VALUE_TABLES[column_name]
+    assert plan == [
+        f"SEARCH {table.name} USING INDEX ix_{table.name}_{column_name}_cf "
+        f"({column_name}_cf=?)"
+    ]
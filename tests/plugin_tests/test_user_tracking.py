@@ -0,0 +1,245 @@
+import datetime
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import OperationalError
+
+from plugins import _user_tracking_buffer, user_tracking
+from plugins._user_tracking_buffer import UserDataBuffer
+from plugins.user_tracking import archive_table, masks_table
+
+
+def test_buffer_merge():
+    buffer = UserDataBuffer(max_size=3)
+    first = datetime.datetime(2020, 1, 1)
+    later = datetime.datetime(2020, 1, 2)
+    assert not buffer.add(masks_table, "mask", later, "Nick[a]", "a@b")
+    assert not buffer.add(masks_table, "mask", first, "nick{a}", "a@b")
+    assert len(buffer) == 1
+    assert buffer.merged == 1
+    assert not buffer.add(masks_table, "mask", first, "nick", "a@b")
+    assert buffer.add(masks_table, "mask", first, "nick", "c@d")
+
+
+def test_flush(mock_db):
+    masks_table.create(mock_db.engine)
+    db = mock_db.session()
+    first = datetime.datetime(2020, 1, 1)
+    later = datetime.datetime(2020, 1, 2)
+    mock_db.add_row(
+        masks_table,
+        nick="nick",
+        mask="a@b",
+        created=first,
+        seen=first,
+        reg=True,
+        nick_case="nick",
+    )
+
+    buffer = UserDataBuffer()
+    buffer.add(masks_table, "mask", later, "Nick", "a@b")
+    buffer.add(masks_table, "mask", later, "other", "c@d")
+    buffer.add(masks_table, "mask", first, "other", "c@d")
+    assert buffer.flush(db) == 2
+    assert buffer.flush(db) == 0
+    assert len(buffer) == 0
+
+    assert sorted(mock_db.get_data(masks_table)) == [
+        ("nick", "a@b", first, later, True, "Nick", "a@b"),
+        ("other", "c@d", first, later, False, "other", "c@d"),
+    ]
+
+
+def test_flush_fallback(mock_db):
+    masks_table.create(mock_db.engine)
+    db = mock_db.session()
+    now = datetime.datetime(2020, 1, 1)
+    buffer = UserDataBuffer()
+    buffer.add(masks_table, "mask", now, "nick", "a@b")
+    with patch.dict(_user_tracking_buffer.UPSERT_DIALECTS, clear=True):
+        assert buffer.flush(db) == 1
+        buffer.add(masks_table, "mask", now, "Nick", "a@b")
+        assert buffer.flush(db) == 1
+
+    assert mock_db.get_data(masks_table) == [
+        ("nick", "a@b", now, now, False, "Nick", "a@b"),
+    ]
+
+
+def test_flush_error(mock_db):
+    # The table is never created, so the flush fails
+    db = mock_db.session()
+    now = datetime.datetime(2020, 1, 1)
+    cache = user_tracking.SeenCache()
+    buffer = UserDataBuffer(seen_cache=cache)
+    buffer.add(masks_table, "mask", now, "nick", "a@b")
+    with pytest.raises(OperationalError):
+        buffer.flush(db)
+
+    assert len(buffer) == 1
+    assert buffer.failed == 1
+    # Only written rows are cached
+    assert len(cache) == 0
+
+    masks_table.create(mock_db.engine)
+    assert buffer.flush(db) == 1
+    assert len(mock_db.get_data(masks_table)) == 1
+    assert cache.check(masks_table, now, "nick", "a@b")
+
+
+@pytest.mark.asyncio()
+async def test_buffer_user_data():
+    event = MagicMock()
+
+    async def _async_call(func, *args):
+        return func(*args)
+
+    event.async_call = _async_call
+    db = MagicMock()
+    now = datetime.datetime(2020, 1, 1)
+    with patch.object(user_tracking, "user_data", UserDataBuffer(max_size=2)):
+        with patch.object(_user_tracking_buffer, "upsert_user_data") as upsert:
+            await user_tracking.buffer_user_data(
+                event, db, masks_table, "mask", now, "a", "a@b"
+            )
+            upsert.assert_not_called()
+            await user_tracking.buffer_user_data(
+                event, db, masks_table, "mask", now, "b", "a@b"
+            )
+            upsert.assert_called_once()
+            db.commit.assert_called_once_with()
+
+
+def test_migrate_folded_column(mock_db):
+    db = mock_db.session()
+    # The table as it was before the case-folded column was added
+    db.execute(
+        text(
+            "CREATE TABLE masks (nick TEXT, mask TEXT, created DATETIME, "
+            "seen DATETIME, reg BOOLEAN, nick_case TEXT, "
+            "PRIMARY KEY (nick, mask))"
+        )
+    )
+    db.execute(
+        text("INSERT INTO masks (nick, mask) VALUES (:nick, :mask)"),
+        [
+            {"nick": "a", "mask": "A@B"},
+            {"nick": "b", "mask": "a@b"},
+            {"nick": "c", "mask": "C@D"},
+        ],
+    )
+    db.commit()
+
+    with patch.object(user_tracking, "MIGRATION_CHUNK_SIZE", 2):
+        assert user_tracking.migrate_folded_column(db, masks_table, "mask") == 3
+
+    assert sorted(
+        db.execute(select(masks_table.c.nick, masks_table.c.mask_cf))
+    ) == [("a", "a@b"), ("b", "a@b"), ("c", "c@d")]
+    indexes = inspect(mock_db.engine).get_indexes("masks")
+    assert sorted(index["name"] for index in indexes) == [
+        "ix_masks_mask_cf",
+        "ix_masks_seen",
+    ]
+
+    assert user_tracking.migrate_folded_column(db, masks_table, "mask") == 0
+
+
+def test_compact_disabled():
+    bot = MagicMock(config={})
+    db = MagicMock()
+    with patch.object(user_tracking, "compact_table") as compact:
+        user_tracking.compact_user_data(bot, db)
+        compact.assert_not_called()
+
+        bot.config = {
+            "plugins": {"user_tracking": {"retention": {"enabled": True}}}
+        }
+        user_tracking.compact_user_data(bot, db)
+        assert compact.call_count == 3
+        assert compact.call_args.kwargs["chunk_size"] == 500
+
+
+def test_seen_cache():
+    cache = user_tracking.SeenCache(window=60, max_entries=2)
+    now = datetime.datetime(2020, 1, 1)
+    soon = now + datetime.timedelta(seconds=30)
+    later = now + datetime.timedelta(seconds=90)
+    assert not cache.check(masks_table, now, "Nick[a]", "a@b")
+    # Checking doesn't record the sighting, only a written row does
+    assert not cache.check(masks_table, soon, "Nick[a]", "a@b")
+    cache.record(masks_table, now, "Nick[a]", "a@b")
+    assert cache.check(masks_table, soon, "Nick[a]", "a@b")
+    # A different case still has to update nick_case
+    assert not cache.check(masks_table, soon, "nick{a}", "a@b")
+    assert not cache.check(masks_table, later, "Nick[a]", "a@b")
+
+    cache.record(masks_table, now, "nick", "c@d")
+    cache.record(archive_table, now, "nick", "c@d")
+    assert len(cache) == 2
+    assert cache.stats() == {
+        "entries": 2,
+        "max_entries": 2,
+        "hits": 1,
+        "misses": 4,
+        "evictions": 1,
+    }
+
+    # The oldest sighting was evicted
+    assert not cache.check(masks_table, soon, "Nick[a]", "a@b")
+
+    # An older write doesn't replace a newer one
+    cache.record(masks_table, later, "nick", "c@d")
+    cache.record(masks_table, now, "nick", "c@d")
+    assert cache.check(masks_table, later, "nick", "c@d")
+
+    cache.configure(60, 0)
+    assert len(cache) == 0
+    cache.record(masks_table, now, "nick", "a@b")
+    assert not cache.check(masks_table, now, "nick", "a@b")
+
+
+@pytest.mark.asyncio()
+async def test_buffer_user_data_cached(mock_db):
+    masks_table.create(mock_db.engine)
+    event = MagicMock()
+    now = datetime.datetime(2020, 1, 1)
+    cache = user_tracking.SeenCache()
+    buffer = UserDataBuffer(seen_cache=cache)
+    with patch.object(user_tracking, "user_data", buffer), patch.object(
+        user_tracking, "seen_cache", cache
+    ):
+        for _ in range(3):
+            await user_tracking.buffer_user_data(
+                event, MagicMock(), masks_table, "mask", now, "nick", "a@b"
+            )
+
+        # Nothing is skipped until the sighting is written
+        assert len(buffer) == 1
+        assert buffer.merged == 2
+        assert cache.hits == 0
+
+        buffer.flush(mock_db.session())
+        for _ in range(2):
+            await user_tracking.buffer_user_data(
+                event, MagicMock(), masks_table, "mask", now, "nick", "a@b"
+            )
+
+    assert len(buffer) == 0
+    assert cache.hits == 2
+
+
+def test_configure_seen_cache():
+    bot = MagicMock(config={})
+    cache = user_tracking.SeenCache(window=1, max_entries=1)
+    with patch.object(user_tracking, "seen_cache", cache):
+        user_tracking.configure_seen_cache(bot)
+        assert cache.max_entries == 50000
+        assert cache.window == datetime.timedelta(minutes=5)
+
+        bot.config = {
+            "plugins": {"user_tracking": {"write_cache": {"enabled": False}}}
+        }
+        user_tracking.configure_seen_cache(bot)
+        assert cache.max_entries == 0
@@ -0,0 +1,87 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from plugins._user_tracking_lookup import (
+    LookupBatcher,
+    get_lookup_limit,
+    parse_userhost_reply,
+)
+
+
+def test_parse_userhost_reply():
+    params = ["bot", "Nick[a]*=+user@host other=-ident@1.2.3.4 "]
+    assert parse_userhost_reply(params) == {
+        "nick{a}": "host",
+        "other": "1.2.3.4",
+    }
+    assert parse_userhost_reply(["bot", ""]) == {}
+
+
+@pytest.mark.parametrize(
+    "targmax,limit",
+    [
+        (None, 5),
+        ("PRIVMSG:4,USERHOST:12", 12),
+        ("USERHOST:100", 20),
+        ("USERHOST:", 20),
+        ("NOTICE:3", 5),
+    ],
+)
+def test_get_lookup_limit(targmax, limit):
+    conn = MagicMock(
+        memory={"server_info": {"isupport_tokens": {"TARGMAX": targmax}}}
+    )
+    assert get_lookup_limit(conn, "USERHOST") == limit
+
+
+@pytest.mark.asyncio()
+async def test_lookup_batcher(event_loop):
+    conn = MagicMock(loop=event_loop)
+    batcher = LookupBatcher(
+        conn, "USERHOST", batch_size=3, max_in_flight=2, burst=10, rate=10
+    )
+    nicks = [f"nick{i}" for i in range(7)]
+    futs = [batcher.lookup(nick) for nick in nicks]
+    assert batcher.lookup("NICK0") is futs[0]
+    conn.cmd.assert_not_called()
+    await asyncio.sleep(0)
+    assert [c.args for c in conn.cmd.call_args_list] == [
+        ("USERHOST", "nick0", "nick1", "nick2"),
+        ("USERHOST", "nick3", "nick4", "nick5"),
+    ]
+
+    # Replies are matched by the nicks in them, not the order they arrive in
+    batcher.on_reply({"nick4": "host4", "nick5": "host5"})
+    assert [fut.result() for fut in futs[3:6]] == [None, "host4", "host5"]
+    assert conn.cmd.call_args.args == ("USERHOST", "nick6")
+
+    # Replies which can't be matched to a command are ignored
+    batcher.on_reply({})
+    batcher.on_reply({"other": "host"})
+    assert not any(fut.done() for fut in futs[:3])
+
+    batcher.on_reply({"nick1": "host1"})
+    assert [fut.result() for fut in futs[:3]] == [None, "host1", None]
+    batcher.on_reply({"nick6": "host6"})
+    assert futs[6].result() == "host6"
+    assert batcher.pending == 0
+    assert batcher.sent == 3
+    assert batcher.resolved == 7
+
+
+@pytest.mark.asyncio()
+async def test_lookup_batcher_timeout(event_loop):
+    conn = MagicMock(loop=event_loop)
+    batcher = LookupBatcher(conn, "USERIP", max_in_flight=1, timeout=0.01)
+    fut = batcher.lookup("nick")
+    with pytest.raises(asyncio.TimeoutError):
+        await fut
+
+    assert batcher.timeouts == 1
+    assert batcher.pending == 0
+
+    # A late reply is ignored
+    batcher.on_reply({"nick": "1.2.3.4"})
+    assert batcher.resolved == 0
@@ -0,0 +1,135 @@
+import datetime
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import text
+
+from plugins._user_tracking_buffer import UserDataBuffer
+from plugins._user_tracking_retention import compact_table
+from plugins.user_tracking import archive_table, masks_table
+
+
+@pytest.mark.parametrize("archive", [True, False])
+def test_compact_table(mock_db, archive):
+    masks_table.create(mock_db.engine)
+    archive_table.create(mock_db.engine)
+    db = mock_db.session()
+    cutoff = datetime.datetime(2020, 1, 10)
+    buffer = UserDataBuffer()
+    for day in range(1, 6):
+        buffer.add(
+            masks_table,
+            "mask",
+            datetime.datetime(2020, 1, day * 4),
+            f"Nick{day}",
+            f"A@B{day}",
+        )
+
+    buffer.flush(db)
+
+    with patch.object(time, "sleep") as sleep:
+        count = compact_table(
+            db,
+            masks_table,
+            "mask",
+            cutoff,
+            chunk_size=1,
+            archive=archive_table if archive else None,
+            pause=0.5,
+        )
+
+    assert count == 2
+    assert sleep.call_count == 2
+    assert sorted(nick for nick, *_ in mock_db.get_data(masks_table)) == [
+        "nick3",
+        "nick4",
+        "nick5",
+    ]
+    archived = mock_db.get_data(archive_table)
+    if archive:
+        assert sorted(archived) == [
+            (
+                "mask",
+                f"nick{day}",
+                f"A@B{day}",
+                datetime.datetime(2020, 1, day * 4),
+                datetime.datetime(2020, 1, day * 4),
+                f"Nick{day}",
+                f"a@b{day}",
+            )
+            for day in (1, 2)
+        ]
+    else:
+        assert archived == []
+
+
+@pytest.mark.parametrize("archive", [True, False])
+def test_compact_table_null_keys(mock_db, archive):
+    # Tables created by older versions allowed NULL keys
+    with mock_db.engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE masks (nick TEXT, mask TEXT, created DATETIME, "
+                "seen DATETIME, reg BOOLEAN, nick_case TEXT, mask_cf TEXT, "
+                "PRIMARY KEY (nick, mask))"
+            )
+        )
+
+    archive_table.create(mock_db.engine)
+    old = datetime.datetime(2020, 1, 1)
+    mock_db.add_row(masks_table, nick=None, mask="a@b", seen=old)
+    mock_db.add_row(masks_table, nick="nick", mask=None, seen=old)
+    db = mock_db.session()
+
+    count = compact_table(
+        db,
+        masks_table,
+        "mask",
+        datetime.datetime(2020, 1, 10),
+        chunk_size=1,
+        archive=archive_table if archive else None,
+    )
+
+    assert count == 2
+    assert mock_db.get_data(masks_table) == []
+    assert mock_db.get_data(archive_table) == []
+
+
+def test_compact_table_stuck():
+    db = MagicMock()
+    row = MagicMock(nick="nick", value="a@b")
+    db.execute.return_value.fetchall.return_value = [row]
+
+    count = compact_table(
+        db,
+        masks_table,
+        "mask",
+        datetime.datetime(2020, 1, 10),
+        chunk_size=1,
+    )
+
+    assert count == 0
+    assert db.commit.call_count == 1
+
+
+def test_compact_table_no_rowcount():
+    # Drivers may not report a rowcount for executemany
+    db = MagicMock()
+    db.execute.return_value.rowcount = -1
+    db.execute.return_value.fetchall.side_effect = [
+        [MagicMock(nick="nick1", value="a@b")],
+        [MagicMock(nick="nick2", value="c@d")],
+        [],
+    ]
+
+    count = compact_table(
+        db,
+        masks_table,
+        "mask",
+        datetime.datetime(2020, 1, 10),
+        chunk_size=1,
+    )
+
+    assert count == 2
+    assert db.commit.call_count == 2
@@ -0,0 +1,125 @@
+"""
+A minimal IRC server for tests and benchmarks which run a real bot, serving
+from a thread so synchronous code can drive it
+"""
+
+import asyncio
+import threading
+from typing import Dict, List, Optional
+
+
+class _Client(asyncio.Protocol):
+    def __init__(self, server: "FakeIrcd") -> None:
+        self.server = server
+        self.transport: Optional[asyncio.Transport] = None
+        self.nick: Optional[str] = None
+        self.user: Optional[str] = None
+        self.registered = False
+        self.lines: List[str] = []
+        self.pongs = 0
+        self._buffer = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.server.on_lost(self)
+
+    def data_received(self, data):
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\r\n")
+        for line in lines:
+            self.on_line(line.decode())
+
+    def on_line(self, line: str) -> None:
+        self.lines.append(line)
+        command, _, params = line.partition(" ")
+        if command == "NICK":
+            self.nick = params
+        elif command == "USER":
+            self.user = params
+        elif command == "PONG":
+            self.pongs += 1
+            self.server.on_pong()
+
+        if not self.registered and self.nick and self.user:
+            # Like a real server, take NICK and USER in either order
+            self.registered = True
+            self.send(f":fake.ircd 001 {self.nick} :Welcome")
+            self.server.on_registered(self)
+
+    def send(self, *lines: str) -> None:
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.write(
+                b"".join(line.encode() + b"\r\n" for line in lines)
+            )
+
+
+class FakeIrcd:
+    """
+    Accepts any registration, records what each client sends and counts the
+    PONGs sent in reply to `ping_all()`
+    """
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.port = 0
+        self.clients: Dict[str, _Client] = {}
+        self.pongs = 0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self) -> None:
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            self.loop.create_server(lambda: _Client(self), "127.0.0.1", 0),
+            self.loop,
+        ).result()
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def stop(self) -> None:
+        async def _close():
+            if self._server is not None:
+                self._server.close()
+                await self._server.wait_closed()
+
+            for client in self.clients.values():
+                if client.transport is not None:
+                    client.transport.close()
+
+        asyncio.run_coroutine_threadsafe(_close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def on_registered(self, client: _Client) -> None:
+        with self._cond:
+            self.clients[client.nick] = client
+            self._cond.notify_all()
+
+    def on_lost(self, client: _Client) -> None:
+        with self._cond:
+            self._cond.notify_all()
+
+    def on_pong(self) -> None:
+        with self._cond:
+            self.pongs += 1
+            self._cond.notify_all()
+
+    def wait_for(self, predicate, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: predicate(self), timeout)
+
+    def ping_all(self, count: int) -> None:
+        """Send `count` PINGs to every registered client"""
+
+        def _send():
+            for client in self.clients.values():
+                client.send(*(f"PING :{i}" for i in range(count)))
+
+        self.loop.call_soon_threadsafe(_send)
@@ -1,14 +1,14 @@
 import logging
-from concurrent.futures import ThreadPoolExecutor
-from typing import Awaitable, Dict, Optional
+from typing import Awaitable, Dict, Optional, Tuple
 
 from watchdog.observers import Observer
 
 from cloudbot.bot import CloudBot
 from cloudbot.client import Client
 from cloudbot.plugin import PluginManager
+from cloudbot.shards import ShardLink
 from cloudbot.util.async_util import create_future
-from cloudbot.util.executor_pool import ExecutorPool
+from cloudbot.util.session_pool import SessionPool
 from tests.util.mock_config import MockConfig
 from tests.util.mock_db import MockDB
 
@@ -23,16 +23,13 @@ class MockBot:
         base_dir=None,
     ):
         if loop:
-            self.db_executor_pool = ExecutorPool(
-                50,
-                max_workers=1,
-                thread_name_prefix="cloudbot-db",
-                loop=loop,
-                executor_type=ThreadPoolExecutor,
+            self.db_executor_pool = SessionPool(
+                thread_name_prefix="cloudbot-db"
             )
         else:
             self.db_executor_pool = None
 
+        self.async_db_engine = None
         self.old_db = None
         self.do_db_migrate = False
         self.loop = loop
@@ -64,9 +61,15 @@ class MockBot:
         self.repo_link = "https://github.com/foobar/baz"
         self.user_agent = "User agent"
         self.connections: Dict[str, Client] = {}
+        self.shard: Optional[Tuple[int, int]] = None
+        self.shard_link: Optional[ShardLink] = None
+        self.is_primary_shard = True
 
     def close(self):
         self.observer.stop()
 
     def migrate_db(self) -> None:
         return CloudBot.migrate_db(self)  # type: ignore[arg-type]
+
+    async def process(self, event) -> None:
+        await CloudBot.process(self, event)  # type: ignore[arg-type]